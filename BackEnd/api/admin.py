@@ -1,3 +1,30 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AnalysisResult, ChatMessage, ChatSession, EmotionRollup
+
+
+@admin.register(AnalysisResult)
+class AnalysisResultAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user_id', 'media_type', 'diagnosis', 'confidence', 'total_ms', 'created_at')
+    list_filter = ('media_type', 'diagnosis')
+    search_fields = ('user_id', 'session_id', 'content_hash')
+
+
+@admin.register(ChatSession)
+class ChatSessionAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'user_id', 'message_count', 'updated_at')
+    search_fields = ('session_id', 'user_id')
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'session_id', 'role', 'created_at')
+    list_filter = ('role',)
+    search_fields = ('session_id', 'user_id')
+
+
+@admin.register(EmotionRollup)
+class EmotionRollupAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'granularity', 'bucket_start', 'count', 'min_confidence', 'max_confidence')
+    list_filter = ('granularity',)
+    search_fields = ('user_id',)
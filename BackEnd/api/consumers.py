@@ -0,0 +1,256 @@
+import asyncio
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer, AsyncWebsocketConsumer
+from django.conf import settings
+
+from api.utils.analyzers import get_shared_analyzer
+from api.utils.conversation import chat_reply, record_turn
+from api.utils.gemma_runtime import gemma
+from api.utils.intent_router import get_router
+from api.utils.persistence import record_chat_message
+from api.utils.renderers import encode_message
+from api.utils.streaming import EmotionSmoother, LatestFrameSlot, decode_frame
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _clean_id(value: str) -> str:
+    """Restrict client ids to characters valid in channel group names."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '', value)[:64]
+
+
+CHAT_UNAVAILABLE_REPLY = "I'm sorry, I'm having trouble generating a response right now. Please try again."
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Chat over ws/chat/. Every socket for the same ?session_id= joins one
+    group, so replies reach all of a user's open tabs. LLM replies are
+    streamed as `streaming_response` messages (the text so far, as the
+    frontend expects) while they are generated, then sent whole as
+    `chat_message` with the same id.
+    """
+
+    async def connect(self):
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        self.session_id = _clean_id(params.get('session_id', [''])[0]) or uuid.uuid4().hex
+        # Only an authenticated user (AuthMiddlewareStack) owns history rows
+        user = self.scope.get('user')
+        self.user_id = str(user.pk) if user is not None and user.is_authenticated else ''
+        self.group_name = f"chat.{self.session_id}"
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('type') != 'chat_message':
+            return
+        text = (content.get('content') or '').strip()
+        if not text:
+            return
+
+        await self._record_message('user', text)
+        reply_id = uuid.uuid4().hex
+        routed = get_router().route(text)
+        if routed['route'] == 'local':
+            reply = routed['reply']
+            await sync_to_async(record_turn)(self.session_id, 'user', text)
+            await sync_to_async(record_turn)(self.session_id, 'assistant', reply)
+        else:
+            await self.channel_layer.group_send(self.group_name, {'type': 'chat.typing', 'is_typing': True})
+            try:
+                reply = await sync_to_async(chat_reply, thread_sensitive=False)(
+                    self.session_id, text, lambda prompt: self._stream_reply(reply_id, prompt))
+            except Exception as e:
+                print(f"⚠️ Chat reply failed: {e}")
+                # Crisis messages still get the resources, with or without the LLM
+                reply = '' if routed.get('resources') else CHAT_UNAVAILABLE_REPLY
+            if routed.get('resources'):
+                reply = f"{reply}\n\n{routed['resources']}".strip()
+        await self._record_message('assistant', reply)
+        await self.channel_layer.group_send(self.group_name, {
+            'type': 'chat.reply',
+            'id': reply_id,
+            'content': reply,
+            'timestamp': _now(),
+        })
+
+    def _stream_reply(self, reply_id, prompt):
+        """Generate on a worker thread, pushing each piece to the session's sockets as it arrives."""
+        send = async_to_sync(self.channel_layer.group_send)
+        text = ''
+        for piece in gemma.stream(prompt, max_length=200, temperature=0.7):
+            text += piece
+            send(self.group_name, {'type': 'chat.partial', 'id': reply_id, 'content': text})
+        return text.strip()
+
+    async def _record_message(self, role, content):
+        # Losing a history row must not cost the user their reply
+        try:
+            await sync_to_async(record_chat_message)(role, content, user_id=self.user_id, session_id=self.session_id)
+        except Exception as e:
+            print(f"⚠️ Failed to record chat message: {e}")
+
+    async def chat_typing(self, event):
+        await self.send_json({'type': 'ai_typing', 'is_typing': event['is_typing']})
+
+    async def chat_partial(self, event):
+        await self.send_json({'type': 'streaming_response', 'message_id': event['id'], 'partial_content': event['content']})
+
+    async def advice_ready(self, event):
+        """Advice for an analysis uploaded with advice=async (api/utils/advice.py)."""
+        await self.send_json({'type': 'advice', 'ticket': event['ticket'], 'content': event['advice'], 'timestamp': _now()})
+
+    async def chat_reply(self, event):
+        await self.send_json({'type': 'ai_typing', 'is_typing': False})
+        await self.send_json({
+            'type': 'chat_message',
+            'id': event['id'],
+            'sender': 'ai',
+            'content': event['content'],
+            'timestamp': event['timestamp'],
+        })
+
+
+_NO_FACE = object()
+
+_stream_executor = ThreadPoolExecutor(
+    max_workers=settings.EMOTION_STREAM['WORKERS'], thread_name_prefix='emotion-stream'
+)
+
+
+def _query_float(params, name, default, low, high):
+    try:
+        value = float(params.get(name, [default])[0])
+    except (TypeError, ValueError):
+        value = default
+    return min(max(value, low), high)
+
+
+class EmotionStreamConsumer(AsyncWebsocketConsumer):
+    """
+    Webcam emotion streaming over ws/emotion/.
+
+    The client sends binary JPEG frames at any rate. Frames are analyzed at
+    most MAX_FPS times a second, always the newest one (older unanalyzed
+    frames are dropped), and an exponentially smoothed emotion vector is
+    pushed as `analysis_result` every ?interval_ms= milliseconds. While the
+    frames show no face, a `no_face` message is pushed at the same cadence
+    instead and the smoothed vector is left untouched.
+    ?format=msgpack switches results to MessagePack binary frames and
+    ?compact=1 to the compact payload (see api/utils/renderers.py).
+    """
+
+    async def connect(self):
+        config = settings.EMOTION_STREAM
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        self.push_interval = _query_float(params, 'interval_ms', config['PUSH_INTERVAL_MS'], 100, 10000) / 1000
+        self.min_frame_interval = 1.0 / config['MAX_FPS']
+        self.smoother = EmotionSmoother(_query_float(params, 'alpha', config['SMOOTHING_ALPHA'], 0.01, 1.0))
+        self.payload_format = 'msgpack' if params.get('format', [''])[0] == 'msgpack' else 'json'
+        self.compact = params.get('compact', [''])[0] in ('1', 'true')
+        self.slot = LatestFrameSlot()
+        self.frames_analyzed = 0
+        self.frames_no_face = 0
+        self.worker = None
+
+        await self.accept()
+        try:
+            self.analyzer = await sync_to_async(get_shared_analyzer, thread_sensitive=False)()
+        except Exception as e:
+            await self._send_message({'type': 'error', 'error': f'Analyzer unavailable: {e}'})
+            await self.close(code=1011)
+            return
+        self.worker = asyncio.ensure_future(self._analyze_loop())
+
+    async def disconnect(self, code):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if not bytes_data:
+            return
+        if len(bytes_data) > settings.EMOTION_STREAM['MAX_FRAME_BYTES']:
+            await self._send_message({'type': 'error', 'error': 'Frame too large'})
+            return
+        self.slot.put(bytes_data)
+
+    def _analyze(self, data: bytes):
+        frame = decode_frame(data)
+        if frame is None:
+            return None
+        emotions = self.analyzer.extract_emotions_frame(frame)
+        return _NO_FACE if emotions is None else emotions
+
+    async def _analyze_loop(self):
+        loop = asyncio.get_running_loop()
+        last_push = 0.0
+        while True:
+            data, received_at = await self.slot.get()
+            started = loop.time()
+            try:
+                last_push = await self._handle_frame(loop, data, received_at, last_push)
+            except Exception as e:
+                # A bad frame or analyzer failure must not end the stream
+                print(f"⚠️ Emotion stream frame failed: {e}")
+                await self._send_message({'type': 'error', 'error': f'Frame analysis failed: {e}'})
+            # Bound the analysis rate; frames arriving meanwhile overwrite each other
+            remaining = self.min_frame_interval - (loop.time() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    async def _handle_frame(self, loop, data, received_at, last_push):
+        """Analyze one frame and push when due; returns the new last push time."""
+        emotions = await loop.run_in_executor(_stream_executor, self._analyze, data)
+        if emotions is _NO_FACE:
+            self.frames_no_face += 1
+            if loop.time() - last_push >= self.push_interval:
+                last_push = loop.time()
+                await self._send_message({
+                    'type': 'no_face',
+                    'frames_received': self.slot.received,
+                    'frames_no_face': self.frames_no_face,
+                    'timestamp': _now(),
+                })
+        elif emotions is not None:
+            self.frames_analyzed += 1
+            smoothed = self.smoother.update(emotions)
+            if loop.time() - last_push >= self.push_interval:
+                last_push = loop.time()
+                risk = await loop.run_in_executor(_stream_executor, self.analyzer.predict_depression, smoothed)
+                await self._push(smoothed, emotions, risk, received_at)
+        return last_push
+
+    async def _send_message(self, message):
+        text_data, bytes_data = encode_message(message, self.payload_format, self.compact)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    async def _push(self, smoothed, raw, risk, received_at):
+        await self._send_message({
+            'type': 'analysis_result',
+            'analysis': {
+                'emotions': smoothed,
+                'frame_emotions': raw,
+                'dominant_emotion': max(smoothed, key=smoothed.get),
+                'diagnosis': str(risk.get('diagnosis', 'unknown')),
+                'confidence': float(risk.get('confidence', 0.0)),
+                'model_version': risk.get('model_version'),
+                'frames_received': self.slot.received,
+                'frames_analyzed': self.frames_analyzed,
+                'frames_dropped': self.slot.dropped,
+                'frames_no_face': self.frames_no_face,
+                'latency_ms': round((time.monotonic() - received_at) * 1000, 1),
+                'timestamp': _now(),
+            },
+        })
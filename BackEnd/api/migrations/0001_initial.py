@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(blank=True, default='', max_length=64)),
+                ('session_id', models.CharField(blank=True, default='', max_length=64)),
+                ('media_type', models.CharField(choices=[('image', 'Image'), ('video', 'Video')], max_length=8)),
+                ('file_path', models.CharField(blank=True, default='', max_length=255)),
+                ('content_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('emotion_vector', models.BinaryField(max_length=28)),
+                ('diagnosis', models.CharField(blank=True, default='', max_length=32)),
+                ('confidence', models.FloatField(default=0.0)),
+                ('inference_ms', models.FloatField(blank=True, null=True)),
+                ('advice_ms', models.FloatField(blank=True, null=True)),
+                ('total_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'created_at'], name='analysis_user_created_idx'), models.Index(fields=['session_id', 'id'], name='analysis_session_id_idx'), models.Index(fields=['content_hash'], name='analysis_content_hash_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(blank=True, default='', max_length=64)),
+                ('user_id', models.CharField(blank=True, default='', max_length=64)),
+                ('role', models.CharField(choices=[('user', 'User'), ('assistant', 'Assistant'), ('system', 'System')], max_length=9)),
+                ('content', models.TextField()),
+                ('latency_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session_id', 'id'], name='chat_session_id_idx'), models.Index(fields=['user_id', 'id'], name='chat_user_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=64, unique=True)),
+                ('user_id', models.CharField(blank=True, default='', max_length=64)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'updated_at'], name='session_user_updated_idx')],
+            },
+        ),
+    ]
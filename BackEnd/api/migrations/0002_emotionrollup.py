@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmotionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(blank=True, default='', max_length=64)),
+                ('granularity', models.CharField(choices=[('h', 'Hour'), ('d', 'Day')], max_length=1)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('emotion_sum', models.BinaryField(max_length=56)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('min_confidence', models.FloatField(blank=True, null=True)),
+                ('max_confidence', models.FloatField(blank=True, null=True)),
+                ('diagnosis_counts', models.JSONField(default=dict)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'granularity', 'bucket_start'), name='rollup_user_bucket_uniq')],
+            },
+        ),
+    ]
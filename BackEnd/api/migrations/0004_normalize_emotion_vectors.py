@@ -0,0 +1,35 @@
+import struct
+
+from django.db import migrations
+
+_VECTOR = struct.Struct('<7f')
+
+
+def normalize_vectors(apps, schema_editor):
+    """Rescale stored emotion vectors to proportions and rebuild the rollups from them."""
+    AnalysisResult = apps.get_model('api', 'AnalysisResult')
+    changed = []
+    for row in AnalysisResult.objects.only('id', 'emotion_vector').iterator(chunk_size=2000):
+        if not row.emotion_vector:
+            continue
+        values = [max(v, 0.0) for v in _VECTOR.unpack(bytes(row.emotion_vector))]
+        total = sum(values)
+        if total > 0 and abs(total - 1.0) > 1e-3:
+            row.emotion_vector = _VECTOR.pack(*(v / total for v in values))
+            changed.append(row)
+    AnalysisResult.objects.bulk_update(changed, ['emotion_vector'], batch_size=2000)
+    if changed:
+        # Imported here: rollups reads the current models, which match this schema
+        from api.utils.rollups import rebuild_rollups
+        rebuild_rollups()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_vectors, migrations.RunPython.noop),
+    ]
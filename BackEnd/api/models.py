@@ -1,3 +1,133 @@
+import struct
+
 from django.db import models
+from django.utils import timezone
+
+EMOTION_KEYS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+_EMOTION_STRUCT = struct.Struct(f'<{len(EMOTION_KEYS)}f')
+# Rollup sums accumulate many vectors, so they keep float64 precision
+_ROLLUP_STRUCT = struct.Struct(f'<{len(EMOTION_KEYS)}d')
+
+
+def pack_emotions(emotions) -> bytes:
+    """Pack an emotion dict into 28 bytes of little-endian float32."""
+    return _EMOTION_STRUCT.pack(*(float(emotions.get(k, 0.0)) for k in EMOTION_KEYS))
+
+
+def unpack_emotions(blob) -> dict:
+    if not blob:
+        return {}
+    return dict(zip(EMOTION_KEYS, _EMOTION_STRUCT.unpack(bytes(blob))))
+
+
+class AnalysisResult(models.Model):
+    """One completed image/video analysis."""
+
+    MEDIA_TYPES = [('image', 'Image'), ('video', 'Video')]
+
+    user_id = models.CharField(max_length=64, blank=True, default='')
+    session_id = models.CharField(max_length=64, blank=True, default='')
+    media_type = models.CharField(max_length=8, choices=MEDIA_TYPES)
+    file_path = models.CharField(max_length=255, blank=True, default='')
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    # Proportions summing to 1 (persistence.record_analysis normalizes every analyzer's scale)
+    emotion_vector = models.BinaryField(max_length=_EMOTION_STRUCT.size)
+    diagnosis = models.CharField(max_length=32, blank=True, default='')
+    confidence = models.FloatField(default=0.0)
+    inference_ms = models.FloatField(null=True, blank=True)
+    advice_ms = models.FloatField(null=True, blank=True)
+    total_ms = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'created_at'], name='analysis_user_created_idx'),
+            models.Index(fields=['session_id', 'id'], name='analysis_session_id_idx'),
+            models.Index(fields=['content_hash'], name='analysis_content_hash_idx'),
+        ]
+
+    @property
+    def emotions(self) -> dict:
+        return unpack_emotions(self.emotion_vector)
+
+    def __str__(self):
+        return f"{self.media_type} {self.diagnosis} ({self.confidence:.2f})"
+
+
+class ChatSession(models.Model):
+    """A conversation; one row per session id, bumped as messages arrive."""
+
+    session_id = models.CharField(max_length=64, unique=True)
+    user_id = models.CharField(max_length=64, blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
+    # Rolling summary of turns older than the context window (api/utils/conversation.py)
+    summary = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'updated_at'], name='session_user_updated_idx'),
+        ]
+
+    def __str__(self):
+        return self.session_id
+
+
+class ChatMessage(models.Model):
+    """A single chat turn. Rows are append-only and read by (session_id, id)."""
+
+    ROLES = [('user', 'User'), ('assistant', 'Assistant'), ('system', 'System')]
+
+    session_id = models.CharField(max_length=64, blank=True, default='')
+    user_id = models.CharField(max_length=64, blank=True, default='')
+    role = models.CharField(max_length=9, choices=ROLES)
+    content = models.TextField()
+    latency_ms = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session_id', 'id'], name='chat_session_id_idx'),
+            models.Index(fields=['user_id', 'id'], name='chat_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.role}: {self.content[:40]}"
+
+
+class EmotionRollup(models.Model):
+    """
+    Running aggregate of one user's analyses over an hour or a day.
+    Updated incrementally as analyses are written; never recomputed per request.
+    """
+
+    GRANULARITIES = [('h', 'Hour'), ('d', 'Day')]
+
+    user_id = models.CharField(max_length=64, blank=True, default='')
+    granularity = models.CharField(max_length=1, choices=GRANULARITIES)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    emotion_sum = models.BinaryField(max_length=_ROLLUP_STRUCT.size)
+    confidence_sum = models.FloatField(default=0.0)
+    min_confidence = models.FloatField(null=True, blank=True)
+    max_confidence = models.FloatField(null=True, blank=True)
+    diagnosis_counts = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_id', 'granularity', 'bucket_start'], name='rollup_user_bucket_uniq'
+            ),
+        ]
+
+    def get_emotion_sum(self) -> list:
+        if not self.emotion_sum:
+            return [0.0] * len(EMOTION_KEYS)
+        return list(_ROLLUP_STRUCT.unpack(bytes(self.emotion_sum)))
+
+    def set_emotion_sum(self, values) -> None:
+        self.emotion_sum = _ROLLUP_STRUCT.pack(*values)
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.user_id} {self.granularity} {self.bucket_start:%Y-%m-%d %H:00}"
@@ -1,3 +1,1472 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import msgpack
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from api.consumers import CHAT_UNAVAILABLE_REPLY, ChatConsumer, EmotionStreamConsumer
+
+from api.models import AnalysisResult, ChatMessage, ChatSession, EmotionRollup, pack_emotions, unpack_emotions
+from api.utils import metrics
+from api.utils.advice import FALLBACK_ADVICE, get_ticket, submit_advice
+from api.utils.analyzers import DeepFaceAnalyzer
+from api.utils.admission import AdmissionPool, AdmissionRejected
+from api.utils.assessment import fuse_scores, run_assessment
+from api.utils.cancellation import (
+    CLIENT_DISCONNECTED, DEADLINE_EXCEEDED, Cancelled, CancellationMiddleware,
+    CancellationToken, cancellation_scope, check_cancelled, current_token, run_in_context,
+)
+from api.utils.conversation import ConversationStore, _llm_summarize, estimate_tokens
+from api.utils.gemma_runtime import FallbackGenerator
+from api.utils.frame_filters import FaceGate, FrameDeduper, dhash, hamming
+from api.utils.intent_router import IntentRouter, get_router
+from api.utils.lite_emotion import LiteEmotionModel, TimelineStats
+from api.utils.local_llm import ContinuousBatcher, LocalGenerator
+from api.utils.memory import WorkerRecycler, stop_tracing
+from api.utils.multi_face import aggregate_faces, analyze_group_image
+from api.utils.remedies import RemedyIndex, load_library, personalize_remedies
+from api.utils.renderers import FastJSONRenderer, compact
+from api.utils.model_registry import ModelRegistry
+from api.utils.risk_model import RISK_FEATURES, RiskModel
+from api.utils.singleflight import SingleFlight
+from api.utils.persistence import record_analysis, record_chat_message
+from api.utils.channel_layers import LocalChannelLayer, UnixSocketChannelLayer
+from api.utils.rollups import bucket_start, rebuild_rollups
+from api.utils.streaming import EmotionSmoother
+
+
+@override_settings(PERSISTENCE_WRITE_BEHIND=False)
+class PersistenceTests(TestCase):
+    def test_emotion_vector_round_trip(self):
+        emotions = {'angry': 0.1, 'happy': 0.5, 'neutral': 0.4}
+        blob = pack_emotions(emotions)
+        self.assertEqual(len(blob), 28)
+        unpacked = unpack_emotions(blob)
+        self.assertAlmostEqual(unpacked['happy'], 0.5, places=6)
+        self.assertEqual(unpacked['sad'], 0.0)
+
+    def test_analyses_are_stored_as_proportions(self):
+        # DeepFace percentages and lite-model scores end up on one scale
+        record_analysis({'type': 'image', 'emotions': {'sad': 60.0, 'neutral': 40.0}})
+        record_analysis({'type': 'image', 'emotions': {'sad': 0.6, 'neutral': 0.4}})
+        record_analysis({'type': 'image', 'status': 'no_face', 'emotions': None})
+        first, second, no_face = AnalysisResult.objects.order_by('id')
+        self.assertAlmostEqual(first.emotions['sad'], 0.6, places=6)
+        self.assertAlmostEqual(second.emotions['sad'], 0.6, places=6)
+        self.assertEqual(sum(no_face.emotions.values()), 0.0)
+
+    def test_record_analysis(self):
+        record_analysis(
+            {'type': 'image', 'file_path': 'uploads/images/a.jpg',
+             'emotions': {'sad': 0.7, 'neutral': 0.3}, 'diagnosis': 'moderate_risk', 'confidence': 0.6},
+            user_id='u1', content_hash='ab' * 32, inference_ms=12.5,
+        )
+        row = AnalysisResult.objects.get()
+        self.assertEqual(row.user_id, 'u1')
+        self.assertEqual(row.diagnosis, 'moderate_risk')
+        self.assertAlmostEqual(row.emotions['sad'], 0.7, places=6)
+
+    def test_chat_messages_update_session(self):
+        record_chat_message('user', 'hello', user_id='u1', session_id='s1')
+        record_chat_message('assistant', 'hi there', user_id='u1', session_id='s1')
+        self.assertEqual(ChatMessage.objects.filter(session_id='s1').count(), 2)
+        session = ChatSession.objects.get(session_id='s1')
+        self.assertEqual(session.message_count, 2)
+        self.assertEqual(session.user_id, 'u1')
+
+
+@override_settings(PERSISTENCE_WRITE_BEHIND=False)
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session_id='s1', user_id=str(self.user.pk), role='user', content=f'message {i}')
+            for i in range(25)
+        ])
+        ChatMessage.objects.create(session_id='s2', user_id='', role='user', content='anonymous')
+
+    def test_keyset_pagination_walks_every_message_once(self):
+        self.client.force_login(self.user)
+        seen, cursor = [], None
+        while True:
+            params = {'session_id': 's1', 'limit': 10}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get('/api/chat/history', params).json()
+            seen.extend(m['id'] for m in data['messages'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/chat/history', {'session_id': 's2', 'cursor': '!!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_streams_jsonl_and_csv(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/chat/export')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertIn('"message 0"', lines[0])
+
+        response = self.client.get('/api/chat/export', {'export_format': 'csv'})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], 'id,session_id,role,content,latency_ms,created_at')
+        self.assertEqual(len(rows), 26)
+
+    def test_anonymous_callers_only_read_anonymous_sessions(self):
+        user_id = str(self.user.pk)
+        self.assertEqual(self.client.get('/api/chat/export', {'user_id': user_id}).status_code, 400)
+        self.assertEqual(self.client.get('/api/chat/history', HTTP_X_USER_ID=user_id).status_code, 400)
+        owned = self.client.get('/api/chat/history', {'session_id': 's1', 'user_id': user_id}).json()
+        self.assertEqual(owned['messages'], [])
+        anonymous = self.client.get('/api/chat/history', {'session_id': 's2'}).json()
+        self.assertEqual([m['content'] for m in anonymous['messages']], ['anonymous'])
+
+
+@override_settings(PERSISTENCE_WRITE_BEHIND=False)
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.user_id = str(self.user.pk)
+
+    def _record(self, sad, diagnosis, confidence):
+        record_analysis(
+            {'type': 'image', 'emotions': {'sad': sad, 'neutral': 1 - sad},
+             'diagnosis': diagnosis, 'confidence': confidence},
+            user_id=self.user_id,
+        )
+
+    def test_rollups_update_incrementally(self):
+        self._record(0.8, 'high_risk', 0.9)
+        self._record(0.2, 'low_risk', 0.5)
+        self._record(0.5, 'moderate_risk', 0.7)
+
+        daily = EmotionRollup.objects.get(user_id=self.user_id, granularity='d')
+        self.assertEqual(daily.count, 3)
+        self.assertEqual(EmotionRollup.objects.filter(user_id=self.user_id, granularity='h').count(), 1)
+        self.assertEqual(daily.min_confidence, 0.5)
+        self.assertAlmostEqual(daily.max_confidence, 0.9, places=6)
+
+        self.client.force_login(self.user)
+        data = self.client.get('/api/user/analytics', {'granularity': 'day'}).json()
+        self.assertEqual(len(data['buckets']), 1)
+        bucket = data['buckets'][0]
+        self.assertAlmostEqual(bucket['mean_emotions']['sad'], 0.5, places=5)
+        self.assertEqual(bucket['diagnosis_counts'], {'high_risk': 1, 'low_risk': 1, 'moderate_risk': 1})
+
+    def test_rebuild_matches_incremental(self):
+        for i in range(5):
+            self._record(0.1 * i, 'low_risk', 0.5)
+        before = EmotionRollup.objects.get(user_id=self.user_id, granularity='d').get_emotion_sum()
+        self.assertEqual(rebuild_rollups(self.user_id), 5)
+        after = EmotionRollup.objects.get(user_id=self.user_id, granularity='d').get_emotion_sum()
+        self.assertEqual([round(v, 6) for v in before], [round(v, 6) for v in after])
+
+    def test_bad_granularity_is_rejected(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/user/analytics', {'granularity': 'week'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_analytics_require_sign_in(self):
+        self._record(0.8, 'high_risk', 0.9)
+        response = self.client.get('/api/user/analytics', {'user_id': self.user_id})
+        self.assertEqual(response.status_code, 401)
+
+    def test_buckets_are_utc(self):
+        ist = timezone.get_fixed_timezone(330)
+        start = bucket_start(datetime(2026, 3, 1, 2, 45, tzinfo=ist), 'd')
+        self.assertEqual(start, datetime(2026, 2, 28, tzinfo=dt_timezone.utc))
+        self.assertEqual(bucket_start(datetime(2026, 3, 1, 2, 45, tzinfo=ist), 'h'),
+                         datetime(2026, 2, 28, 21, tzinfo=dt_timezone.utc))
+
+
+class LocalChannelLayerTests(SimpleTestCase):
+    def test_send_receive_and_groups(self):
+        layer = LocalChannelLayer(capacity=2)
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.send(channel, {'type': 'a', 'n': 1})
+            self.assertEqual((await layer.receive(channel))['n'], 1)
+
+            await layer.group_add('g', channel)
+            await layer.group_send('g', {'type': 'b'})
+            self.assertEqual((await layer.receive(channel))['type'], 'b')
+
+            await layer.group_discard('g', channel)
+            await layer.group_send('g', {'type': 'c'})
+            await layer.send(channel, {'type': 'd'})
+            self.assertEqual((await layer.receive(channel))['type'], 'd')
+
+            await layer.send(channel, {'type': 'e'})
+            await layer.send(channel, {'type': 'e'})
+            with self.assertRaises(ChannelFull):
+                await layer.send(channel, {'type': 'e'})
+
+        async_to_sync(scenario)()
+
+    def test_messages_are_isolated_copies(self):
+        layer = LocalChannelLayer()
+
+        async def scenario():
+            message = {'type': 'a', 'items': [1, 2]}
+            await layer.send('c1', message)
+            message['items'].append(3)
+            self.assertEqual((await layer.receive('c1'))['items'], [1, 2])
+
+        async_to_sync(scenario)()
+
+    def test_sends_from_worker_threads(self):
+        layer = LocalChannelLayer(capacity=1000)
+
+        async def scenario():
+            await layer.group_add('g', 'c1')
+            loop = asyncio.get_running_loop()
+            senders = [loop.run_in_executor(None, async_to_sync(layer.group_send), 'g', {'type': 'a', 'n': n})
+                       for n in range(200)]
+            received = [(await layer.receive('c1'))['n'] for _ in range(200)]
+            await asyncio.gather(*senders)
+            return received
+
+        self.assertEqual(sorted(async_to_sync(scenario)()), list(range(200)))
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    def test_send_from_another_thread_keeps_routing(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        path = os.path.join(root, 'hub.sock')
+        # Two layers on one socket stand in for two workers
+        worker, other = UnixSocketChannelLayer(path=path), UnixSocketChannelLayer(path=path)
+
+        async def scenario():
+            channel = await worker.new_channel()
+            await worker.group_add('g', channel)
+            # Like advice.py: async_to_sync on a plain thread runs a short-lived loop
+            thread = threading.Thread(
+                target=lambda: async_to_sync(worker.group_send)('g', {'type': 'a', 'n': 1}))
+            thread.start()
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+            first = await asyncio.wait_for(worker.receive(channel), 2)
+            await other.send(channel, {'type': 'a', 'n': 2})
+            second = await asyncio.wait_for(worker.receive(channel), 2)
+            await worker.close()
+            await other.close()
+            return first['n'], second['n']
+
+        self.assertEqual(async_to_sync(scenario)(), (1, 2))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'api.utils.channel_layers.LocalChannelLayer'}})
+class ChatConsumerTests(SimpleTestCase):
+    @mock.patch('api.consumers.chat_reply', return_value='That sounds stressful.')
+    @mock.patch('api.consumers.record_chat_message')
+    def test_chat_round_trip(self, _record, _reply):
+        async def scenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat?session_id=s1')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({'type': 'chat_message', 'content': 'my exams are next week and i cannot focus'})
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'ai_typing', 'is_typing': True})
+            self.assertEqual((await communicator.receive_json_from())['is_typing'], False)
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['type'], 'chat_message')
+            self.assertEqual(reply['sender'], 'ai')
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    @mock.patch('api.consumers.gemma')
+    @mock.patch('api.consumers.chat_reply', side_effect=lambda session_id, text, generate: generate('prompt'))
+    @mock.patch('api.consumers.record_chat_message')
+    def test_llm_reply_is_streamed(self, _record, _reply, gemma):
+        gemma.stream.return_value = iter(['That ', 'sounds ', 'hard.'])
+
+        async def scenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat?session_id=s3')
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'chat_message', 'content': 'my boss yelled at me today'})
+            messages = [await communicator.receive_json_from(timeout=2) for _ in range(6)]
+            await communicator.disconnect()
+            return messages
+
+        typing, *chunks, done_typing, reply = async_to_sync(scenario)()
+        self.assertTrue(typing['is_typing'])
+        self.assertEqual([c['type'] for c in chunks], ['streaming_response'] * 3)
+        self.assertEqual([c['partial_content'] for c in chunks], ['That ', 'That sounds ', 'That sounds hard.'])
+        self.assertFalse(done_typing['is_typing'])
+        self.assertEqual(reply['content'], 'That sounds hard.')
+        self.assertEqual({c['message_id'] for c in chunks}, {reply['id']})
+
+    @mock.patch('api.consumers.chat_reply', side_effect=RuntimeError('LLM down'))
+    @mock.patch('api.consumers.record_chat_message', side_effect=RuntimeError('database locked'))
+    def test_failed_reply_still_answers(self, _record, _reply):
+        async def scenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat?session_id=s2')
+            await communicator.connect()
+            replies = []
+            for text in ('I want to die', 'my boss yelled at me today'):
+                await communicator.send_json_to({'type': 'chat_message', 'content': text})
+                self.assertTrue((await communicator.receive_json_from())['is_typing'])
+                self.assertFalse((await communicator.receive_json_from())['is_typing'])
+                replies.append((await communicator.receive_json_from())['content'])
+            await communicator.disconnect()
+            return replies
+
+        crisis, open_ended = async_to_sync(scenario)()
+        self.assertIn('988', crisis)
+        self.assertEqual(open_ended, CHAT_UNAVAILABLE_REPLY)
+
+
+class _SlowAnalyzer:
+    def extract_emotions_frame(self, frame):
+        time.sleep(0.05)
+        return {'happy': 3.0, 'neutral': 1.0}
+
+    def predict_depression(self, emotions):
+        return {'diagnosis': 'low_risk', 'confidence': 0.8}
+
+
+class EmotionStreamTests(SimpleTestCase):
+    def test_smoother_is_exponential(self):
+        smoother = EmotionSmoother(alpha=0.5)
+        first = smoother.update({'happy': 1.0})
+        self.assertAlmostEqual(first['happy'], 1.0)
+        second = smoother.update({'sad': 1.0})
+        self.assertAlmostEqual(second['happy'], 0.5)
+        self.assertAlmostEqual(second['sad'], 0.5)
+
+    @mock.patch('api.consumers.get_shared_analyzer', return_value=_SlowAnalyzer())
+    def test_latest_frame_wins(self, _analyzer):
+        ok, jpeg = cv2.imencode('.jpg', np.full((64, 64, 3), 128, dtype=np.uint8))
+        frame = jpeg.tobytes()
+
+        async def scenario():
+            communicator = WebsocketCommunicator(EmotionStreamConsumer.as_asgi(), '/ws/emotion/?interval_ms=100')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            for _ in range(20):
+                await communicator.send_to(bytes_data=frame)
+            message = await communicator.receive_json_from(timeout=2)
+            await asyncio.sleep(0.3)
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(scenario)()
+        self.assertEqual(message['type'], 'analysis_result')
+        analysis = message['analysis']
+        self.assertAlmostEqual(analysis['emotions']['happy'], 0.75)
+        self.assertEqual(analysis['dominant_emotion'], 'happy')
+        self.assertGreater(analysis['frames_dropped'], 0)
+        self.assertLess(analysis['frames_analyzed'], analysis['frames_received'])
+
+    def test_risk_is_scored_off_the_event_loop(self):
+        analyzer = _SlowAnalyzer()
+        threads = []
+        analyzer.predict_depression = lambda emotions: threads.append(threading.get_ident()) or {}
+        ok, jpeg = cv2.imencode('.jpg', np.full((64, 64, 3), 128, dtype=np.uint8))
+
+        async def scenario():
+            communicator = WebsocketCommunicator(EmotionStreamConsumer.as_asgi(), '/ws/emotion/?interval_ms=100')
+            await communicator.connect()
+            await communicator.send_to(bytes_data=jpeg.tobytes())
+            result = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return result, threading.get_ident()
+
+        with mock.patch('api.consumers.get_shared_analyzer', return_value=analyzer):
+            result, loop_thread = async_to_sync(scenario)()
+        self.assertEqual(result['type'], 'analysis_result')
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+    def test_failed_frame_keeps_stream_running(self):
+        analyzer = _SlowAnalyzer()
+        analyzer.extract_emotions_frame = mock.Mock(
+            side_effect=[RuntimeError('model crashed'), {'happy': 3.0, 'neutral': 1.0}])
+        ok, jpeg = cv2.imencode('.jpg', np.full((64, 64, 3), 128, dtype=np.uint8))
+
+        async def scenario():
+            communicator = WebsocketCommunicator(EmotionStreamConsumer.as_asgi(), '/ws/emotion/?interval_ms=100')
+            await communicator.connect()
+            await communicator.send_to(bytes_data=jpeg.tobytes())
+            error = await communicator.receive_json_from(timeout=2)
+            await communicator.send_to(bytes_data=jpeg.tobytes())
+            result = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return error, result
+
+        with mock.patch('api.consumers.get_shared_analyzer', return_value=analyzer):
+            error, result = async_to_sync(scenario)()
+        self.assertEqual(error['type'], 'error')
+        self.assertIn('model crashed', error['error'])
+        self.assertEqual(result['type'], 'analysis_result')
+
+
+def _load_json_model(paths):
+    return json.loads(paths['model.json'].read_text())
+
+
+def _validate_json_model(model):
+    if 'weight' not in model:
+        raise ValueError('missing weight')
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.registry = ModelRegistry(
+            'toy', ('model.json',), loader=_load_json_model, validator=_validate_json_model,
+            root=self.root, poll_interval=0,
+        )
+
+    def publish(self, version, payload):
+        def write(directory):
+            (directory / 'model.json').write_text(json.dumps(payload))
+        return self.registry.publish(write, version=version)
+
+    def test_hot_swap_keeps_old_snapshot_usable(self):
+        self.assertIsNone(self.registry.get())
+        self.publish('v1', {'weight': 1})
+        snapshot = self.registry.get()
+        self.assertEqual(snapshot.version, 'v1')
+
+        self.publish('v2', {'weight': 2})
+        self.assertTrue(self.registry.refresh())
+        self.assertEqual(self.registry.get().model['weight'], 2)
+        # A request that took the v1 snapshot keeps a consistent model
+        self.assertEqual(snapshot.model['weight'], 1)
+        self.assertIn('model_info{model="toy",version="v2"} 1', metrics.render())
+        self.assertNotIn('version="v1"', metrics.render())
+
+    def test_invalid_version_is_rejected(self):
+        self.publish('v1', {'weight': 1})
+        self.registry.get()
+        self.publish('v2', {'bias': 0})
+        self.assertFalse(self.registry.refresh())
+        self.assertEqual(self.registry.version, 'v1')
+        self.assertGreaterEqual(metrics.get_value('model_reloads_total', model='toy', outcome='rejected'), 1)
+
+    def test_deleting_newest_version_rolls_back(self):
+        self.publish('v1', {'weight': 1})
+        self.publish('v2', {'weight': 2})
+        self.assertEqual(self.registry.get().version, 'v2')
+        shutil.rmtree(f'{self.root}/toy/v2')
+        self.assertTrue(self.registry.refresh())
+        self.assertEqual(self.registry.version, 'v1')
+
+    def test_missing_model_is_reported_once(self):
+        with mock.patch('builtins.print') as printed:
+            for _ in range(3):
+                self.assertIsNone(self.registry.get())
+        self.assertEqual(printed.call_count, 1)
+        self.assertIn('No toy model', printed.call_args[0][0])
+
+
+class RiskModelTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.model = RiskModel(
+            rng.normal(size=(len(RISK_FEATURES), 3)), rng.normal(size=3),
+            ['high_risk', 'low_risk', 'moderate_risk'],
+            rng.random(len(RISK_FEATURES)), rng.random(len(RISK_FEATURES)) + 0.5,
+        )
+
+    def test_batch_matches_single_and_is_scale_invariant(self):
+        rows = [dict(zip(['angry', 'happy', 'sad', 'neutral'], r))
+                for r in np.random.default_rng(1).random((5000, 4)).tolist()]
+        batch = self.model.assess_batch(rows)
+        self.assertEqual(len(batch), 5000)
+        for i in (0, 1234, 4999):
+            single = self.model.assess(rows[i])
+            self.assertEqual(single['diagnosis'], batch[i]['diagnosis'])
+            self.assertAlmostEqual(single['confidence'], batch[i]['confidence'], places=5)
+        # DeepFace reports 0-100, the lite model 0-1: same distribution, same risk
+        scaled = self.model.assess({k: v * 100 for k, v in rows[0].items()})
+        self.assertAlmostEqual(scaled['confidence'], batch[0]['confidence'], places=5)
+
+    def test_timeline_stats_and_variability(self):
+        frames = np.random.default_rng(2).random((40, 7))
+        timeline = TimelineStats()
+        timeline.add(frames[:25])
+        for frame in frames[25:]:
+            timeline.add(frame)
+        np.testing.assert_allclose(timeline.mean(), frames.mean(axis=0))
+        np.testing.assert_allclose(timeline.std(), frames.std(axis=0), atol=1e-9)
+        still = self.model.assess(timeline.to_dict())
+        varied = self.model.assess(timeline.to_dict(), timeline)
+        self.assertNotAlmostEqual(still['confidence'], varied['confidence'], places=6)
+
+    def test_round_trip(self):
+        path = tempfile.mktemp(suffix='.npz')
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        self.model.save(path)
+        loaded = RiskModel.load(path)
+        features = np.random.default_rng(3).random((10, len(RISK_FEATURES)))
+        np.testing.assert_allclose(loaded.predict_proba(features), self.model.predict_proba(features), rtol=1e-5)
+
+
+def _slow(result, delay=0.3):
+    def run(*args):
+        time.sleep(delay)
+        return result
+    return run
+
+
+class AssessmentTests(SimpleTestCase):
+    def test_fusion_weights_by_confidence(self):
+        fused = fuse_scores({'diagnosis': 'severe', 'confidence': 0.9},
+                            {'diagnosis': 'low_risk', 'confidence': 0.1})
+        self.assertEqual(fused['diagnosis'], 'high_risk')
+        self.assertEqual(fuse_scores({'error': 'Model not loaded'}, None)['diagnosis'], 'unknown')
+
+    @mock.patch('api.utils.assessment.gemma')
+    def test_branches_run_concurrently(self, gemma):
+        gemma.generate.return_value = 'Take a short walk.'
+        with mock.patch('api.utils.assessment.diagnose_text', _slow({'diagnosis': 'moderate', 'confidence': 0.8})), \
+                mock.patch('api.utils.assessment._analyze_media', _slow({'type': 'image', 'emotions': {'sad': 0.9},
+                                                                         'diagnosis': 'high_risk', 'confidence': 0.6})):
+            started = time.perf_counter()
+            result = run_assessment('I feel low', '/tmp/face.jpg', 'image')
+            elapsed = time.perf_counter() - started
+        self.assertLess(elapsed, 0.55)  # max of the branches, not the sum
+        self.assertEqual(result['diagnosis'], 'moderate_risk')
+        self.assertEqual(result['advice'], 'Take a short walk.')
+        gemma.generate.assert_called_once()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, flights, fn, n=8):
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(flights[i % len(flights)].do, 'same-key', fn) for i in range(n)]
+            return [f.result() for f in futures]
+
+    def test_concurrent_calls_share_one_execution(self):
+        calls = []
+
+        def work():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'diagnosis': 'low_risk'}
+
+        results = self.run_concurrently([SingleFlight('test', cross_process=False)], work)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_errors_reach_every_waiter_and_are_not_cached(self):
+        flight = SingleFlight('test', cross_process=False)
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError('model crashed')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(flight.do, 'k', fail)
+            started.wait()
+            second = pool.submit(flight.do, 'k', fail)
+            for future in (first, second):
+                with self.assertRaises(RuntimeError):
+                    future.result()
+        self.assertEqual(flight.do('k', lambda: 'ok'), 'ok')
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_cross_process_lock_file(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, True)
+        calls = []
+
+        def work():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        # Separate instances stand in for separate workers: each takes its own flock
+        with self.settings(SINGLEFLIGHT={'LOCK_DIR': lock_dir, 'RESULT_TTL': 5}):
+            flights = [SingleFlight('test', cross_process=True) for _ in range(4)]
+            results = self.run_concurrently(flights, work, n=4)
+        self.assertEqual(results, [42] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_followers_of_a_stuck_leader_keep_their_deadline(self):
+        flight = SingleFlight('test', cross_process=False)
+        release, started = threading.Event(), threading.Event()
+
+        def hang():
+            started.set()
+            release.wait(5)
+            return 'late'
+
+        def follow(timeout):
+            with cancellation_scope(timeout):
+                return flight.do('k', lambda: 'own')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, 'k', hang)
+            started.wait()
+            began = time.monotonic()
+            with self.assertRaises(Cancelled):
+                follow(0.1)
+            self.assertLess(time.monotonic() - began, 1)
+            with self.settings(SINGLEFLIGHT={'MAX_WAIT': 0.1}):
+                self.assertEqual(follow(None), 'own')
+            release.set()
+            self.assertEqual(leader.result(), 'late')
+
+    def test_cross_process_results_are_private_json(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, True)
+        os.chmod(lock_dir, 0o777)
+        with self.settings(SINGLEFLIGHT={'LOCK_DIR': lock_dir, 'RESULT_TTL': 5}):
+            result = SingleFlight('test', cross_process=True).do('k', lambda: {'happy': np.float32(0.5)})
+        self.assertEqual(result['happy'], 0.5)
+        self.assertEqual(os.stat(lock_dir).st_mode & 0o777, 0o700)
+        [shared] = [p for p in os.listdir(lock_dir) if p.endswith('.result')]
+        with open(os.path.join(lock_dir, shared)) as f:
+            self.assertEqual(json.load(f), {'happy': 0.5})
+
+
+class AdmissionTests(SimpleTestCase):
+    def make_pool(self, **video):
+        return AdmissionPool(capacity=2, reserved=1, classes={
+            'chat': {'priority': 0, 'max_concurrent': 2, 'max_queue': 4, 'max_wait_s': 1.0},
+            'video': {'priority': 2, 'max_concurrent': 2, 'max_queue': 1, 'max_wait_s': 0.1,
+                      'service_ms': 4000, **video},
+        })
+
+    def test_reserved_slot_keeps_chat_responsive(self):
+        pool = self.make_pool()
+        video = pool.acquire('video')
+        # The second slot is reserved for priority 0: video waits and times out
+        with self.assertRaises(AdmissionRejected) as ctx:
+            pool.acquire('video')
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertGreaterEqual(ctx.exception.retry_after, 2)
+        chat = pool.acquire('chat')
+        pool.release(chat, 50)
+        pool.release(video, 4000)
+
+    def test_full_queue_is_rejected_with_429(self):
+        pool = self.make_pool(max_wait_s=1.0)
+        held = pool.acquire('video')
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            queued = executor.submit(pool.acquire, 'video')
+            time.sleep(0.05)
+            with self.assertRaises(AdmissionRejected) as ctx:
+                pool.acquire('video')
+            self.assertEqual(ctx.exception.status, 429)
+            pool.release(held, 1000)
+            pool.release(queued.result(timeout=1), 1000)
+
+    @mock.patch('api.views.record_chat_message')
+    @mock.patch('api.views.chat_reply')
+    def test_crisis_message_gets_resources_when_chat_is_saturated(self, chat_reply, _record):
+        pool = AdmissionPool(capacity=1, reserved=0, classes={
+            'chat': {'priority': 0, 'max_concurrent': 1, 'max_queue': 0, 'max_wait_s': 0.0},
+        })
+        held = pool.acquire('chat')
+        self.addCleanup(pool.release, held, 10)
+        with mock.patch('api.utils.admission.get_pool', return_value=pool):
+            response = self.client.post('/api/chat/generate/', {'text': 'I want to die'})
+            open_ended = self.client.post('/api/chat/generate/', {'text': 'my boss yelled at me today'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['intent'], 'crisis')
+        self.assertEqual(data['reply'], data['resources'])
+        self.assertIn('988', data['reply'])
+        chat_reply.assert_not_called()
+        self.assertEqual(open_ended.status_code, 429)
+
+    def test_higher_priority_waiter_is_served_first(self):
+        pool = AdmissionPool(capacity=1, reserved=0, classes={
+            'chat': {'priority': 0, 'max_concurrent': 1, 'max_queue': 4, 'max_wait_s': 2.0},
+            'video': {'priority': 2, 'max_concurrent': 1, 'max_queue': 4, 'max_wait_s': 2.0},
+        })
+        held = pool.acquire('video')
+        order = []
+
+        def take(name):
+            cls = pool.acquire(name)
+            order.append(name)
+            time.sleep(0.05)
+            pool.release(cls, 50)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            video = executor.submit(take, 'video')
+            time.sleep(0.05)
+            chat = executor.submit(take, 'chat')
+            time.sleep(0.05)
+            pool.release(held, 100)
+            video.result(), chat.result()
+        self.assertEqual(order, ['chat', 'video'])
+
+
+class CancellationTests(SimpleTestCase):
+    def test_deadline_cancels_the_scope(self):
+        with cancellation_scope(0.01):
+            check_cancelled()
+            time.sleep(0.02)
+            with self.assertRaises(Cancelled) as ctx:
+                check_cancelled()
+        self.assertEqual(ctx.exception.reason, DEADLINE_EXCEEDED)
+        check_cancelled()  # outside the scope nothing is cancelled
+
+    def test_child_follows_parent_cancellation(self):
+        parent = CancellationToken()
+        child = parent.child(60)
+        self.assertFalse(child.cancelled)
+        parent.cancel()
+        self.assertEqual(child.reason, CLIENT_DISCONNECTED)
+
+    def test_token_reaches_executor_threads(self):
+        def frames():
+            processed = 0
+            for _ in range(1000):
+                check_cancelled()
+                processed += 1
+                time.sleep(0.001)
+            return processed
+
+        with cancellation_scope() as token, ThreadPoolExecutor(max_workers=1) as executor:
+            future = run_in_context(executor, frames)
+            time.sleep(0.02)
+            token.cancel()
+            with self.assertRaises(Cancelled):
+                future.result(timeout=2)
+
+    def test_follower_reruns_when_leader_is_cancelled(self):
+        flight = SingleFlight('test-cancel', cross_process=False)
+        started = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                time.sleep(0.05)
+                raise Cancelled(CLIENT_DISCONNECTED)
+            return 'done'
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, 'k', work)
+            started.wait(1)
+            follower = executor.submit(flight.do, 'k', work)
+            with self.assertRaises(Cancelled):
+                leader.result(timeout=2)
+            self.assertEqual(follower.result(timeout=2), 'done')
+        self.assertEqual(len(calls), 2)
+
+    def test_middleware_cancels_on_disconnect(self):
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen['token'] = current_token()
+            await receive()
+            seen['cancelled'] = seen['token'].cancelled
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            pass
+
+        async_to_sync(CancellationMiddleware(app))({'type': 'http'}, receive, send)
+        self.assertTrue(seen['cancelled'])
+        self.assertIsNone(current_token())
+
+
+class FrameDedupTests(SimpleTestCase):
+    def make_frame(self, seed, size=96):
+        rng = np.random.default_rng(seed)
+        return cv2.resize(rng.integers(0, 255, (12, 12, 3), dtype=np.uint8), (size, size))
+
+    def test_near_duplicates_hash_close(self):
+        frame = self.make_frame(0)
+        noisy = np.clip(frame.astype(np.int16) + 2, 0, 255).astype(np.uint8)
+        self.assertLessEqual(hamming(dhash(frame), dhash(noisy)), 2)
+        self.assertGreater(hamming(dhash(frame), dhash(self.make_frame(1))), 10)
+
+    def test_compares_against_last_analyzed_frame(self):
+        deduper = FrameDeduper(threshold=5, enabled=True)
+        first, other = self.make_frame(0), self.make_frame(1)
+        self.assertFalse(deduper.is_duplicate(first))
+        self.assertTrue(deduper.is_duplicate(first.copy()))
+        self.assertFalse(deduper.is_duplicate(other))
+        self.assertEqual((deduper.analyzed, deduper.skipped), (2, 1))
+        deduper.forget()
+        self.assertFalse(deduper.is_duplicate(other))
+
+    def test_weighted_add_matches_repeated_frames(self):
+        a, b = np.full(7, 0.1), np.linspace(0, 1, 7)
+        weighted = TimelineStats()
+        weighted.add(np.stack([a, b]), [3, 1])
+        repeated = TimelineStats()
+        for row in (a, a, a, b):
+            repeated.add(row)
+        self.assertEqual(weighted.count, 4)
+        np.testing.assert_allclose(weighted.mean(), repeated.mean())
+        np.testing.assert_allclose(weighted.std(), repeated.std(), atol=1e-9)
+
+    @override_settings(FACE_GATE={'ENABLED': False})
+    def test_static_video_skips_inference(self):
+        size = 16
+        rng = np.random.default_rng(0)
+        model = LiteEmotionModel(rng.normal(size=(size * size, 7)), np.zeros(7),
+                                 np.zeros(size * size), np.ones(size * size), size)
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        path = os.path.join(workdir, 'static.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (96, 96))
+        for i in range(40):
+            writer.write(self.make_frame(0 if i < 30 else 1))
+        writer.release()
+
+        with mock.patch.object(model, 'predict_faces', wraps=model.predict_faces) as predict:
+            timeline = model.extract_video_timeline(path, frame_skip=2, batch_size=4)
+        stats = timeline.frame_stats()
+        self.assertEqual(stats['sampled'], 20)
+        self.assertEqual(stats['analyzed'], 2)
+        self.assertEqual(stats['skipped'], 18)
+        self.assertEqual(sum(len(call.args[0]) for call in predict.call_args_list), 2)
+
+
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.settings_override = override_settings(PROFILING={
+            'TOKEN': 'secret', 'SAMPLE_RATE': 0.0, 'MODE': 'sampler',
+            'SAMPLE_INTERVAL_MS': 1, 'DIR': self.workdir, 'MAX_CAPTURES': 2,
+        })
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_requests_are_not_profiled_without_the_token(self):
+        response = self.client.get('/api/', HTTP_X_PROFILE='wrong')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_capture_can_be_listed_and_downloaded(self):
+        for mode in ('sampler', 'cprofile'):
+            response = self.client.get('/api/', HTTP_X_PROFILE='secret',
+                                       HTTP_X_PROFILE_MODE=mode)
+            self.assertIn('X-Profile-Id', response)
+        capture_id = response['X-Profile-Id']
+
+        listing = self.client.get('/api/admin/profiles', HTTP_X_PROFILE='secret')
+        captures = listing.json()['captures']
+        self.assertEqual(captures[0]['id'], capture_id)
+        self.assertEqual(captures[0]['path'], '/api/')
+
+        download = self.client.get(f"/api/admin/profiles/{captures[0]['file']}",
+                                   HTTP_X_PROFILE='secret')
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b''.join(download.streaming_content))
+
+        forbidden = self.client.get('/api/admin/profiles')
+        self.assertEqual(forbidden.status_code, 403)
+        missing = self.client.get('/api/admin/profiles/..%2Fsettings.py',
+                                  HTTP_X_PROFILE='secret')
+        self.assertEqual(missing.status_code, 404)
+
+    def test_ring_buffer_keeps_newest_captures(self):
+        for _ in range(4):
+            self.client.get('/api/', HTTP_X_PROFILE='secret')
+        self.assertEqual(len([n for n in os.listdir(self.workdir) if n.endswith('.json')]), 2)
+        self.assertEqual(len(os.listdir(self.workdir)), 4)
+
+
+class MemoryTests(SimpleTestCase):
+    def test_request_limit_drains_then_recycles(self):
+        recycled = []
+        recycler = WorkerRecycler(max_requests=2, drain_timeout_s=60, on_recycle=lambda: recycled.append(1))
+        self.assertTrue(recycler.begin())
+        self.assertTrue(recycler.begin())
+        recycler.end(rss=0)
+        self.assertTrue(recycler.begin())
+        recycler.end(rss=0)
+        self.assertTrue(recycler.draining)
+        self.assertFalse(recycler.begin())
+        self.assertEqual(recycled, [])  # one request still in flight
+        recycler.end(rss=0)
+        self.assertEqual(recycled, [1])
+
+    def test_rss_limit_triggers_drain(self):
+        recycled = []
+        recycler = WorkerRecycler(max_rss_mb=100, on_recycle=lambda: recycled.append(1))
+        recycler.begin()
+        recycler.end(rss=50 * 1024 * 1024)
+        self.assertFalse(recycler.draining)
+        recycler.begin()
+        recycler.end(rss=150 * 1024 * 1024)
+        self.assertIn('rss', recycler.draining_reason)
+        self.assertEqual(recycled, [1])
+
+    def test_draining_worker_refuses_requests(self):
+        recycler = WorkerRecycler(on_recycle=lambda: None)
+        recycler.draining_reason = 'test'
+        with mock.patch('api.utils.memory.get_recycler', return_value=recycler):
+            response = self.client.get('/api/')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+
+    @override_settings(PROFILING={'TOKEN': 'secret'})
+    def test_memory_report_lists_allocators_when_tracing(self):
+        response = self.client.get('/api/admin/memory', {'trace': 'start'}, HTTP_X_PROFILE='secret')
+        self.addCleanup(stop_tracing)
+        data = response.json()
+        self.assertGreater(data['rss_bytes'], 0)
+        self.assertTrue(data['tracing'])
+        self.assertIn('top_allocators', data)
+        self.assertEqual(self.client.get('/api/admin/memory').status_code, 403)
+
+
+class RendererTests(SimpleTestCase):
+    def test_numpy_values_render(self):
+        body = FastJSONRenderer().render({'scores': np.arange(3, dtype=np.float32), 'x': np.float64(0.5)})
+        self.assertEqual(json.loads(body), {'scores': [0.0, 1.0, 2.0], 'x': 0.5})
+
+    def test_types_handled_by_drf_encoder_render(self):
+        body = FastJSONRenderer().render({'d': Decimal('1.5'), 'took': timedelta(seconds=2),
+                                          'label': gettext_lazy('Happy')})
+        self.assertEqual(json.loads(body), {'d': 1.5, 'took': '2.0', 'label': 'Happy'})
+
+    def test_compact_rounds_and_flattens_emotions(self):
+        emotions = {k: np.float64(i / 3) for i, k in enumerate(
+            ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral'])}
+        data = compact({'emotions': emotions, 'confidence': 0.123456789, 'partial': {'happy': 1.0}})
+        self.assertEqual(data['emotion_keys'][3], 'happy')
+        self.assertEqual(data['emotions'][3], 1.0)
+        self.assertEqual(data['emotions'][1], 0.3333)
+        self.assertEqual(data['confidence'], 0.1235)
+        self.assertEqual(data['partial'], {'happy': 1.0})
+
+    def test_compact_mode_from_accept_header(self):
+        body = FastJSONRenderer().render({'confidence': 0.987654}, 'application/json; compact=1', {})
+        self.assertEqual(json.loads(body), {'confidence': 0.9877})
+        response = self.client.post('/api/diagnose/', {}, content_type='application/json',
+                                    HTTP_ACCEPT='application/json; compact=1')
+        self.assertEqual(response.json(), {'error': 'No text provided'})
+
+    @mock.patch('api.consumers.get_shared_analyzer', return_value=_SlowAnalyzer())
+    def test_emotion_stream_msgpack(self, _analyzer):
+        ok, jpeg = cv2.imencode('.jpg', np.full((64, 64, 3), 128, dtype=np.uint8))
+
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                EmotionStreamConsumer.as_asgi(), '/ws/emotion/?interval_ms=100&format=msgpack&compact=1')
+            await communicator.connect()
+            await communicator.send_to(bytes_data=jpeg.tobytes())
+            message = await communicator.receive_from(timeout=2)
+            await communicator.disconnect()
+            return message
+
+        message = msgpack.unpackb(async_to_sync(scenario)())
+        self.assertEqual(message['type'], 'analysis_result')
+        happy = message['emotion_keys'].index('happy')
+        self.assertAlmostEqual(message['analysis']['emotions'][happy], 0.75)
+
+
+class IntentRouterTests(SimpleTestCase):
+    def test_fast_path_matches_sklearn(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        router = get_router()
+        texts, labels = [], []
+        for name, intent in router.intents.items():
+            texts.extend(intent['examples'])
+            labels.extend([name] * len(intent['examples']))
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)
+        clf = LogisticRegression(C=10.0, max_iter=1000).fit(vectorizer.fit_transform(texts), labels)
+        for message in ['hello there', 'thanks so much!', 'how do i relax', 'qwerty']:
+            proba = clf.predict_proba(vectorizer.transform([message]))[0]
+            result = router.classify(message)
+            self.assertEqual(result['intent'], clf.classes_[proba.argmax()])
+            self.assertAlmostEqual(result['confidence'], proba.max(), places=6)
+
+    def test_routes(self):
+        router = get_router()
+        self.assertEqual(router.route('hi there')['route'], 'local')
+        tips = router.route('tips for anxiety')
+        self.assertEqual(tips['intent'], 'coping_anxiety')
+        self.assertIn('- ', tips['reply'])
+        self.assertEqual(router.route('i moved to a new city and feel lonely')['route'], 'llm')
+        crisis = router.route('thanks, but i want to kill myself')
+        self.assertEqual((crisis['intent'], crisis['route']), ('crisis', 'llm'))
+        self.assertTrue(crisis['resources'])
+
+    def test_binary_router(self):
+        router = IntentRouter({
+            'greeting': {'examples': ['hi', 'hello', 'hey'], 'responses': ['Hello!']},
+            'open': {'examples': ['my day was long', 'i lost my job'], 'llm': True},
+        }, min_confidence=0.0)
+        self.assertEqual(router.route('hello')['reply'], 'Hello!')
+
+    @mock.patch('api.views.record_chat_message')
+    @mock.patch('api.views.gemma')
+    def test_intent_endpoint_skips_llm_for_routine_messages(self, gemma, _record):
+        gemma.generate.return_value = 'LLM reply'
+        data = self.client.post('/api/chat/intent/', {'text': 'thank you so much'}, content_type='application/json').json()
+        self.assertEqual(data['route'], 'local')
+        gemma.generate.assert_not_called()
+        data = self.client.post('/api/chat/intent/', {'text': 'i want to end my life'}, content_type='application/json').json()
+        self.assertEqual(data['route'], 'llm')
+        self.assertTrue(data['reply'].startswith('LLM reply'))
+        self.assertIn('988', data['reply'])
+
+
+class _CountingBackend:
+    """Toy LM: emits the letters after the prompt's last one, then EOS after `length` tokens."""
+    eos_token_id = 0
+
+    def __init__(self, length=5, step_delay=0.002):
+        self.length = length
+        self.step_delay = step_delay
+        self.batch_sizes = []
+
+    def encode(self, prompt):
+        return [ord(c) - 96 for c in prompt]
+
+    def decode(self, tokens):
+        return ''.join(chr(t + 96) for t in tokens)
+
+    def _logits(self, last, generated):
+        logits = np.zeros(32)
+        logits[0 if generated >= self.length else last % 26 + 1] = 10.0
+        return logits
+
+    def prefill(self, ids):
+        return (ids[-1], 0), self._logits(ids[-1], 0)
+
+    def decode_step(self, states, last_tokens):
+        time.sleep(self.step_delay)
+        self.batch_sizes.append(len(states))
+        new_states = [(token, generated + 1) for (_, generated), token in zip(states, last_tokens)]
+        return new_states, np.stack([self._logits(t, g) for t, g in new_states])
+
+
+class LocalLLMTests(SimpleTestCase):
+    def test_greedy_generation_and_streaming(self):
+        generator = LocalGenerator(backend=_CountingBackend(), max_new_tokens=50)
+        self.assertEqual(list(generator.stream('a', temperature=0)), ['b', 'c', 'd', 'e', 'f'])
+        self.assertEqual(generator.generate('x', do_sample=False), 'yzabc')
+        self.assertEqual(generator.generate('a', max_length=3, do_sample=False), 'bcd')
+
+    def test_concurrent_requests_share_decode_steps(self):
+        backend = _CountingBackend(length=20)
+        engine = ContinuousBatcher(backend, max_batch=4, max_wait_ms=20)
+        sequences = [engine.submit(p, temperature=0) for p in 'abcdef']
+        for seq in sequences:
+            self.assertTrue(seq.done.wait(5))
+        self.assertEqual(sequences[0].text, 'bcdefghijklmnopqrstu')
+        self.assertEqual(max(backend.batch_sizes), 4)
+        # 6 sequences of 20 tokens in far fewer than 6 * 20 steps
+        self.assertLess(len(backend.batch_sizes), 60)
+
+    def test_cancelled_stream_leaves_the_batch(self):
+        backend = _CountingBackend(length=10_000, step_delay=0.001)
+        generator = LocalGenerator(backend=backend)
+        stream = generator.stream('a', max_length=10_000)
+        self.assertEqual(next(stream), 'b')
+        stream.close()
+        time.sleep(0.05)
+        steps = len(backend.batch_sizes)
+        time.sleep(0.05)
+        self.assertEqual(len(backend.batch_sizes), steps)
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class ConversationTests(SimpleTestCase):
+    def make_store(self, **kwargs):
+        options = dict(window_turns=6, window_tokens=400, prompt_tokens=300, summary_tokens=60, persist=False)
+        options.update(kwargs)
+        return ConversationStore(**options)
+
+    def test_prompt_stays_within_budget(self):
+        store = self.make_store()
+        summaries = []
+
+        def summarize(prompt):
+            summaries.append(prompt)
+            return 'The user talked about exams. ' * 50  # too long: gets capped
+
+        for i in range(100):
+            prompt = store.build_prompt('s1', f'message number {i} ' * 10)
+            self.assertLessEqual(estimate_tokens(prompt), 300 + 20)
+            store.record('s1', 'user', f'message number {i} ' * 10, summarize)
+            store.record('s1', 'assistant', f'reply number {i} ' * 10, summarize)
+
+        conversation = store.get('s1')
+        self.assertTrue(_wait_for(lambda: not conversation.summarizing))
+        self.assertTrue(summaries)
+        self.assertLessEqual(len(conversation.turns), 6)
+        self.assertLessEqual(estimate_tokens(conversation.summary), 60 + 2)
+        prompt = store.build_prompt('s1', 'and now?')
+        self.assertIn('Summary of the conversation so far: The user talked about exams.', prompt)
+        self.assertIn('reply number 99', prompt)
+        self.assertNotIn('reply number 0 ', prompt)
+
+    def test_only_new_turns_are_summarized(self):
+        store = self.make_store(window_turns=2)
+        prompts = []
+        store.record('s1', 'user', 'I failed my exam', lambda p: prompts.append(p) or 'Failed an exam.')
+        store.record('s1', 'assistant', 'That sounds hard', lambda p: prompts.append(p) or 'Failed an exam.')
+        store.record('s1', 'user', 'My friend helped', lambda p: prompts.append(p) or 'Failed an exam; friend helped.')
+        conversation = store.get('s1')
+        self.assertTrue(_wait_for(lambda: not conversation.summarizing))
+        self.assertIn('I failed my exam', prompts[0])
+        self.assertNotIn('My friend helped', prompts[0])
+        self.assertEqual(conversation.turns, [('assistant', 'That sounds hard'), ('user', 'My friend helped')])
+
+    def test_summary_falls_back_without_llm(self):
+        store = self.make_store(window_turns=2)
+
+        def broken(prompt):
+            raise RuntimeError('offline')
+
+        for text in ['I feel lonely. Really.', 'ok', 'I moved cities']:
+            store.record('s1', 'user', text, broken)
+        conversation = store.get('s1')
+        self.assertTrue(_wait_for(lambda: not conversation.summarizing))
+        self.assertIn('User said: I feel lonely.', conversation.summary)
+
+    def test_unavailable_llm_never_becomes_the_summary(self):
+        store = self.make_store(window_turns=2)
+        store.get('s1').summary = 'Sam is stressed about exams.'
+        with mock.patch('api.utils.gemma_runtime.gemma', FallbackGenerator()):
+            for text in ['I slept badly. Again.', 'ok', 'I have a test today']:
+                store.record('s1', 'user', text, _llm_summarize)
+            conversation = store.get('s1')
+            self.assertTrue(_wait_for(lambda: not conversation.summarizing))
+        self.assertNotIn('unavailable', conversation.summary)
+        self.assertIn('Sam is stressed about exams.', conversation.summary)
+        self.assertIn('User said: I slept badly.', conversation.summary)
+
+    def test_respond_builds_context_from_earlier_turns(self):
+        store = self.make_store()
+        seen = []
+        store.respond('s1', 'My name is Sam', lambda prompt: seen.append(prompt) or 'Nice to meet you')
+        store.respond('s1', 'What did I say?', lambda prompt: seen.append(prompt) or 'You said your name')
+        self.assertIn('User: My name is Sam\nAssistant: Nice to meet you\nUser: What did I say?', seen[1])
+        self.assertTrue(seen[1].endswith('Assistant:'))
+
+
+class ConversationPersistenceTests(TestCase):
+    def test_summary_and_turns_reload_from_database(self):
+        ChatSession.objects.create(session_id='s1', summary='Sam is stressed about exams.')
+        ChatMessage.objects.create(session_id='s1', role='user', content='I studied all night')
+        ChatMessage.objects.create(session_id='s1', role='assistant', content='Remember to rest')
+        store = ConversationStore(persist=True)
+        prompt = store.build_prompt('s1', 'Thanks')
+        self.assertIn('Sam is stressed about exams.', prompt)
+        self.assertIn('User: I studied all night\nAssistant: Remember to rest\nUser: Thanks', prompt)
+        store._save_summary('s1', 'Updated.')
+        self.assertEqual(ChatSession.objects.get(session_id='s1').summary, 'Updated.')
+
+
+class _InstantAnalyzer:
+    def analyze_image(self, path):
+        return {'type': 'image', 'emotions': {'sad': 0.7, 'neutral': 0.3}, 'diagnosis': 'mild', 'confidence': 0.6}
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'api.utils.channel_layers.LocalChannelLayer'}})
+class AsyncAdviceTests(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @mock.patch('api.utils.advice.gemma')
+    @mock.patch('api.views.record_analysis')
+    @mock.patch('api.views.DeepFaceAnalyzer', return_value=_InstantAnalyzer())
+    def test_upload_returns_before_advice(self, _analyzer, _record, gemma):
+        release = threading.Event()
+        gemma.generate.side_effect = lambda prompt: release.wait(2) and 'Be kind to yourself.'
+        ok, png = cv2.imencode('.png', np.zeros((8, 8, 3), dtype=np.uint8))
+        upload = SimpleUploadedFile('face.png', png.tobytes(), content_type='image/png')
+
+        response = self.client.post('/api/analysis/image/', {'image': upload, 'advice': 'async'})
+        data = response.json()
+        self.assertEqual(data['analysis_result']['diagnosis'], 'mild')
+        self.assertIsNone(data['advice'])
+        self.assertEqual(self.client.get(data['advice_url']).json()['status'], 'pending')
+
+        release.set()
+        self.assertTrue(_wait_for(lambda: get_ticket(data['advice_ticket'])['status'] == 'ready'))
+        polled = self.client.get(data['advice_url']).json()
+        self.assertEqual(polled['advice'], 'Be kind to yourself.')
+        self.assertEqual(self.client.get('/api/advice/unknown').status_code, 404)
+
+    @mock.patch('api.utils.advice.gemma')
+    def test_advice_is_pushed_to_the_chat_socket(self, gemma):
+        gemma.generate.return_value = 'Take a short walk.'
+
+        async def scenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat?session_id=s9')
+            await communicator.connect()
+            ticket = await asyncio.get_running_loop().run_in_executor(
+                None, submit_advice, {'emotions': {}, 'diagnosis': 'mild'}, 'image', 's9')
+            message = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return ticket, message
+
+        ticket, message = async_to_sync(scenario)()
+        self.assertEqual(message['type'], 'advice')
+        self.assertEqual(message['ticket'], ticket)
+        self.assertEqual(message['content'], 'Take a short walk.')
+
+    @mock.patch('api.utils.advice.gemma')
+    def test_full_backlog_degrades_to_fallback(self, gemma):
+        with mock.patch('api.utils.advice._slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            ticket = submit_advice({'emotions': {}, 'diagnosis': 'mild'})
+        self.assertEqual(get_ticket(ticket)['status'], 'ready')
+        self.assertEqual(get_ticket(ticket)['advice'], FALLBACK_ADVICE)
+        gemma.generate.assert_not_called()
+
+
+def _write_video(path, frames, size=96):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (size, size))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+class FaceGateTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+
+    def test_blank_image_short_circuits_before_the_model(self):
+        path = os.path.join(self.workdir, 'blank.png')
+        cv2.imwrite(path, np.full((240, 320, 3), 30, dtype=np.uint8))
+        analyzer = DeepFaceAnalyzer()
+        with mock.patch.object(analyzer, 'extract_emotions_image') as extract:
+            result = analyzer.analyze_image(path)
+        extract.assert_not_called()
+        self.assertEqual(result['status'], 'no_face')
+        self.assertIsNone(result['emotions'])
+        self.assertIsNone(analyzer.extract_emotions_frame(np.zeros((64, 64, 3), dtype=np.uint8)))
+
+    def test_gate_uses_the_downscaled_copy(self):
+        gate = FaceGate(enabled=True, max_side=100)
+        frame = np.zeros((400, 800), dtype=np.uint8)
+        cascade = mock.Mock()
+        cascade.detectMultiScale.return_value = np.array([[10, 5, 20, 20], [40, 10, 30, 30]])
+        with mock.patch('api.utils.frame_filters._get_face_cascade', return_value=cascade):
+            boxes = gate.faces(frame)
+        self.assertEqual(cascade.detectMultiScale.call_args.args[0].shape, (50, 100))
+        self.assertEqual(boxes.tolist(), [[320, 80, 240, 240], [80, 40, 160, 160]])
+        self.assertTrue(FaceGate(enabled=False).has_face(frame))
+
+    def test_video_reports_face_coverage(self):
+        size = 16
+        rng = np.random.default_rng(0)
+        model = LiteEmotionModel(rng.normal(size=(size * size, 7)), np.zeros(7),
+                                 np.zeros(size * size), np.ones(size * size), size)
+        # Bright frames stand in for frames with a face, every 4th one is dark
+        frames = [cv2.resize(rng.integers(140, 255, (12, 12, 3), dtype=np.uint8) if i % 4
+                             else rng.integers(0, 100, (12, 12, 3), dtype=np.uint8), (96, 96))
+                  for i in range(8)]
+        path = os.path.join(self.workdir, 'faces.avi')
+        _write_video(path, frames)
+
+        def fake_detect(frame, *args):
+            return np.array([[0, 0, 32, 32]]) if frame.mean() > 128 else np.empty((0, 4), dtype=np.intp)
+
+        with mock.patch('api.utils.frame_filters.detect_faces', side_effect=fake_detect), \
+                mock.patch.object(model, 'predict_faces', wraps=model.predict_faces) as predict:
+            timeline = model.extract_video_timeline(path, frame_skip=1, batch_size=4)
+        stats = timeline.frame_stats()
+        self.assertEqual(stats['sampled'], 8)
+        self.assertEqual(stats['no_face'], 2)
+        self.assertEqual(stats['face_coverage'], 0.75)
+        self.assertEqual(sum(len(call.args[0]) for call in predict.call_args_list), 6)
+
+    @mock.patch('api.utils.advice.gemma')
+    @mock.patch('api.views.record_analysis')
+    def test_upload_without_face_skips_advice_and_history(self, record, gemma):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        ok, png = cv2.imencode('.png', np.full((120, 160, 3), 200, dtype=np.uint8))
+        upload = SimpleUploadedFile('wall.png', png.tobytes(), content_type='image/png')
+        with override_settings(MEDIA_ROOT=media):
+            data = self.client.post('/api/analysis/image/', {'image': upload}).json()
+        self.assertEqual(data['status'], 'no_face')
+        self.assertIsNone(data['advice'])
+        gemma.generate.assert_not_called()
+        record.assert_not_called()
+
+
+class _BatchAnalyzer:
+    emotion_keys = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_face_batch(self, faces):
+        self.batches.append([face.shape for face in faces])
+        scores = np.zeros((len(faces), 7))
+        scores[:, 3] = np.linspace(1.0, 0.0, len(faces))  # happy: largest face happiest
+        scores[:, 4] = 1.0 - scores[:, 3]
+        return scores
+
+    def predict_depression(self, emotions):
+        return {'diagnosis': 'mild' if emotions['sad'] > 0.5 else 'low_risk', 'confidence': 0.7}
+
+    def analyze_image(self, path, multi_face=False, aggregate=None):
+        return analyze_group_image(self, path, aggregate)
+
+
+class MultiFaceTests(SimpleTestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        self.path = os.path.join(workdir, 'group.png')
+        cv2.imwrite(self.path, np.full((200, 300, 3), 90, dtype=np.uint8))
+
+    def test_aggregates(self):
+        scores = np.array([[1.0, 0.0], [0.0, 1.0]])
+        boxes = np.array([[0, 0, 30, 30], [0, 0, 10, 10]])
+        np.testing.assert_allclose(aggregate_faces(scores, boxes, 'mean'), [0.5, 0.5])
+        np.testing.assert_allclose(aggregate_faces(scores, boxes, 'area'), [0.9, 0.1])
+        np.testing.assert_allclose(aggregate_faces(scores, boxes, 'largest'), [1.0, 0.0])
+
+    def test_all_faces_scored_in_one_batch(self):
+        boxes = np.array([[100, 50, 60, 60], [10, 20, 40, 40], [220, 120, 20, 20]])
+        analyzer = _BatchAnalyzer()
+        with mock.patch('api.utils.multi_face.detect_faces', return_value=boxes) as detect:
+            result = analyze_group_image(analyzer, self.path, 'mean')
+        detect.assert_called_once()
+        self.assertEqual(len(analyzer.batches), 1)
+        self.assertEqual(analyzer.batches[0][0], (72, 72))  # box plus a 10% margin
+        self.assertEqual(result['face_count'], 3)
+        self.assertEqual([face['box'] for face in result['faces']], boxes.tolist())
+        self.assertEqual(result['faces'][0]['dominant_emotion'], 'happy')
+        self.assertAlmostEqual(result['emotions']['happy'], 0.5)
+        self.assertEqual(result['diagnosis'], 'low_risk')
+
+    def test_percentage_scores_are_normalized(self):
+        boxes = np.array([[100, 50, 60, 60], [10, 20, 40, 40]])
+        analyzer = _BatchAnalyzer()
+        analyzer.predict_face_batch = lambda faces: np.array([[0, 0, 0, 80, 20, 0, 0]] * len(faces), dtype=float)
+        with mock.patch('api.utils.multi_face.detect_faces', return_value=boxes):
+            result = analyze_group_image(analyzer, self.path, 'area')
+        self.assertAlmostEqual(result['faces'][0]['emotions']['happy'], 0.8)
+        self.assertAlmostEqual(sum(result['emotions'].values()), 1.0)
+
+        with mock.patch('api.utils.multi_face.detect_faces', return_value=np.empty((0, 4), dtype=np.intp)):
+            self.assertEqual(analyze_group_image(analyzer, self.path)['status'], 'no_face')
+
+    @mock.patch('api.utils.advice.gemma')
+    @mock.patch('api.views.record_analysis')
+    def test_upload_with_faces_all(self, _record, gemma):
+        gemma.generate.return_value = 'Enjoy the time together.'
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        with open(self.path, 'rb') as f:
+            upload = SimpleUploadedFile('group.png', f.read(), content_type='image/png')
+        boxes = np.array([[100, 50, 60, 60], [10, 20, 40, 40]])
+        with override_settings(MEDIA_ROOT=media), \
+                mock.patch('api.views.DeepFaceAnalyzer', return_value=_BatchAnalyzer()), \
+                mock.patch('api.utils.multi_face.detect_faces', return_value=boxes):
+            data = self.client.post('/api/analysis/image/', {'image': upload, 'faces': 'all',
+                                                             'aggregate': 'largest'}).json()
+        result = data['analysis_result']
+        self.assertEqual(result['face_count'], 2)
+        self.assertEqual(result['aggregate'], 'largest')
+        self.assertEqual(result['emotions']['happy'], 1.0)
+        self.assertEqual(data['advice'], 'Enjoy the time together.')
+
+
+class RemedyIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = RemedyIndex.build(load_library(os.path.join('api', 'utils', 'remedies.json')))
+
+    def test_ranks_by_the_user_text(self):
+        hits = self.index.search("I can't sleep at night and keep worrying", k=3, severity=1.0)
+        self.assertEqual(len(hits), 3)
+        self.assertIn('sleep-schedule', [hit['id'] for hit in hits])
+        self.assertGreaterEqual(hits[0]['score'], hits[-1]['score'])
+        self.assertGreater(hits[0]['score'], 0)
+
+    def test_filters_by_severity_and_pins_safety_tips(self):
+        hits = self.index.search('had a fight with my boss', k=5, severity=2.0)
+        self.assertEqual(hits[0]['id'], 'safety-plan')
+        self.assertTrue(all(hit['severity'][0] <= 2.0 <= hit['severity'][1] for hit in hits))
+        mild = self.index.search('', k=50, severity=0.5)
+        self.assertNotIn('safety-plan', [hit['id'] for hit in mild])
+
+    def test_saved_index_matches_and_legacy_layout_loads(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        path = os.path.join(workdir, 'index.npz')
+        self.index.save(path)
+        loaded = RemedyIndex.load(path)
+        query = 'exams are stressing me out'
+        self.assertEqual(loaded.search(query, k=4, severity=1.0), self.index.search(query, k=4, severity=1.0))
+
+        legacy = os.path.join(workdir, 'legacy.json')
+        with open(legacy, 'w') as f:
+            json.dump({'anxiety': ['Breathe slowly.'], 'depression': ['Go for a walk.']}, f)
+        entries = load_library(legacy)
+        self.assertEqual(RemedyIndex.build(entries).search('walk', k=1)[0]['text'], 'Go for a walk.')
+
+    def test_personalize_uses_classifier_labels(self):
+        result = personalize_remedies('my exams are next week and i cannot focus', 'moderate')
+        self.assertEqual(result['intro'], 'Thanks for sharing. Here are a few practices that many find helpful.')
+        self.assertIn('Study or work in focused 25-minute blocks with short breaks in between.',
+                      result['suggestions'])
+        anxiety = personalize_remedies('', 'anxiety')['suggestions']
+        anxiety_tips = {entry['text'] for entry in self.index.entries if 'anxiety' in entry['categories']}
+        self.assertTrue(set(anxiety) <= anxiety_tips)
+
+    def test_intro_follows_severity(self):
+        self.assertEqual(personalize_remedies('', 'high_risk')['intro'], personalize_remedies('', 'severe')['intro'])
+        self.assertEqual(personalize_remedies('', 'moderate_risk')['intro'],
+                         'Thanks for sharing. Here are a few practices that many find helpful.')
+
+    def test_index_loads_on_first_use(self):
+        code = ('import django; django.setup(); import api.utils.intent_router, api.utils.remedies as r; '
+                'assert r._index is None; r.remedies_by_category(); assert r._index is not None')
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings'}
+        subprocess.run([sys.executable, '-c', code], check=True, env=env, capture_output=True,
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
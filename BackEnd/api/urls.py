@@ -6,6 +6,16 @@ urlpatterns = [
     path('analysis/image/', views.upload_image, name='upload_image'),
     path('analysis/video/', views.upload_video, name='upload_video'),
     path('diagnose/', views.diagnose_api, name='diagnose'),
+    path('assess/', views.assess, name='assess'),
+    path('advice/<str:ticket>', views.advice_status, name='advice_status'),
     path('', views.home, name='home'),
     path('chat/generate/', views.chat_generate, name='chat_generate'),
+    path('chat/intent/', views.chat_intent, name='chat_intent'),
+    path('chat/history', views.chat_history, name='chat_history'),
+    path('chat/export', views.chat_export, name='chat_export'),
+    path('user/analytics', views.user_analytics, name='user_analytics'),
+    path('metrics', views.metrics, name='metrics'),
+    path('admin/memory', views.memory_status, name='memory_status'),
+    path('admin/profiles', views.profile_list, name='profile_list'),
+    path('admin/profiles/<str:name>', views.profile_download, name='profile_download'),
 ]
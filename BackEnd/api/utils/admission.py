@@ -0,0 +1,187 @@
+"""
+Admission control for the expensive endpoints.
+
+Every worker has CAPACITY slots for concurrent expensive requests. Each
+endpoint class (chat, image, video, ...) has its own concurrency limit, a
+bounded wait queue and a maximum queue time. Waiters are granted slots in
+priority order, and RESERVED slots are only usable by priority-0 classes, so
+chat keeps answering while video analysis queues.
+
+Requests that can't be served fail fast instead of slowing everyone down:
+  429  the class's wait queue is full
+  503  the request waited longer than its queue-time deadline
+Both carry Retry-After, estimated from the class's observed service time
+and the work queued ahead.
+"""
+
+import functools
+import itertools
+import math
+import threading
+import time
+from typing import Any, Dict, List
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from api.utils import metrics
+from api.utils.cancellation import CLIENT_DISCONNECTED, Cancelled, cancellation_scope
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Class:
+    def __init__(self, name: str, priority: int = 1, max_concurrent: int = 1,
+                 max_queue: int = 0, max_wait_s: float = 0.0, service_ms: float = 1000.0,
+                 deadline_s: float = None):
+        self.name = name
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.service_ms = service_ms          # EWMA of observed service time
+        self.deadline_s = deadline_s          # execution deadline once admitted
+        self.active = 0
+        self.queued = 0
+
+
+class _Waiter:
+    __slots__ = ("cls", "granted")
+
+    def __init__(self, cls: _Class):
+        self.cls = cls
+        self.granted = False
+
+
+class AdmissionPool:
+    def __init__(self, capacity: int, reserved: int, classes: Dict[str, Dict[str, Any]]):
+        """
+        :param capacity: Concurrent expensive requests per worker
+        :param reserved: Slots only priority-0 classes may use
+        :param classes: name -> priority, max_concurrent, max_queue, max_wait_s[, service_ms]
+        """
+        self.capacity = capacity
+        self.reserved = reserved
+        self.classes = {name: _Class(name, **config) for name, config in classes.items()}
+        self._in_use = 0
+        self._waiters: List[tuple] = []  # (priority, seq, waiter), kept sorted
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _can_run(self, cls: _Class) -> bool:
+        limit = self.capacity if cls.priority == 0 else self.capacity - self.reserved
+        return cls.active < cls.max_concurrent and self._in_use < limit
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters, highest priority first (caller holds the lock)."""
+        granted = False
+        for entry in list(self._waiters):
+            waiter = entry[2]
+            if self._can_run(waiter.cls):
+                waiter.granted = True
+                waiter.cls.active += 1
+                waiter.cls.queued -= 1
+                self._in_use += 1
+                self._waiters.remove(entry)
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def retry_after(self, cls: _Class) -> int:
+        """Seconds until a slot is likely free: the work ahead drained at the class's rate."""
+        ahead = cls.queued + cls.active + 1
+        return max(1, math.ceil(ahead * cls.service_ms / 1000.0 / max(cls.max_concurrent, 1)))
+
+    def acquire(self, name: str) -> _Class:
+        cls = self.classes[name]
+        with self._cond:
+            if cls.queued >= cls.max_queue and not self._can_run(cls):
+                metrics.inc("admission_total", endpoint=name, outcome="rejected_queue_full")
+                raise AdmissionRejected(429, f"Too many {name} requests queued", self.retry_after(cls))
+
+            waiter = _Waiter(cls)
+            cls.queued += 1
+            self._waiters.append((cls.priority, next(self._seq), waiter))
+            self._waiters.sort(key=lambda e: e[:2])
+            self._dispatch()
+
+            started = time.monotonic()
+            deadline = started + cls.max_wait_s
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters = [e for e in self._waiters if e[2] is not waiter]
+                    cls.queued -= 1
+                    metrics.inc("admission_total", endpoint=name, outcome="rejected_timeout")
+                    raise AdmissionRejected(503, f"{name} capacity exhausted", self.retry_after(cls))
+                self._cond.wait(remaining)
+
+            waited_ms = (time.monotonic() - started) * 1000
+            metrics.inc("admission_total", endpoint=name, outcome="admitted")
+            metrics.inc("admission_queue_ms_total", waited_ms, endpoint=name)
+            self._update_gauges(cls)
+        return cls
+
+    def release(self, cls: _Class, service_ms: float) -> None:
+        with self._cond:
+            cls.service_ms = 0.8 * cls.service_ms + 0.2 * service_ms
+            cls.active -= 1
+            self._in_use -= 1
+            self._dispatch()
+            self._update_gauges(cls)
+
+    def _update_gauges(self, cls: _Class) -> None:
+        metrics.set_gauge("admission_active", cls.active, endpoint=cls.name)
+        metrics.set_gauge("admission_queued", cls.queued, endpoint=cls.name)
+        metrics.set_gauge("admission_service_ms", round(cls.service_ms, 1), endpoint=cls.name)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> AdmissionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = settings.ADMISSION
+                _pool = AdmissionPool(config["CAPACITY"], config["RESERVED"], config["CLASSES"])
+    return _pool
+
+
+def admission_controlled(name: str):
+    """
+    View decorator (inside @api_view): run the view only once `name` is
+    admitted, under the class's execution deadline. Work cancelled because
+    the client left answers 499; a missed deadline answers 504.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            pool = get_pool()
+            try:
+                cls = pool.acquire(name)
+            except AdmissionRejected as e:
+                return Response(
+                    {"error": e.reason, "retry_after": e.retry_after},
+                    status=e.status, headers={"Retry-After": str(e.retry_after)},
+                )
+            started = time.perf_counter()
+            try:
+                with cancellation_scope(cls.deadline_s):
+                    return view(request, *args, **kwargs)
+            except Cancelled as e:
+                metrics.inc("cancelled_total", endpoint=name, reason=e.reason)
+                status = 499 if e.reason == CLIENT_DISCONNECTED else 504
+                return Response({"error": f"Request cancelled: {e.reason}"}, status=status)
+            finally:
+                pool.release(cls, (time.perf_counter() - started) * 1000)
+        return wrapped
+    return decorator
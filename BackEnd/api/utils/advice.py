@@ -0,0 +1,118 @@
+"""
+Two-phase analysis responses: the analysis now, the LLM advice later.
+
+With `advice=async` (form field or query parameter) the upload views return
+the analysis as soon as inference finishes, together with an advice ticket.
+The advice is generated on a small background pool and delivered:
+  - to the session's chat websocket group as {"type": "advice", ...}
+  - through GET /api/advice/<ticket> for polling ({"status": "pending"|"ready"})
+Tickets live in Django's cache for ADVICE['TICKET_TTL'] seconds; configure a
+shared cache backend when polling may hit a different worker.
+At most ADVICE['MAX_PENDING'] tickets wait for a worker; beyond that a ticket
+is answered right away with FALLBACK_ADVICE instead of queueing without bound.
+"""
+
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from api.utils import metrics
+from api.utils.gemma_runtime import gemma
+
+FALLBACK_ADVICE = (
+    "I'm here to support you. Please take care of yourself and consider reaching out "
+    "to a trusted person or professional if you need additional support."
+)
+
+_executor = ThreadPoolExecutor(max_workers=settings.ADVICE['WORKERS'], thread_name_prefix='advice')
+# Running + queued tickets; the executor's own queue is unbounded
+_slots = threading.BoundedSemaphore(settings.ADVICE['WORKERS'] + settings.ADVICE.get('MAX_PENDING', 32))
+
+
+def advice_prompt(analysis_result: Dict[str, Any], media_type: str = 'image') -> str:
+    summary = (
+        f"Emotions: {analysis_result.get('emotions', {})}. "
+        f"Diagnosis: {analysis_result.get('diagnosis', 'unknown')} "
+        f"(confidence {analysis_result.get('confidence', 0.0):.2f})."
+    )
+    return (
+        f"A user uploaded {'a video' if media_type == 'video' else 'an image'}. Based on this summary, "
+        "write a short, warm, 2-3 sentence, practical guidance without medical claims: " + summary
+    )
+
+
+def generate_advice(analysis_result: Dict[str, Any], media_type: str = 'image') -> str:
+    try:
+        return gemma.generate(advice_prompt(analysis_result, media_type))
+    except Exception as e:
+        print(f"Error generating advice: {e}")
+        return FALLBACK_ADVICE
+
+
+def wants_async(request) -> bool:
+    value = request.data.get('advice') or request.query_params.get('advice')
+    return value == 'async'
+
+
+def _key(ticket: str) -> str:
+    return f"advice:{ticket}"
+
+
+def get_ticket(ticket: str) -> Optional[Dict[str, Any]]:
+    return cache.get(_key(ticket))
+
+
+def submit_advice(analysis_result: Dict[str, Any], media_type: str = 'image', session_id: str = '') -> str:
+    """Start generating advice in the background; returns the ticket."""
+    ticket = uuid.uuid4().hex
+    metrics.inc('advice_tickets_total')
+    if not _slots.acquire(blocking=False):
+        # Backlog full: degrade to the fallback now rather than grow the queue
+        metrics.inc('advice_shed_total')
+        _finish(ticket, FALLBACK_ADVICE, 0.0, session_id)
+        return ticket
+    cache.set(_key(ticket), {'status': 'pending', 'created': time.time()}, settings.ADVICE['TICKET_TTL'])
+    try:
+        # Plain submit: the advice outlives the request, so it must not inherit its cancellation
+        _executor.submit(_run, ticket, analysis_result, media_type, session_id)
+    except BaseException:
+        _slots.release()
+        raise
+    return ticket
+
+
+def _run(ticket: str, analysis_result: Dict[str, Any], media_type: str, session_id: str) -> None:
+    try:
+        started = time.perf_counter()
+        advice = generate_advice(analysis_result, media_type)
+        _finish(ticket, advice, (time.perf_counter() - started) * 1000, session_id)
+    finally:
+        _slots.release()
+
+
+def _finish(ticket: str, advice: str, advice_ms: float, session_id: str) -> None:
+    entry = {'status': 'ready', 'advice': advice, 'advice_ms': round(advice_ms, 1)}
+    cache.set(_key(ticket), entry, settings.ADVICE['TICKET_TTL'])
+    metrics.inc('advice_ms_total', advice_ms)
+    if session_id:
+        _deliver(session_id, ticket, advice)
+
+
+def _deliver(session_id: str, ticket: str, advice: str) -> None:
+    """Push the advice to the session's chat sockets (ChatConsumer.advice_ready)."""
+    try:
+        # Same group name ChatConsumer derives from ?session_id=
+        group = "chat." + re.sub(r'[^A-Za-z0-9_.-]', '', session_id)[:64]
+        async_to_sync(get_channel_layer().group_send)(
+            group, {'type': 'advice.ready', 'ticket': ticket, 'advice': advice},
+        )
+    except Exception as e:
+        print(f"⚠️ Could not deliver advice over websocket: {e}")
@@ -2,17 +2,25 @@
 DeepFaceAnalyzer for real emotion-based depression detection.
 
 Replaces the stub with:
-1. Image and video emotion extraction using DeepFace
-2. Depression prediction using a trained classifier
+1. Image and video emotion extraction using DeepFace, after a cheap
+   face-presence check (inputs without a face return status "no_face")
+2. Depression prediction using the emotion-feature risk model (risk_model.py)
 3. Handles video frame sampling for faster processing
+4. Batched per-face analysis for group photos (see multi_face.py)
 """
 
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 import numpy as np
 import cv2
-import joblib
 import os
 
+from api.utils.cancellation import check_cancelled
+from api.utils.frame_filters import FaceGate, FrameDeduper, no_face_result
+from api.utils.lite_emotion import TimelineStats, get_lite_model
+from api.utils.model_registry import LoadedModel, risk_model
+from api.utils.multi_face import analyze_group_image
+from api.utils.risk_model import RiskModel, normalize_rows
+
 # Try to import DeepFace, with fallback
 try:
     from deepface import DeepFace
@@ -22,17 +30,24 @@ except ImportError:
     DEEPFACE_AVAILABLE = False
 
 class DeepFaceAnalyzer:
-    def __init__(self, clf_path: str = None):
+    def __init__(self, clf_path: str = None, fast_path: bool = False):
         """
         Initialize the analyzer.
-        :param clf_path: Path to a trained depression model (.pkl)
+        :param clf_path: Path to a trained risk model (.npz); pins that file
+                         instead of following the hot-reloaded registry version
+        :param fast_path: Use the lite NumPy emotion model instead of DeepFace
+                          (e.g. while shedding load)
         """
-        if clf_path is None:
-            clf_path = os.path.join(os.path.dirname(__file__), "..", "models", "depression_model.pkl")
-        if not os.path.exists(clf_path):
-            raise FileNotFoundError(f"Depression model not found: {clf_path}")
-        self.clf = joblib.load(clf_path)
+        self._pinned = None
+        if clf_path is not None:
+            if not os.path.exists(clf_path):
+                raise FileNotFoundError(f"Risk model not found: {clf_path}")
+            self._pinned = LoadedModel(os.path.basename(clf_path), RiskModel.load(clf_path), 0.0)
+        else:
+            risk_model.get()  # loads the registry (and logs once if it is empty)
         self.emotion_keys = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+        self.use_deepface = DEEPFACE_AVAILABLE and not fast_path
+        self._emotion_net = None
 
     def extract_emotions_image(self, img_path: str) -> Dict[str, float]:
         """
@@ -53,7 +68,7 @@ class DeepFaceAnalyzer:
             print(f"Analyzing image: {img_path} (size: {file_size} bytes)")
             
             # Use DeepFace if available
-            if DEEPFACE_AVAILABLE:
+            if self.use_deepface:
                 try:
                     result = DeepFace.analyze(
                         img_path, 
@@ -81,8 +96,10 @@ class DeepFaceAnalyzer:
                     print(f"DeepFace analysis failed: {e}")
                     return self._fallback_emotions()
             else:
-                print("DeepFace not available, using fallback analysis")
-                return self._fallback_emotions()
+                print("DeepFace not in use, using lite emotion model")
+                lite_model = get_lite_model()
+                emotions = lite_model.extract_emotions_image(img_path) if lite_model else None
+                return emotions or self._fallback_emotions()
             
         except Exception as e:
             print(f"Error analyzing image {img_path}: {e}")
@@ -90,6 +107,57 @@ class DeepFaceAnalyzer:
             traceback.print_exc()
             return self._fallback_emotions()
     
+    def extract_emotions_frame(self, frame: np.ndarray) -> Optional[Dict[str, float]]:
+        """
+        Extract emotions from a decoded BGR frame (e.g. a webcam frame).
+        Returns None when the frame has no face.
+        """
+        if not FaceGate().has_face(frame):
+            return None
+        if self.use_deepface:
+            try:
+                result = DeepFace.analyze(
+                    frame,
+                    actions=['emotion'],
+                    enforce_detection=False,
+                    detector_backend='opencv'
+                )
+                if isinstance(result, list):
+                    result = result[0]
+                emotions = result.get('emotion', {})
+                return {k: float(emotions.get(k, 0.0)) for k in self.emotion_keys}
+            except Exception as e:
+                print(f"DeepFace frame analysis failed: {e}")
+                return self._fallback_emotions()
+        lite_model = get_lite_model()
+        if lite_model is None:
+            return self._fallback_emotions()
+        return lite_model.to_dict(lite_model.predict_images([frame])[0])
+
+    def _get_emotion_net(self):
+        """DeepFace's Keras emotion network (its label order matches emotion_keys)."""
+        if self._emotion_net is None:
+            try:
+                model = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+            except TypeError:
+                model = DeepFace.build_model("Emotion")  # deepface < 0.0.90
+            self._emotion_net = getattr(model, "model", model)
+        return self._emotion_net
+
+    def predict_face_batch(self, faces: List[np.ndarray]) -> Optional[np.ndarray]:
+        """
+        Emotion probabilities (N, 7), rows summing to 1, for gray face crops in
+        one forward pass; the lite model (same scale) when DeepFace is not in use.
+        """
+        if self.use_deepface:
+            try:
+                batch = np.stack([cv2.resize(face, (48, 48)) for face in faces]).astype(np.float32) / 255.0
+                return normalize_rows(self._get_emotion_net().predict(batch[..., None], verbose=0))
+            except Exception as e:
+                print(f"DeepFace batch analysis failed, using lite emotion model: {e}")
+        lite_model = get_lite_model()
+        return normalize_rows(lite_model.predict_faces(faces)) if lite_model else None
+
     def _fallback_emotions(self) -> Dict[str, float]:
         """
         Fallback emotion detection when DeepFace is not available.
@@ -112,53 +180,90 @@ class DeepFaceAnalyzer:
         Extract averaged emotions from a video by sampling frames.
         :param frame_skip: Analyze every `frame_skip` frames
         """
-        if not DEEPFACE_AVAILABLE:
-            print("DeepFace not available, using fallback for video analysis")
+        timeline = self.extract_video_timeline(video_path, frame_skip)
+        if timeline is None or not timeline.count:
+            print("No valid frames analyzed, using fallback emotions")
             return self._fallback_emotions()
+        return timeline.to_dict()
+
+    def extract_video_timeline(self, video_path: str, frame_skip: int = 30) -> Optional[TimelineStats]:
+        """
+        Per-emotion mean/std over sampled frames with a face, or None if no
+        frame could be analyzed (timeline.count is 0 if none had a face).
+        :param frame_skip: Analyze every `frame_skip` frames
+        """
+        if not self.use_deepface:
+            print("DeepFace not in use, using lite emotion model for video analysis")
+            lite_model = get_lite_model()
+            return lite_model.extract_video_timeline(video_path, frame_skip) if lite_model else None
             
         cap = cv2.VideoCapture(video_path)
-        emotions_accum = []
+        timeline = TimelineStats(self.emotion_keys)
+        deduper = FrameDeduper()
+        gate = FaceGate()
+        last_scores = None
+        last_has_face = True
         frame_count = 0
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_count += 1
-            if frame_count % frame_skip != 0:
-                continue
-            try:
-                result = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
-                emotions_accum.append([float(result['emotion'].get(k, 0.0)) for k in self.emotion_keys])
-            except Exception as e:
-                print(f"Error analyzing video frame {frame_count}: {e}")
-                continue
-
-        cap.release()
-        if emotions_accum:
-            avg_emotions = np.mean(emotions_accum, axis=0)
-            return dict(zip(self.emotion_keys, avg_emotions))
-        else:
-            print("No valid frames analyzed, using fallback emotions")
-            return self._fallback_emotions()
+        try:
+            while True:
+                # Stop within one frame once the request is abandoned
+                check_cancelled()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+                if frame_count % frame_skip != 0:
+                    continue
+                if deduper.is_duplicate(frame):
+                    if last_has_face:
+                        timeline.add(last_scores)
+                    else:
+                        timeline.no_face += 1
+                    continue
+                # Cheap cascade on a downscaled copy before the expensive model
+                last_has_face = gate.has_face(frame)
+                if not last_has_face:
+                    timeline.no_face += 1
+                    continue
+                try:
+                    result = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
+                    if isinstance(result, list):
+                        result = result[0]
+                    last_scores = [float(result['emotion'].get(k, 0.0)) for k in self.emotion_keys]
+                    timeline.add(last_scores)
+                except Exception as e:
+                    print(f"Error analyzing video frame {frame_count}: {e}")
+                    deduper.forget()
+                    continue
+        finally:
+            cap.release()
+        timeline.skipped = deduper.skipped
+        timeline.rejected = gate.rejected
+        return timeline if timeline.count or timeline.no_face else None
 
-    def predict_depression(self, emotions: Dict[str, float]) -> Dict[str, Any]:
+    def predict_depression(self, emotions: Dict[str, float],
+                           timeline: Optional[TimelineStats] = None) -> Dict[str, Any]:
         """
-        Predict depression risk using the trained model.
-        :param emotions: Dict of emotion probabilities
+        Predict depression risk using the emotion-feature risk model.
+        :param emotions: Dict of emotion scores (any scale)
+        :param timeline: Frame statistics for videos (adds emotion variability)
         """
-        features = np.array(list(emotions.values())).reshape(1, -1)
-        try:
-            pred = self.clf.predict(features)[0]
-            conf = float(self.clf.predict_proba(features).max())
-        except:
-            pred, conf = "unknown", 0.0
-        return {"diagnosis": pred, "confidence": conf}
+        loaded = self._pinned or risk_model.get()
+        if loaded is None:
+            return {"diagnosis": "unknown", "confidence": 0.0, "model_version": None}
+        return {**loaded.model.assess(emotions, timeline), "model_version": loaded.version}
 
-    def analyze_image(self, file_path: str) -> Dict[str, Any]:
+    def analyze_image(self, file_path: str, multi_face: bool = False, aggregate: str = None) -> Dict[str, Any]:
         """
         Analyze an image for emotions and depression risk.
+        :param multi_face: Analyze every face (one batch) instead of the first
+        :param aggregate: How per-face emotions are combined ("mean", "area", "largest")
         """
+        if multi_face:
+            return analyze_group_image(self, file_path, aggregate)
+        if not FaceGate().image_has_face(file_path):
+            return no_face_result("image", file_path)
         emotions = self.extract_emotions_image(file_path)
         depression = self.predict_depression(emotions)
         return {
@@ -172,12 +277,16 @@ class DeepFaceAnalyzer:
         """
         Analyze a video for emotions and depression risk.
         """
-        emotions = self.extract_emotions_video(file_path)
-        depression = self.predict_depression(emotions)
+        timeline = self.extract_video_timeline(file_path)
+        if timeline is not None and not timeline.count:
+            return no_face_result("video", file_path, timeline.frame_stats())
+        emotions = timeline.to_dict() if timeline else self._fallback_emotions()
+        depression = self.predict_depression(emotions, timeline)
         return {
             "type": "video",
             "file_path": file_path,
             "emotions": emotions,
+            "frames": timeline.frame_stats() if timeline else None,
             **depression
         }
 
@@ -0,0 +1,46 @@
+"""
+Emotion analyzer selection shared by the HTTP views and websocket consumers.
+
+Backends are tried in order of preference (DeepFace, simple, basic) once per
+process. get_shared_analyzer() returns one long-lived instance so streaming
+consumers don't reload models per connection.
+"""
+
+import threading
+
+# Try to import analyzers in order of preference
+try:
+    from api.utils.analysis import DeepFaceAnalyzer
+    ANALYZER_AVAILABLE = True
+    print("✅ Using DeepFace analyzer")
+except ImportError as e:
+    print(f"⚠️ DeepFace not available: {e}")
+    try:
+        from api.utils.simple_analysis import SimpleEmotionAnalyzer as DeepFaceAnalyzer
+        ANALYZER_AVAILABLE = True
+        print("✅ Using simple emotion analyzer")
+    except ImportError as e2:
+        print(f"⚠️ Simple analyzer not available: {e2}")
+        try:
+            from api.utils.basic_analysis import BasicEmotionAnalyzer as DeepFaceAnalyzer
+            ANALYZER_AVAILABLE = True
+            print("✅ Using basic emotion analyzer")
+        except ImportError as e3:
+            print(f"❌ No analyzer available: {e3}")
+            DeepFaceAnalyzer = None
+            ANALYZER_AVAILABLE = False
+
+_shared_analyzer = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_analyzer():
+    """Process-wide analyzer instance (raises if none can be built)."""
+    global _shared_analyzer
+    if _shared_analyzer is None:
+        with _shared_lock:
+            if _shared_analyzer is None:
+                if not ANALYZER_AVAILABLE:
+                    raise RuntimeError("No emotion analyzer available")
+                _shared_analyzer = DeepFaceAnalyzer()
+    return _shared_analyzer
@@ -0,0 +1,135 @@
+"""
+Multimodal assessment: text diagnosis and media analysis in parallel.
+
+The text model and the emotion analyzer are independent, so they run
+side by side on a shared thread pool (DeepFace, NumPy and scikit-learn
+release the GIL for the heavy parts) and the request waits for the slower
+branch, not the sum. Their diagnoses use different label sets, so both are
+mapped onto one severity scale and fused with confidence weights before a
+single advice generation.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+from api.utils.analyzers import get_shared_analyzer
+from api.utils.cancellation import Cancelled, run_in_context
+from api.utils.gemma_runtime import gemma
+from api.utils.inference import diagnose_text
+from api.utils.remedies import SEVERITY, personalize_remedies
+from api.utils.singleflight import analysis_flight
+
+FUSED_LABELS = ['low_risk', 'moderate_risk', 'high_risk']
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.ASSESSMENT['WORKERS'], thread_name_prefix='assessment'
+)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def _branch_result(future, name: str, timings: Dict[str, float]) -> Optional[Dict[str, Any]]:
+    """A failed branch degrades to an error entry; the other branch still counts."""
+    if future is None:
+        return None
+    try:
+        result, timings[f'{name}_ms'] = future.result()
+        return result
+    except Cancelled:
+        raise
+    except Exception as e:
+        print(f"Error in {name} branch: {e}")
+        return {'error': f'{name} analysis failed: {e}'}
+
+
+def _analyze_media(media_path: str, media_type: str, content_hash: str = '') -> Dict[str, Any]:
+    analyzer = get_shared_analyzer()
+    analyze = analyzer.analyze_video if media_type == 'video' else analyzer.analyze_image
+    if not content_hash:
+        return analyze(media_path)
+    result = analysis_flight.do(f'{media_type}:{content_hash}', analyze, media_path)
+    return {**result, 'file_path': media_path}
+
+
+def fuse_scores(*branches: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Confidence-weighted severity over the branches that produced a known label.
+    Returns the fused diagnosis, the mean branch confidence and the 0-2 severity.
+    """
+    scored = []
+    for branch in branches:
+        if not branch or 'error' in branch:
+            continue
+        severity = SEVERITY.get(str(branch.get('diagnosis', '')).lower())
+        if severity is None:
+            continue
+        scored.append((severity, max(float(branch.get('confidence') or 0.0), 1e-3)))
+    if not scored:
+        return {'diagnosis': 'unknown', 'confidence': 0.0, 'severity': None}
+
+    weight = sum(c for _, c in scored)
+    severity = sum(s * c for s, c in scored) / weight
+    label = FUSED_LABELS[min(int(round(severity)), len(FUSED_LABELS) - 1)]
+    return {
+        'diagnosis': label,
+        'confidence': weight / len(scored),
+        'severity': round(severity, 3),
+    }
+
+
+def _advice_prompt(text: str, media: Optional[Dict[str, Any]], fused: Dict[str, Any]) -> str:
+    parts = []
+    if text:
+        parts.append(f"The user wrote: \"{text[:500]}\".")
+    if media and 'error' not in media and media.get('emotions'):
+        parts.append(f"Emotions detected in their {media.get('type', 'image')}: {media.get('emotions', {})}.")
+    parts.append(f"Combined assessment: {fused['diagnosis']} (confidence {fused['confidence']:.2f}).")
+    return (
+        "Based on this summary, write a short, warm, 2-3 sentence, practical guidance "
+        "without medical claims: " + " ".join(parts)
+    )
+
+
+def run_assessment(text: str = '', media_path: Optional[str] = None,
+                   media_type: str = 'image', content_hash: str = '') -> Dict[str, Any]:
+    """
+    Run the text and media branches concurrently, fuse them, then generate
+    one piece of advice for the combined picture.
+    :param content_hash: Upload hash; identical uploads in flight share one analysis
+    """
+    started = time.perf_counter()
+    # run_in_context: branches see the request's cancellation token
+    text_future = run_in_context(_executor, _timed, diagnose_text, text) if text else None
+    media_future = run_in_context(_executor, _timed, _analyze_media, media_path, media_type, content_hash) if media_path else None
+
+    timings = {}
+    text_result = _branch_result(text_future, 'text', timings)
+    media_result = _branch_result(media_future, 'media', timings)
+
+    fused = fuse_scores(text_result, media_result)
+    remedies = personalize_remedies(text, fused['diagnosis'])
+
+    advice_started = time.perf_counter()
+    try:
+        advice = gemma.generate(_advice_prompt(text, media_result, fused))
+    except Exception as e:
+        print(f"Error generating advice: {e}")
+        advice = "I'm here to support you. Please take care of yourself and consider reaching out to a trusted person or professional if you need additional support."
+    timings['advice_ms'] = (time.perf_counter() - advice_started) * 1000
+    timings['total_ms'] = (time.perf_counter() - started) * 1000
+
+    return {
+        'text_diagnosis': text_result,
+        'media_analysis': media_result,
+        **fused,
+        'remedies': remedies,
+        'advice': advice,
+        'timings': {k: round(v, 1) for k, v in timings.items()},
+    }
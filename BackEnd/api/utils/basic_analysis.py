@@ -1,23 +1,39 @@
 """
-Basic Emotion Analysis without any external dependencies
-Pure Python implementation for demo purposes
+Basic Emotion Analysis without any heavy dependencies
+Uses the lightweight NumPy emotion model when NumPy/OpenCV are installed,
+otherwise reports neutral default emotions
 """
 
 import os
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+try:
+    from api.utils.frame_filters import FaceGate, no_face_result
+    from api.utils.lite_emotion import get_lite_model
+    from api.utils.multi_face import analyze_group_image
+except ImportError:
+    FaceGate = None
+    analyze_group_image = None
+    get_lite_model = lambda: None
+
+try:
+    from api.utils.model_registry import risk_model
+except ImportError:
+    risk_model = None
 
 class BasicEmotionAnalyzer:
-    """Basic emotion analyzer with no external dependencies"""
+    """Basic emotion analyzer with no heavy dependencies"""
     
     def __init__(self):
         """Initialize the basic analyzer"""
         self.emotion_keys = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-        print("✅ Basic emotion analyzer initialized (no dependencies)")
+        self.lite_model = get_lite_model()
+        print("✅ Basic emotion analyzer initialized (no heavy dependencies)")
     
     def extract_emotions_image(self, img_path: str) -> Dict[str, float]:
         """ 
-        Extract emotions from an image using basic file analysis.
+        Extract emotions from an image using the lite NumPy model.
         """
         print(f"📸 Analyzing image: {img_path}")
         
@@ -34,12 +50,46 @@ class BasicEmotionAnalyzer:
         
         print(f"📊 File size: {file_size} bytes")
         
-        # Generate emotions based on file characteristics
-        emotions = self._generate_emotions_from_file(img_path, file_size)
-        print(f"🎭 Generated emotions: {emotions}")
+        emotions = None
+        if self.lite_model is not None:
+            emotions = self.lite_model.extract_emotions_image(img_path)
+        if emotions is None:
+            print("⚠️ No emotion model available for this image, using default emotions")
+            return self._get_default_emotions()
         
+        print(f"🎭 Detected emotions: {emotions}")
         return emotions
     
+    def extract_emotions_video(self, video_path: str, frame_skip: int = 30) -> Dict[str, float]:
+        """
+        Extract averaged emotions from sampled video frames using the lite model.
+        """
+        timeline = self.extract_video_timeline(video_path, frame_skip)
+        if timeline is None or not timeline.count:
+            print("⚠️ No emotion model available for this video, using default emotions")
+            return self._get_default_emotions()
+        return timeline.to_dict()
+    
+    def extract_video_timeline(self, video_path: str, frame_skip: int = 30):
+        """
+        Per-emotion mean/std over sampled video frames (None if unavailable).
+        """
+        print(f"🎬 Analyzing video: {video_path}")
+        if self.lite_model is None or not os.path.exists(video_path):
+            return None
+        return self.lite_model.extract_video_timeline(video_path, frame_skip=frame_skip)
+    
+    def extract_emotions_frame(self, frame) -> Optional[Dict[str, float]]:
+        """
+        Extract emotions from a decoded BGR frame using the lite model.
+        Returns None when the frame has no face.
+        """
+        if FaceGate is not None and not FaceGate().has_face(frame):
+            return None
+        if self.lite_model is None:
+            return self._get_default_emotions()
+        return self.lite_model.to_dict(self.lite_model.predict_images([frame])[0])
+    
     def _get_default_emotions(self) -> Dict[str, float]:
         """Get default neutral emotions"""
         return {
@@ -52,37 +102,16 @@ class BasicEmotionAnalyzer:
             'neutral': 0.60
         }
     
-    def _generate_emotions_from_file(self, file_path: str, file_size: int) -> Dict[str, float]:
-        """Generate emotions based on file characteristics"""
-        # Use file size and name to create variation
-        filename = os.path.basename(file_path)
-        
-        # Create hash-like value from filename for consistency
-        filename_hash = sum(ord(c) for c in filename) % 100
-        size_factor = (file_size % 1000) / 1000.0
-        
-        # Combine factors for emotion generation
-        base_factor = (filename_hash / 100.0 + size_factor) / 2.0
-        
-        # Generate emotions with some variation
-        emotions = {
-            'angry': max(0.01, 0.08 - base_factor * 0.05),
-            'disgust': max(0.01, 0.04 - base_factor * 0.02),
-            'fear': max(0.01, 0.06 - base_factor * 0.03),
-            'happy': max(0.1, 0.25 + base_factor * 0.15),
-            'sad': max(0.05, 0.15 - base_factor * 0.08),
-            'surprise': max(0.02, 0.08 + base_factor * 0.05),
-            'neutral': max(0.3, 0.45 - base_factor * 0.1)
-        }
-        
-        # Normalize to sum to approximately 1
-        total = sum(emotions.values())
-        return {k: v / total for k, v in emotions.items()}
-    
-    def predict_depression(self, emotions: Dict[str, float]) -> Dict[str, Any]:
+    def predict_depression(self, emotions: Dict[str, float], timeline=None) -> Dict[str, Any]:
         """
-        Predict depression risk using basic emotion analysis.
+        Predict depression risk with the risk model when NumPy and a trained
+        model are available, otherwise basic emotion analysis.
+        :param timeline: Frame statistics for videos (adds emotion variability)
         """
+        loaded = risk_model.get() if risk_model is not None else None
+        if loaded is not None:
+            return {**loaded.model.assess(emotions, timeline), "model_version": loaded.version}
+        
         # Simple heuristic based on emotion patterns
         sad_score = emotions.get('sad', 0.0)
         fear_score = emotions.get('fear', 0.0)
@@ -113,13 +142,20 @@ class BasicEmotionAnalyzer:
         
         return {
             "diagnosis": diagnosis,
-            "confidence": confidence
+            "confidence": confidence,
+            "model_version": "heuristic"
         }
     
-    def analyze_image(self, file_path: str) -> Dict[str, Any]:
+    def analyze_image(self, file_path: str, multi_face: bool = False, aggregate: str = None) -> Dict[str, Any]:
         """
         Analyze an image for emotions and depression risk.
+        :param multi_face: Analyze every face (one batch) instead of the first
+        :param aggregate: How per-face emotions are combined ("mean", "area", "largest")
         """
+        if multi_face and analyze_group_image is not None:
+            return analyze_group_image(self, file_path, aggregate)
+        if FaceGate is not None and not FaceGate().image_has_face(file_path):
+            return no_face_result("image", file_path)
         emotions = self.extract_emotions_image(file_path)
         depression = self.predict_depression(emotions)
         
@@ -134,14 +170,17 @@ class BasicEmotionAnalyzer:
         """
         Analyze a video for emotions and depression risk.
         """
-        # For basic analyzer, treat video same as image
-        emotions = self.extract_emotions_image(file_path)
-        depression = self.predict_depression(emotions)
+        timeline = self.extract_video_timeline(file_path)
+        if timeline is not None and not timeline.count:
+            return no_face_result("video", file_path, timeline.frame_stats())
+        emotions = timeline.to_dict() if timeline else self._get_default_emotions()
+        depression = self.predict_depression(emotions, timeline)
         
         return {
             "type": "video",
             "file_path": file_path,
             "emotions": emotions,
+            "frames": timeline.frame_stats() if timeline else None,
             **depression
         }
 
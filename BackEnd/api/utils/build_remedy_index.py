@@ -0,0 +1,55 @@
+"""
+Build the BM25 remedy index (remedies.py) ahead of time.
+
+For small libraries the index is built from remedies.json when the server
+starts. For larger remedy corpora, build it once and point
+REMEDIES['INDEX_PATH'] at the result (the default path is picked up
+automatically).
+
+Input: remedies.json layout ({"remedies": [{"text", "categories",
+"severity": [min, max], "keywords", "pin"}, ...]}), the older
+{"category": [tips]} layout, or JSON Lines with one remedy per line.
+
+Usage (from BackEnd/):
+  python -m api.utils.build_remedy_index --input remedies.jsonl
+
+Outputs:
+  - api/models/remedy_index.npz (or --output)
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from api.utils.remedies import DEFAULT_INDEX_PATH, REMEDIES_PATH, RemedyIndex, load_library
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=REMEDIES_PATH, type=str,
+                        help="Remedy library (.json or .jsonl)")
+    parser.add_argument("--output", default=DEFAULT_INDEX_PATH, type=str)
+    parser.add_argument("--k1", type=float, default=1.2, help="BM25 term-frequency saturation")
+    parser.add_argument("--b", type=float, default=0.75, help="BM25 length normalization")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        raise FileNotFoundError(f"Remedy library not found: {args.input}")
+
+    started = time.perf_counter()
+    entries = load_library(args.input)
+    index = RemedyIndex.build(entries, k1=args.k1, b=args.b)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    index.save(args.output)
+    print(f"Indexed {len(entries):,} remedies, {len(index.terms):,} terms "
+          f"in {time.perf_counter() - started:.2f}s: {args.output}")
+
+    started = time.perf_counter()
+    for _ in range(100):
+        index.search("I can't sleep and keep worrying about my exams", k=5, severity=1.0)
+    print(f"Search: {(time.perf_counter() - started) * 10:.3f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
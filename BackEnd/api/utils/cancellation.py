@@ -0,0 +1,129 @@
+"""
+Cooperative cancellation for analysis and generation work.
+
+A CancellationToken lives in a context variable for the duration of a
+request. CancellationMiddleware (ASGI) creates one per HTTP request and
+cancels it when the client disconnects; admission_controlled() narrows it
+with the endpoint's execution deadline. Long-running code calls
+check_cancelled() at safe points - between sampled video frames, before an
+LLM call - and stops with `Cancelled` once the client is gone or the
+deadline has passed.
+
+Cancelled derives from BaseException, like asyncio.CancelledError, so the
+broad `except Exception` fallbacks in the analyzers don't swallow it.
+Context variables don't follow work into thread pools on their own: submit
+through run_in_context().
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class Cancelled(BaseException):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+CLIENT_DISCONNECTED = "client disconnected"
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+
+class CancellationToken:
+    def __init__(self, deadline: Optional[float] = None, parent: "CancellationToken" = None):
+        """
+        :param deadline: time.monotonic() value after which the token counts as cancelled
+        :param parent: Token whose cancellation also cancels this one
+        """
+        self.deadline = deadline
+        self.parent = parent
+        self._reason: Optional[str] = None
+
+    def cancel(self, reason: str = CLIENT_DISCONNECTED) -> None:
+        if self._reason is None:
+            self._reason = reason
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self._reason is not None:
+            return self._reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return DEADLINE_EXCEEDED
+        return self.parent.reason if self.parent is not None else None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def raise_if_cancelled(self) -> None:
+        reason = self.reason
+        if reason is not None:
+            raise Cancelled(reason)
+
+    def child(self, timeout: Optional[float]) -> "CancellationToken":
+        """Token cancelled with this one or after `timeout` seconds, whichever is first."""
+        deadline = time.monotonic() + timeout if timeout else None
+        return CancellationToken(deadline, parent=self)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("cancellation_token", default=None)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current.get()
+
+
+def check_cancelled() -> None:
+    """Raise Cancelled if the current request was abandoned or ran out of time."""
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancellation_scope(timeout: Optional[float] = None):
+    """Run a block under a child of the current token with an optional deadline."""
+    parent = _current.get()
+    token = parent.child(timeout) if parent is not None else CancellationToken(
+        time.monotonic() + timeout if timeout else None
+    )
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def run_in_context(executor, fn, *args):
+    """executor.submit that carries the caller's cancellation token into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class CancellationMiddleware:
+    """
+    ASGI middleware: one token per HTTP request, cancelled on http.disconnect.
+    Django listens for the disconnect while the view runs; this sees the same
+    message and tells the (possibly threaded) view to stop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = CancellationToken()
+
+        async def receive_and_watch():
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                token.cancel(CLIENT_DISCONNECTED)
+            return message
+
+        reset = _current.set(token)
+        try:
+            return await self.app(scope, receive_and_watch, send)
+        finally:
+            _current.reset(reset)
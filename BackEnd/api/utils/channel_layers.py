@@ -0,0 +1,544 @@
+"""
+Channel layers for deployments that don't need Redis.
+
+- LocalChannelLayer: in-process layer for single-worker deployments. Unlike
+  channels' InMemoryChannelLayer it never scans every channel/group on
+  send/receive (expiry is checked lazily on the touched queue), hands
+  messages straight to a waiting receiver, and only deep-copies messages
+  that contain mutable values. Its state is guarded by a lock, since
+  background threads (advice.py) send through async_to_sync.
+- UnixSocketChannelLayer: several workers on one host. One worker (elected
+  by a file lock) runs a small hub on a Unix domain socket in a background
+  thread; every worker connects to it and the hub routes messages and group
+  fan-out. If the hub's worker exits, the others re-elect on reconnect.
+
+Multi-node deployments should keep using channels_redis (see
+CHANNEL_LAYERS in core/settings.py).
+"""
+
+import asyncio
+import atexit
+import fcntl
+import marshal
+import os
+import random
+import string
+import struct
+import threading
+import time
+from collections import deque
+from copy import deepcopy
+from typing import Any, Dict, Optional
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+def _copy_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Shallow copy for flat messages, deep copy otherwise."""
+    for value in message.values():
+        if not isinstance(value, _IMMUTABLE):
+            return deepcopy(message)
+    return dict(message)
+
+
+def _random_suffix(length: int = 12) -> str:
+    return "".join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+def _process_token(channel: str) -> Optional[str]:
+    """Token of the process owning a specific channel ("prefix.<token>!suffix")."""
+    bang = channel.find("!")
+    if bang < 0:
+        return None
+    return channel[:bang].rsplit(".", 1)[-1]
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _Channel:
+    __slots__ = ("messages", "waiters")
+
+    def __init__(self):
+        self.messages = deque()
+        self.waiters = deque()
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """Optimized in-process channel layer (groups + flush extensions)."""
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.group_expiry = group_expiry
+        self.channels: Dict[str, _Channel] = {}
+        self.groups: Dict[str, Dict[str, float]] = {}
+        self.channel_groups: Dict[str, set] = {}
+        # Reentrant: delivery drops expired messages, which updates groups
+        self._lock = threading.RLock()
+
+    def _deliver(self, channel: str, message: Dict[str, Any]) -> None:
+        """Synchronously hand a message to a waiter or queue it."""
+        with self._lock:
+            state = self.channels.get(channel)
+            if state is None:
+                state = self.channels[channel] = _Channel()
+            while state.waiters:
+                waiter = state.waiters.popleft()
+                if waiter.done():
+                    continue
+                loop = waiter.get_loop()
+                if _running_loop() is loop:
+                    waiter.set_result(message)
+                else:
+                    # Sent from another thread (e.g. async_to_sync in a worker pool)
+                    loop.call_soon_threadsafe(self._resolve, channel, waiter, message)
+                return
+            self._drop_expired(channel, state)
+            if len(state.messages) >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            state.messages.append((time.monotonic() + self.expiry, message))
+
+    def _resolve(self, channel: str, waiter: asyncio.Future, message: Dict[str, Any]) -> None:
+        with self._lock:
+            if waiter.done():
+                self._deliver(channel, message)   # receiver gave up meanwhile
+            else:
+                waiter.set_result(message)
+
+    def _drop_expired(self, channel: str, state: _Channel) -> None:
+        now = time.monotonic()
+        expired = False
+        while state.messages and state.messages[0][0] < now:
+            state.messages.popleft()
+            expired = True
+        if expired:
+            # An unread, expired message means the consumer is gone
+            self._remove_from_groups(channel)
+
+    def _remove_from_groups(self, channel: str) -> None:
+        for group in self.channel_groups.pop(channel, ()):
+            members = self.groups.get(group)
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del self.groups[group]
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        self._deliver(channel, _copy_message(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        waiter = None
+        with self._lock:
+            state = self.channels.get(channel)
+            if state is None:
+                state = self.channels[channel] = _Channel()
+            self._drop_expired(channel, state)
+            if state.messages:
+                message = state.messages.popleft()[1]
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                state.waiters.append(waiter)
+        if waiter is not None:
+            try:
+                message = await waiter
+            finally:
+                if not waiter.done() or waiter.cancelled():
+                    with self._lock:
+                        try:
+                            state.waiters.remove(waiter)
+                        except ValueError:
+                            pass
+        with self._lock:
+            if not state.messages and not state.waiters and self.channels.get(channel) is state:
+                del self.channels[channel]
+        return message
+
+    async def new_channel(self, prefix="specific."):
+        return f"{prefix}.local!{_random_suffix()}"
+
+    async def flush(self):
+        with self._lock:
+            for state in self.channels.values():
+                for waiter in state.waiters:
+                    waiter.cancel()
+            self.channels = {}
+            self.groups = {}
+            self.channel_groups = {}
+
+    async def close(self):
+        pass
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        with self._lock:
+            self.groups.setdefault(group, {})[channel] = time.monotonic()
+            self.channel_groups.setdefault(channel, set()).add(group)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        with self._lock:
+            members = self.groups.get(group)
+            if members:
+                members.pop(channel, None)
+                if not members:
+                    del self.groups[group]
+            groups = self.channel_groups.get(channel)
+            if groups:
+                groups.discard(group)
+                if not groups:
+                    del self.channel_groups[channel]
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self._group_deliver(group, message)
+
+    def _group_deliver(self, group: str, message: Dict[str, Any]) -> None:
+        with self._lock:
+            members = self.groups.get(group)
+            if not members:
+                return
+            cutoff = time.monotonic() - self.group_expiry
+            for channel, joined in list(members.items()):
+                if joined < cutoff:
+                    members.pop(channel, None)
+                    continue
+                try:
+                    self._deliver(channel, _copy_message(message))
+                except ChannelFull:
+                    pass
+
+
+# --- Unix socket layer -------------------------------------------------------
+
+_HEADER = struct.Struct("!I")
+_OP_SEND, _OP_GROUP_ADD, _OP_GROUP_DISCARD, _OP_GROUP_SEND, _OP_LISTEN, _OP_HELLO, _OP_FLUSH = range(7)
+
+
+async def _write_frame(writer: asyncio.StreamWriter, frame) -> None:
+    payload = marshal.dumps(frame)
+    writer.write(_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    size = _HEADER.unpack(await reader.readexactly(_HEADER.size))[0]
+    return marshal.loads(await reader.readexactly(size))
+
+
+class _Hub:
+    """
+    Message router shared by the workers on one host.
+    Runs in its own thread/event loop inside whichever worker holds the lock.
+    """
+
+    def __init__(self, path: str, expiry: float, capacity: int, group_expiry: float):
+        self.path = path
+        self.expiry = expiry
+        self.capacity = capacity
+        self.group_expiry = group_expiry
+        self.processes: Dict[str, asyncio.StreamWriter] = {}
+        self.listeners: Dict[str, list] = {}
+        self.pending: Dict[str, deque] = {}
+        self.groups: Dict[str, Dict[str, float]] = {}
+
+    def start(self) -> None:
+        ready = threading.Event()
+        thread = threading.Thread(target=self._run, args=(ready,), name="channel-hub", daemon=True)
+        thread.start()
+        ready.wait(5)
+
+    def _run(self, ready: threading.Event) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = loop.run_until_complete(asyncio.start_unix_server(self._serve, path=self.path))
+        os.chmod(self.path, 0o600)
+        ready.set()
+        loop.run_forever()
+
+    def _route(self, channel: str) -> Optional[asyncio.StreamWriter]:
+        token = _process_token(channel)
+        if token is not None:
+            return self.processes.get(token)
+        writers = self.listeners.get(channel)
+        if writers:
+            writers.append(writers.pop(0))  # round-robin across workers
+            return writers[-1]
+        return None
+
+    async def _deliver(self, channel: str, message) -> None:
+        writer = self._route(channel)
+        if writer is not None and not writer.is_closing():
+            await _write_frame(writer, (channel, message))
+            return
+        pending = self.pending.setdefault(channel, deque())
+        now = time.monotonic()
+        while pending and pending[0][0] < now:
+            pending.popleft()
+        if len(pending) < self.capacity:
+            pending.append((now + self.expiry, message))
+
+    async def _flush_pending(self, match) -> None:
+        now = time.monotonic()
+        for channel in [c for c in self.pending if match(c)]:
+            writer = self._route(channel)
+            if writer is None:
+                continue
+            for expires, message in self.pending.pop(channel):
+                if expires >= now:
+                    await _write_frame(writer, (channel, message))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                op, a, b = await _read_frame(reader)
+                if op == _OP_SEND:
+                    await self._deliver(a, b)
+                elif op == _OP_GROUP_SEND:
+                    members = self.groups.get(a, {})
+                    cutoff = time.monotonic() - self.group_expiry
+                    for channel, joined in list(members.items()):
+                        if joined < cutoff:
+                            members.pop(channel, None)
+                        else:
+                            await self._deliver(channel, b)
+                elif op == _OP_GROUP_ADD:
+                    self.groups.setdefault(a, {})[b] = time.monotonic()
+                elif op == _OP_GROUP_DISCARD:
+                    members = self.groups.get(a)
+                    if members:
+                        members.pop(b, None)
+                        if not members:
+                            del self.groups[a]
+                elif op == _OP_HELLO:
+                    self.processes[a] = writer
+                    await self._flush_pending(lambda c: _process_token(c) == a)
+                elif op == _OP_LISTEN:
+                    self.listeners.setdefault(a, []).append(writer)
+                    await self._flush_pending(lambda c: c == a)
+                elif op == _OP_FLUSH:
+                    self.pending.clear()
+                    self.groups.clear()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.processes = {t: w for t, w in self.processes.items() if w is not writer}
+            for channel, writers in list(self.listeners.items()):
+                writers[:] = [w for w in writers if w is not writer]
+                if not writers:
+                    del self.listeners[channel]
+            writer.close()
+
+
+class UnixSocketChannelLayer(LocalChannelLayer):
+    """
+    Channel layer for several worker processes on one host.
+    Delivery to this process goes through the inherited local queues; the
+    hub only forwards frames between processes. The hub connection belongs
+    to the layer's own event loop thread, so the process is registered once,
+    however many loops (e.g. async_to_sync in worker threads) send through it:
+    ops are queued in order to that thread, which writes them in batches.
+    """
+
+    def __init__(self, path="/tmp/depressoassist-channels.sock", expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, group_expiry=group_expiry, capacity=capacity,
+                         channel_capacity=channel_capacity, **kwargs)
+        self.path = path
+        self.token = f"{os.getpid()}{_random_suffix(6)}"
+        self._io_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._io_start = threading.Lock()
+        self._conn = None
+        self._connecting: Optional[asyncio.Lock] = None
+        self._outbox: deque = deque()
+        self._outbox_ready: Optional[asyncio.Event] = None
+        self._listening = set()
+        self._memberships = set()
+        self._lock_file = None
+
+    def _ensure_hub(self) -> None:
+        """Become the hub if no other worker holds the lock."""
+        if self._lock_file is not None:
+            return
+        lock_file = open(self.path + ".lock", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return
+        self._lock_file = lock_file  # held for the life of the process
+        _Hub(self.path, self.expiry, self.capacity, self.group_expiry).start()
+
+    def _loop(self) -> asyncio.AbstractEventLoop:
+        """The layer's I/O loop, started on first use in a daemon thread."""
+        with self._io_start:
+            if self._io_loop is None:
+                loop = asyncio.new_event_loop()
+                self._outbox_ready = asyncio.Event()
+                loop.call_soon(loop.create_task, self._write_outbox())
+                threading.Thread(target=loop.run_forever, name="channel-layer-io", daemon=True).start()
+                atexit.register(self._stop_loop, loop)
+                self._io_loop = loop
+            return self._io_loop
+
+    @staticmethod
+    def _stop_loop(loop: asyncio.AbstractEventLoop) -> None:
+        """Cancel the I/O loop's tasks and stop it (at exit, so they don't die pending)."""
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            loop.stop()
+
+        if loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=1)
+            except Exception:
+                pass
+
+    async def _on_io_loop(self, coro):
+        """Run a coroutine on the I/O loop and wait for it from the caller's loop."""
+        loop = self._loop()
+        if _running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def _connection(self):
+        """The hub connection (I/O loop only); (re)connects and re-registers as needed."""
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._conn is not None and not self._conn[1].is_closing():
+                return self._conn
+            for attempt in range(50):
+                try:
+                    reader, writer = await asyncio.open_unix_connection(self.path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    self._ensure_hub()
+                    await asyncio.sleep(0.02 * (attempt + 1))
+            else:
+                raise ConnectionError(f"Channel hub not reachable at {self.path}")
+            await _write_frame(writer, (_OP_HELLO, self.token, None))
+            for channel in self._listening:
+                await _write_frame(writer, (_OP_LISTEN, channel, None))
+            for group, channel in self._memberships:
+                await _write_frame(writer, (_OP_GROUP_ADD, group, channel))
+            self._conn = (reader, writer)
+            asyncio.get_running_loop().create_task(self._pump(reader, writer))
+            return self._conn
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Move frames from the hub into the local queues."""
+        try:
+            while True:
+                channel, message = await _read_frame(reader)
+                try:
+                    self._deliver(channel, message)
+                except ChannelFull:
+                    pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()   # next op reconnects (and re-elects a hub if needed)
+
+    async def _write_outbox(self) -> None:
+        """I/O loop task: write queued ops to the hub, oldest first."""
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            while self._outbox:
+                batch = [self._outbox.popleft() for _ in range(len(self._outbox))]
+                payload = b"".join(batch)
+                for attempt in range(2):
+                    try:
+                        _, writer = await self._connection()
+                        writer.write(payload)
+                        await writer.drain()
+                        break
+                    except ConnectionError as e:
+                        if self._conn is not None:
+                            self._conn[1].close()
+                        if attempt:
+                            print(f"⚠️ Channel hub unreachable, dropped {len(batch)} ops: {e}")
+
+    def _enqueue(self, frame: bytes) -> None:
+        self._outbox.append(frame)
+        self._outbox_ready.set()
+
+    async def _send_op(self, op: int, a, b=None) -> None:
+        # Encoded here, so unserializable messages still raise in the sender
+        payload = marshal.dumps((op, a, b))
+        frame = _HEADER.pack(len(payload)) + payload
+        loop = self._loop()
+        if _running_loop() is loop:
+            self._enqueue(frame)
+        else:
+            loop.call_soon_threadsafe(self._enqueue, frame)
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        if _process_token(channel) == self.token:
+            self._deliver(channel, _copy_message(message))
+        else:
+            await self._send_op(_OP_SEND, channel, message)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if "!" not in channel and channel not in self._listening:
+            self._listening.add(channel)
+            await self._send_op(_OP_LISTEN, channel)
+        elif self._conn is None or self._conn[1].is_closing():
+            await self._on_io_loop(self._connection())
+        return await super().receive(channel)
+
+    async def new_channel(self, prefix="specific."):
+        return f"{prefix}.{self.token}!{_random_suffix()}"
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._memberships.add((group, channel))
+        await self._send_op(_OP_GROUP_ADD, group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._memberships.discard((group, channel))
+        await self._send_op(_OP_GROUP_DISCARD, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        await self._send_op(_OP_GROUP_SEND, group, message)
+
+    async def flush(self):
+        await super().flush()
+        self._memberships.clear()
+        await self._send_op(_OP_FLUSH, None)
+
+    async def close(self):
+        if self._conn is not None:
+            self._io_loop.call_soon_threadsafe(self._conn[1].close)
+            self._conn = None
@@ -0,0 +1,22 @@
+"""
+Settings access for the api.utils modules.
+
+Each subsystem reads one dict from core/settings.py (MODEL_REGISTRY, LLM,
+SINGLEFLIGHT, ...). Training and benchmark scripts import these modules
+without Django configured, so a missing or unconfigured settings module
+reads as an empty dict and callers fall back to their defaults.
+"""
+
+from typing import Any, Dict
+
+
+def settings_dict(name: str) -> Dict[str, Any]:
+    """
+    :param name: Settings attribute holding the subsystem's dict
+    :return: That dict, or {} when it is unset or Django is not configured
+    """
+    try:
+        from django.conf import settings
+        return getattr(settings, name, {}) if settings.configured else {}
+    except Exception:
+        return {}
@@ -0,0 +1,255 @@
+"""
+Server-side chat context with a rolling summary.
+
+Each session keeps a bounded window of recent turns and a compressed
+summary of everything older. When the window overflows (WINDOW_TURNS or
+WINDOW_TOKENS), the oldest turns move to a pending list and a background
+thread folds them into the summary with one LLM call. Only new turns are
+summarized, never the whole history. Prompts are built from the summary,
+then as many recent turns as fit, newest first, within PROMPT_TOKENS.
+Prompt size therefore stays bounded however long the conversation runs.
+Clients send only the new message.
+
+Sessions live in a per-worker LRU. The summary is also saved on
+ChatSession.summary, so another worker, or this one after a restart, picks
+it up together with the latest turns from ChatMessage.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from django.conf import settings
+
+from api.utils import metrics
+
+SYSTEM_PROMPT = "You are an empathetic assistant. Keep responses concise and supportive.\n"
+
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-summary')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) without a tokenizer."""
+    return len(text) // 4 + 1
+
+
+def truncate_tokens(text: str, budget: int, keep_end: bool = False) -> str:
+    limit = budget * 4
+    if len(text) <= limit:
+        return text
+    return "..." + text[3 - limit:] if keep_end else text[:limit - 3] + "..."
+
+
+def _format_turn(role: str, text: str) -> str:
+    return f"{'User' if role == 'user' else 'Assistant'}: {text}\n"
+
+
+class Conversation:
+    def __init__(self, session_id: str, summary: str = '', turns: List[Tuple[str, str]] = None):
+        self.session_id = session_id
+        self.summary = summary
+        self.turns: List[Tuple[str, str]] = list(turns or [])
+        self.pending: List[Tuple[str, str]] = []   # evicted from the window, not yet summarized
+        self.summarizing = False
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    def __init__(self, window_turns: int = 12, window_tokens: int = 1200, prompt_tokens: int = 1800,
+                 summary_tokens: int = 250, message_tokens: int = 600, max_sessions: int = 2000,
+                 persist: bool = True):
+        """
+        :param window_turns, window_tokens: Recent turns kept verbatim
+        :param prompt_tokens: Budget for the whole prompt
+        :param summary_tokens: Cap on the rolling summary
+        :param message_tokens: Cap on the new user message
+        :param max_sessions: Sessions kept in memory (least recently used evicted)
+        :param persist: Load/save summaries and turns through the database
+        """
+        self.window_turns = window_turns
+        self.window_tokens = window_tokens
+        self.prompt_tokens = prompt_tokens
+        self.summary_tokens = summary_tokens
+        self.message_tokens = message_tokens
+        self.max_sessions = max_sessions
+        self.persist = persist
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Conversation:
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is not None:
+                self._sessions.move_to_end(session_id)
+        if conversation is None:
+            conversation = self._load(session_id)
+            with self._lock:
+                conversation = self._sessions.setdefault(session_id, conversation)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        return conversation
+
+    def _load(self, session_id: str) -> Conversation:
+        if not self.persist:
+            return Conversation(session_id)
+        from api.models import ChatMessage, ChatSession
+
+        summary = ChatSession.objects.filter(session_id=session_id).values_list('summary', flat=True).first() or ''
+        rows = ChatMessage.objects.filter(session_id=session_id).order_by('-id').values_list('role', 'content')
+        return Conversation(session_id, summary, list(reversed(rows[:self.window_turns])))
+
+    def build_prompt(self, session_id: str, message: str) -> str:
+        """Summary + as many recent turns as fit the budget + the new message."""
+        conversation = self.get(session_id)
+        message = truncate_tokens(message, self.message_tokens)
+        with conversation.lock:
+            summary = truncate_tokens(conversation.summary, self.summary_tokens, keep_end=True)
+            candidates = conversation.pending + conversation.turns
+
+        head = SYSTEM_PROMPT
+        if summary:
+            head += f"Summary of the conversation so far: {summary}\n"
+        tail = f"User: {message}\nAssistant:"
+        budget = self.prompt_tokens - estimate_tokens(head) - estimate_tokens(tail)
+        lines = []
+        for role, text in reversed(candidates):
+            line = _format_turn(role, text)
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            lines.append(line)
+            budget -= cost
+        metrics.inc("chat_context_turns_total", len(lines))
+        return head + "".join(reversed(lines)) + tail
+
+    def record(self, session_id: str, role: str, text: str, summarize: Callable[[str], str] = None) -> None:
+        """
+        Append a turn; when the window overflows, summarize the evicted turns
+        in the background with `summarize(prompt) -> text`, or None on failure
+        (the extractive fallback summary is used then).
+        """
+        conversation = self.get(session_id)
+        with conversation.lock:
+            if conversation.turns and conversation.turns[-1] == (role, text):
+                return  # already loaded from the database
+            conversation.turns.append((role, text))
+            while len(conversation.turns) > 2 and (
+                len(conversation.turns) > self.window_turns
+                or sum(estimate_tokens(t) for _, t in conversation.turns) > self.window_tokens
+            ):
+                conversation.pending.append(conversation.turns.pop(0))
+            start = bool(conversation.pending) and not conversation.summarizing
+            if start:
+                conversation.summarizing = True
+        if start:
+            _summary_executor.submit(self._summarize, conversation, summarize)
+
+    def respond(self, session_id: str, message: str, generate: Callable[[str], str],
+                summarize: Callable[[str], str] = None) -> str:
+        """One chat turn: build the prompt, generate, then record both turns."""
+        conversation = self.get(session_id)
+        with conversation.lock:
+            # The write-behind buffer may already hold this message when the session was loaded
+            if conversation.turns and conversation.turns[-1] == ('user', message):
+                conversation.turns.pop()
+        reply = generate(self.build_prompt(session_id, message))
+        self.record(session_id, 'user', message, summarize)
+        self.record(session_id, 'assistant', reply, summarize)
+        return reply
+
+    def _summary_prompt(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        transcript = "".join(_format_turn(role, text) for role, text in turns)
+        return (
+            "Update the running summary of a supportive chat between a user and an assistant. "
+            f"Keep it under {self.summary_tokens * 3 // 4} words, in the third person, and keep what matters "
+            "for continuing the conversation: the user's situation, feelings, concerns and what was suggested.\n"
+            f"Current summary: {summary or '(none)'}\n"
+            f"New messages:\n{transcript}"
+            "Updated summary:"
+        )
+
+    def _fallback_summary(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Extractive summary when no LLM is available: the start of each user turn."""
+        notes = [text.split('.')[0][:120] for role, text in turns if role == 'user']
+        combined = " ".join(filter(None, [summary] + [f"User said: {note}." for note in notes]))
+        return truncate_tokens(combined, self.summary_tokens, keep_end=True)
+
+    def _summarize(self, conversation: Conversation, summarize: Optional[Callable[[str], str]]) -> None:
+        while True:
+            with conversation.lock:
+                turns, conversation.pending = conversation.pending, []
+                summary = conversation.summary
+                if not turns:
+                    conversation.summarizing = False
+                    return
+            started = time.perf_counter()
+            try:
+                updated = (summarize(self._summary_prompt(summary, turns)) or '').strip() if summarize else ''
+            except Exception as e:
+                print(f"⚠️ Chat summary failed for {conversation.session_id}: {e}")
+                updated = ''
+            # No LLM output (None/empty): extend the previous summary extractively
+            updated = truncate_tokens(updated, self.summary_tokens) if updated else self._fallback_summary(summary, turns)
+            with conversation.lock:
+                conversation.summary = updated
+            metrics.inc("chat_summaries_total")
+            metrics.inc("chat_summary_ms_total", (time.perf_counter() - started) * 1000)
+            if self.persist:
+                self._save_summary(conversation.session_id, updated)
+
+    @staticmethod
+    def _save_summary(session_id: str, summary: str) -> None:
+        from django.db import close_old_connections
+
+        from api.models import ChatSession
+        try:
+            ChatSession.objects.filter(session_id=session_id).update(summary=summary)
+        except Exception as e:
+            print(f"⚠️ Could not save chat summary: {e}")
+        finally:
+            close_old_connections()
+
+
+def _llm_summarize(prompt: str) -> str:
+    from api.utils.gemma_runtime import gemma
+    # None when the LLM is unavailable, so an apology never becomes the summary
+    return gemma.summarize(prompt, max_length=300, temperature=0.3)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ConversationStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'CHAT_CONTEXT', {})
+                _store = ConversationStore(
+                    window_turns=config.get('WINDOW_TURNS', 12),
+                    window_tokens=config.get('WINDOW_TOKENS', 1200),
+                    prompt_tokens=config.get('PROMPT_TOKENS', 1800),
+                    summary_tokens=config.get('SUMMARY_TOKENS', 250),
+                    message_tokens=config.get('MESSAGE_TOKENS', 600),
+                    max_sessions=config.get('MAX_SESSIONS', 2000),
+                )
+    return _store
+
+
+def chat_reply(session_id: str, message: str, generate: Callable[[str], str]) -> str:
+    """
+    Context-aware reply for `message`. Without a session id the turn is
+    stateless (just the chat system prompt).
+    """
+    if not session_id:
+        return generate(SYSTEM_PROMPT + f"User: {truncate_tokens(message, 600)}\nAssistant:")
+    return get_store().respond(session_id, message, generate, _llm_summarize)
+
+
+def record_turn(session_id: str, role: str, text: str) -> None:
+    """Add a turn answered without the LLM (e.g. a routed greeting) to the context."""
+    if session_id:
+        get_store().record(session_id, role, text, _llm_summarize)
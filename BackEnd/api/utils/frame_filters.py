@@ -0,0 +1,186 @@
+"""
+Cheap per-frame filters for video analysis.
+
+Talking-head videos have long stretches where consecutive sampled frames are
+nearly identical. FrameDeduper fingerprints each sampled frame with a
+difference hash (dHash: a 9x8 grayscale thumbnail, one bit per horizontal
+gradient sign) and reports frames within FRAME_DEDUP['THRESHOLD'] bits of the
+last *analyzed* frame as duplicates, so the video loops reuse that frame's
+emotion scores instead of running the model again. Comparing against the
+last analyzed frame, not the previous one, keeps slow drift from piling up.
+
+FaceGate rejects frames without a face before they reach the emotion model.
+It runs the OpenCV Haar cascade on a copy downscaled to FACE_GATE['MAX_SIDE']
+(a few milliseconds), so images and frames of the user looking away, black
+frames or unrelated pictures short-circuit with status "no_face" instead of
+being scored as a face and dragging the average.
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from api.utils.config import settings_dict
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+
+# Faces are searched on a copy of the frame whose longest side is at most this
+DETECT_MAX_SIDE = 320
+
+
+def _gray(frame: np.ndarray) -> np.ndarray:
+    if frame.ndim == 2:
+        return frame
+    if CV2_AVAILABLE:
+        code = cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(frame, code)
+    return frame[..., :3] @ np.array([0.114, 0.587, 0.299])
+
+
+def dhash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """64-bit (for hash_size=8) difference hash of a BGR or gray frame."""
+    frame = _gray(frame)
+    if CV2_AVAILABLE:
+        small = cv2.resize(frame, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    else:
+        rows = np.linspace(0, frame.shape[0] - 1, hash_size).astype(np.intp)
+        cols = np.linspace(0, frame.shape[1] - 1, hash_size + 1).astype(np.intp)
+        small = frame[np.ix_(rows, cols)]
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class FrameDeduper:
+    def __init__(self, threshold: Optional[int] = None, hash_size: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        """
+        :param threshold: Max differing hash bits for a frame to count as a duplicate
+        :param hash_size: dHash grid size (hash has hash_size**2 bits)
+        :param enabled: Override FRAME_DEDUP['ENABLED']
+        """
+        config = settings_dict("FRAME_DEDUP")
+        self.threshold = config.get("THRESHOLD", 5) if threshold is None else threshold
+        self.hash_size = config.get("HASH_SIZE", 8) if hash_size is None else hash_size
+        self.enabled = config.get("ENABLED", True) if enabled is None else enabled
+        self.analyzed = 0
+        self.skipped = 0
+        self._last: Optional[int] = None
+
+    def is_duplicate(self, frame: np.ndarray) -> bool:
+        """
+        True if `frame` can reuse the last analyzed frame's result. Otherwise
+        the frame becomes the new reference and counts as analyzed.
+        """
+        if not self.enabled:
+            self.analyzed += 1
+            return False
+        fingerprint = dhash(frame, self.hash_size)
+        if self._last is not None and hamming(fingerprint, self._last) <= self.threshold:
+            self.skipped += 1
+            return True
+        self._last = fingerprint
+        self.analyzed += 1
+        return False
+
+    def forget(self) -> None:
+        """Drop the reference frame (e.g. its analysis failed), so nothing reuses it."""
+        self._last = None
+
+
+_face_cascade = None
+
+
+def _get_face_cascade():
+    global _face_cascade
+    if _face_cascade is None and CV2_AVAILABLE:
+        cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        cascade = cv2.CascadeClassifier(cascade_path)
+        _face_cascade = cascade if not cascade.empty() else False
+    return _face_cascade or None
+
+
+def detect_faces(frame: np.ndarray, max_side: int = DETECT_MAX_SIDE, min_neighbors: int = 4,
+                 min_size: int = 24) -> Optional[np.ndarray]:
+    """
+    Face boxes (x, y, w, h) in full-resolution coordinates, largest first,
+    or None when no cascade is available. Detection runs on a copy whose
+    longest side is at most `max_side`.
+    """
+    cascade = _get_face_cascade()
+    if cascade is None:
+        return None
+    gray = _gray(frame)
+    h, w = gray.shape
+    scale = min(1.0, max_side / float(max(h, w)))
+    small = cv2.resize(gray, (int(w * scale), int(h * scale))) if scale < 1.0 else gray
+    faces = cascade.detectMultiScale(small, scaleFactor=1.2, minNeighbors=min_neighbors,
+                                     minSize=(min_size, min_size))
+    if not len(faces):
+        return np.empty((0, 4), dtype=np.intp)
+    boxes = (np.asarray(faces, dtype=np.float64) / scale).astype(np.intp)
+    return boxes[np.argsort(-(boxes[:, 2] * boxes[:, 3]), kind="stable")]
+
+
+class FaceGate:
+    def __init__(self, enabled: Optional[bool] = None, max_side: Optional[int] = None,
+                 min_neighbors: Optional[int] = None, min_size: Optional[int] = None):
+        """
+        :param enabled: Override FACE_GATE['ENABLED']
+        :param max_side: Longest side of the copy the cascade runs on
+        :param min_neighbors, min_size: Cascade strictness / smallest face (on the copy)
+        """
+        config = settings_dict("FACE_GATE")
+        self.enabled = config.get("ENABLED", True) if enabled is None else enabled
+        self.max_side = config.get("MAX_SIDE", DETECT_MAX_SIDE) if max_side is None else max_side
+        self.min_neighbors = config.get("MIN_NEIGHBORS", 4) if min_neighbors is None else min_neighbors
+        self.min_size = config.get("MIN_SIZE", 24) if min_size is None else min_size
+        self.checked = 0
+        self.rejected = 0
+
+    def faces(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """Face boxes, largest first; None if the gate is off or can't run (let everything through)."""
+        if not self.enabled:
+            return None
+        boxes = detect_faces(frame, self.max_side, self.min_neighbors, self.min_size)
+        if boxes is not None:
+            self.checked += 1
+            if not len(boxes):
+                self.rejected += 1
+        return boxes
+
+    def has_face(self, frame: np.ndarray) -> bool:
+        boxes = self.faces(frame)
+        return boxes is None or len(boxes) > 0
+
+    def image_has_face(self, img_path: str) -> bool:
+        """Check an image file; unreadable files pass (the analyzers report those)."""
+        if not self.enabled or not CV2_AVAILABLE:
+            return True
+        gray = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+        return gray is None or not gray.size or self.has_face(gray)
+
+
+def no_face_result(media_type: str, file_path: str, frames: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Analysis result for inputs without a detectable face."""
+    result = {
+        "type": media_type,
+        "file_path": file_path,
+        "status": "no_face",
+        "emotions": None,
+        "diagnosis": "unknown",
+        "confidence": 0.0,
+        "model_version": None,
+    }
+    if media_type == "video":
+        result["frames"] = frames
+    return result
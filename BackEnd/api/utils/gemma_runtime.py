@@ -1,8 +1,13 @@
 import os
-from typing import Dict
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
+from api.utils.cancellation import check_cancelled
+from api.utils.config import settings_dict
+from api.utils.singleflight import generation_flight
+
 try:
     import google.generativeai as genai
     GEMINI_AVAILABLE = True
@@ -11,7 +16,50 @@ except ImportError:
     print("Warning: google-generativeai not installed. Install with: pip install google-generativeai")
 
 
-class GeminiGenerator:
+class BaseGenerator(ABC):
+    """Prompt helpers shared by the hosted and local backends (they implement generate and complete)."""
+
+    @abstractmethod
+    def generate(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95, do_sample: bool = True) -> str:
+        """Reply text for the user; an apology rather than an exception on failure."""
+
+    @abstractmethod
+    def complete(self, prompt: str, max_length: int = 300, temperature: float = 0.7) -> str:
+        """Like generate, but raises on failure instead of returning an apology."""
+
+    def summarize(self, prompt: str, max_length: int = 300, temperature: float = 0.3) -> Optional[str]:
+        """
+        Generation whose output is stored rather than shown (e.g. chat summaries):
+        None when the LLM is unavailable or fails, never a canned reply.
+        """
+        try:
+            return self.complete(prompt, max_length=max_length, temperature=temperature).strip() or None
+        except Exception as e:
+            print(f"LLM summarize unavailable: {e}")
+            return None
+
+    def stream(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95) -> Iterator[str]:
+        """Yield the response in pieces (one piece for backends that can't stream)."""
+        yield self.generate(prompt, max_length=max_length, temperature=temperature, top_p=top_p)
+
+    def generate_emotion_advice(self, emotions: Dict[str, float], diagnosis: str) -> str:
+        emotion_str = ", ".join([f"{k}: {v:.2f}" for k, v in emotions.items() if v > 0.1])
+        prompt = (
+            "You are a warm, supportive assistant. "
+            f"Emotions detected: {emotion_str}. Depression risk: {diagnosis}. "
+            "Write 2-3 short, practical, non-clinical suggestions in a gentle tone."
+        )
+        return self.generate(prompt, max_length=200, temperature=0.8)
+
+    def generate_chat_response(self, user_message: str) -> str:
+        prompt = (
+            "You are an empathetic assistant. Keep responses concise and supportive.\n"
+            f"User: {user_message}\nAssistant:"
+        )
+        return self.generate(prompt, max_length=200, temperature=0.7)
+
+
+class GeminiGenerator(BaseGenerator):
     def __init__(self, model_name: str = None, api_key: str = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not GEMINI_AVAILABLE:
@@ -33,46 +81,80 @@ class GeminiGenerator:
         self.client = genai.GenerativeModel(self.model_name)
 
     def generate(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95, do_sample: bool = True) -> str:
+        # A double-submitted prompt waits for the call already in flight
+        key = f"{self.model_name}|{temperature}|{top_p}|{' '.join(prompt.split())}"
+        return generation_flight.do(key, self._generate, prompt, temperature, top_p)
+
+    def complete(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95) -> str:
+        # Don't pay for a generation nobody will read
+        check_cancelled()
+        generation_config = {"temperature": float(temperature), "top_p": float(top_p)}
+        response = self.client.generate_content(prompt, generation_config=generation_config)
+        text = getattr(response, "text", None) or "".join(getattr(response, "candidates", []) or [])
+        return text.strip() or ""
+
+    def _generate(self, prompt: str, temperature: float, top_p: float) -> str:
         try:
-            generation_config = {"temperature": float(temperature), "top_p": float(top_p)}
-            response = self.client.generate_content(prompt, generation_config=generation_config)
-            text = getattr(response, "text", None) or "".join(getattr(response, "candidates", []) or [])
-            return text.strip() or ""
+            return self.complete(prompt, temperature=temperature, top_p=top_p)
         except Exception as e:
             print(f"Gemini generation error: {e}")
             return "I'm sorry, I'm having trouble generating a response right now. Please try again."
 
-    def generate_emotion_advice(self, emotions: Dict[str, float], diagnosis: str) -> str:
-        emotion_str = ", ".join([f"{k}: {v:.2f}" for k, v in emotions.items() if v > 0.1])
-        prompt = (
-            "You are a warm, supportive assistant. "
-            f"Emotions detected: {emotion_str}. Depression risk: {diagnosis}. "
-            "Write 2-3 short, practical, non-clinical suggestions in a gentle tone."
-        )
-        return self.generate(prompt, max_length=200, temperature=0.8)
 
-    def generate_chat_response(self, user_message: str) -> str:
-        prompt = (
-            "You are an empathetic assistant. Keep responses concise and supportive.\n"
-            f"User: {user_message}\nAssistant:"
-        )
-        return self.generate(prompt, max_length=200, temperature=0.7)
+def _local_generator() -> BaseGenerator:
+    # Imported here: local_llm builds on BaseGenerator from this module
+    from api.utils.local_llm import LocalGenerator
 
+    config = settings_dict("LLM")
+    generator = LocalGenerator(
+        model_path=config.get("LOCAL_MODEL_PATH"),
+        max_batch=config.get("MAX_BATCH", 8),
+        max_wait_ms=config.get("MAX_WAIT_MS", 10),
+        max_new_tokens=config.get("MAX_NEW_TOKENS", 256),
+        quantize=config.get("QUANTIZE", True),
+        threads=config.get("THREADS", 0),
+    )
+    print(f"✅ Local LLM loaded ({generator.model_name})")
+    return generator
 
-try:
-    gemma = GeminiGenerator()
-    print("✅ Gemini runtime loaded successfully")
-except Exception as e:
-    print(f"❌ Failed to initialize Gemini runtime: {e}")
 
-    class FallbackGenerator:
-        def generate(self, prompt: str) -> str:
-            return "I'm currently unavailable. Please ensure GEMINI_API_KEY is set and the service is reachable."
+def _create_generator() -> BaseGenerator:
+    """
+    LLM['BACKEND']: "gemini" (hosted), "local" (offline CPU model), or "auto":
+    Gemini when GEMINI_API_KEY is set, else the local model if configured.
+    """
+    backend = settings_dict("LLM").get("BACKEND", "auto")
+    if backend == "local":
+        return _local_generator()
+    try:
+        generator = GeminiGenerator()
+        print("✅ Gemini runtime loaded successfully")
+        return generator
+    except Exception as e:
+        if backend == "auto" and settings_dict("LLM").get("LOCAL_MODEL_PATH"):
+            print(f"⚠️ Gemini unavailable ({e}), using the local LLM")
+            return _local_generator()
+        raise
 
-        def generate_emotion_advice(self, emotions: Dict[str, float], diagnosis: str) -> str:
-            return "I'm here to support you. Please try again later."
 
-        def generate_chat_response(self, user_message: str) -> str:
-            return "I'm currently unavailable. Please try again later."
+class FallbackGenerator(BaseGenerator):
+    """Stand-in when no LLM backend could be initialized."""
 
+    def generate(self, prompt: str, *args, **kwargs) -> str:
+        return "I'm currently unavailable. Please ensure GEMINI_API_KEY is set and the service is reachable."
+
+    def complete(self, prompt: str, *args, **kwargs) -> str:
+        raise RuntimeError("No LLM backend is available")
+
+    def generate_emotion_advice(self, emotions: Dict[str, float], diagnosis: str) -> str:
+        return "I'm here to support you. Please try again later."
+
+    def generate_chat_response(self, user_message: str) -> str:
+        return "I'm currently unavailable. Please try again later."
+
+
+try:
+    gemma = _create_generator()
+except Exception as e:
+    print(f"❌ Failed to initialize LLM runtime: {e}")
     gemma = FallbackGenerator()
@@ -0,0 +1,100 @@
+"""
+Chat history reads: keyset pagination and constant-memory export.
+
+Pages are addressed by an opaque cursor holding the last seen message id,
+so each page is a single range scan on the (session_id, id) / (user_id, id)
+indexes instead of an OFFSET scan. Exports walk the same indexes in fixed
+size id ranges and yield encoded lines one at a time.
+"""
+
+import base64
+import csv
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from api.models import ChatMessage
+
+MESSAGE_FIELDS = ('id', 'session_id', 'role', 'content', 'latency_ms', 'created_at')
+MAX_PAGE_SIZE = 200
+EXPORT_CHUNK_SIZE = 1000
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """Raise ValueError for anything that isn't a cursor we issued."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        last_id = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if last_id < 0:
+        raise ValueError("Invalid cursor")
+    return last_id
+
+
+def _scope(session_id: str = '', user_id: str = ''):
+    """A user's messages (optionally one of their sessions), or an anonymous session's."""
+    if user_id:
+        qs = ChatMessage.objects.filter(user_id=user_id)
+        return qs.filter(session_id=session_id) if session_id else qs
+    if session_id:
+        # Without a user, only the anonymous messages of that session
+        return ChatMessage.objects.filter(session_id=session_id, user_id='')
+    raise ValueError("session_id is required")
+
+
+def _row_to_dict(row: Tuple) -> Dict[str, Any]:
+    item = dict(zip(MESSAGE_FIELDS, row))
+    item['created_at'] = item['created_at'].isoformat()
+    return item
+
+
+def page_messages(session_id: str = '', user_id: str = '', cursor: Optional[str] = None,
+                  limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of messages, newest first.
+    :return: (messages, next_cursor); next_cursor is None on the last page
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    qs = _scope(session_id, user_id)
+    if cursor:
+        qs = qs.filter(id__lt=decode_cursor(cursor))
+    rows = list(qs.order_by('-id').values_list(*MESSAGE_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return [_row_to_dict(row) for row in rows[:limit]], next_cursor
+
+
+def iter_messages(session_id: str = '', user_id: str = '',
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Every message in the scope, oldest first, fetched `chunk_size` rows at a time."""
+    qs = _scope(session_id, user_id)
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id).order_by('id').values_list(*MESSAGE_FIELDS)[:chunk_size])
+        for row in rows:
+            yield _row_to_dict(row)
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def export_jsonl(messages: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    for message in messages:
+        yield json.dumps(message, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(messages: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(MESSAGE_FIELDS)
+    for message in messages:
+        yield writer.writerow([message[f] for f in MESSAGE_FIELDS])
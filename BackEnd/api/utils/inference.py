@@ -1,22 +1,20 @@
 # api/utils/inference.py
-import joblib
-import os
+from api.utils.model_registry import text_model
+from api.utils.singleflight import diagnosis_flight, normalize_text
 
-# Load once when server starts
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "depression_model.pkl")
-VEC_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "emotion_encoder.pkl")
-
-try:
-    clf = joblib.load(MODEL_PATH)
-    vectorizer = joblib.load(VEC_PATH)
-except Exception as e:
-    print(f"Error loading diagnosis model: {e}")
-    clf, vectorizer = None, None
 
 def diagnose_text(user_text: str):
     """Diagnose depression/anxiety likelihood from user text"""
-    if not clf or not vectorizer:
+    # Identical texts already being diagnosed share that prediction
+    return diagnosis_flight.do(normalize_text(user_text), _diagnose, user_text)
+
+
+def _diagnose(user_text: str):
+    # One snapshot per call: a hot reload mid-request can't mix model versions
+    loaded = text_model.get()
+    if loaded is None:
         return {"error": "Model not loaded"}
+    clf, vectorizer = loaded.model
 
     vec = vectorizer.transform([user_text])
     prediction = clf.predict(vec)[0]
@@ -24,5 +22,6 @@ def diagnose_text(user_text: str):
 
     return {
         "diagnosis": str(prediction),   # e.g., "no_risk", "moderate", "severe"
-        "confidence": confidence
+        "confidence": confidence,
+        "model_version": loaded.version
     }
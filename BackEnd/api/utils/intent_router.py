@@ -0,0 +1,158 @@
+"""
+Local intent routing for chat messages.
+
+Greetings, thanks, "what can you do" and requests for coping tips don't need
+an LLM. IntentRouter classifies a message against the intents in
+intents.json and answers the routine ones straight away: templated replies,
+or tips from remedies.json for the coping intents. Open-ended messages,
+low-confidence predictions and anything crisis-related go to the LLM.
+
+The classifier is TF-IDF (word 1-2 grams) + logistic regression, like
+train_model.py, fitted on the intents.json examples when the router loads
+(a few hundred rows, well under a second). For prediction the vocabulary,
+IDF and coefficients are copied into a dict and a dense matrix, so scoring
+a message is a tokenization, a few dict lookups and one small dot product -
+tens of microseconds, without sklearn's per-call overhead.
+
+Crisis phrases are also matched with a regex, so a classifier miss can
+never turn "thanks, but I want to die" into a templated reply.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from api.utils import metrics
+from api.utils.remedies import remedies_by_category
+
+INTENTS_PATH = os.path.join(os.path.dirname(__file__), "intents.json")
+
+CRISIS_PATTERN = re.compile(
+    r"\b(suicid\w*|kill(ing)? myself|end(ing)? (my|it) (life|all)|want to die|"
+    r"self[- ]?harm\w*|hurt(ing)? myself|cutting myself|don'?t want to (live|be alive))\b",
+    re.IGNORECASE,
+)
+
+
+class IntentRouter:
+    def __init__(self, intents: Dict[str, Dict[str, Any]], min_confidence: float = 0.5):
+        """
+        :param intents: name -> examples plus responses / remedies / llm / resources
+        :param min_confidence: Below this the message goes to the LLM
+        """
+        self.intents = intents
+        self.min_confidence = min_confidence
+        texts, labels = [], []
+        for name, intent in intents.items():
+            texts.extend(intent["examples"])
+            labels.extend([name] * len(intent["examples"]))
+
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, lowercase=True)
+        features = vectorizer.fit_transform(texts)
+        clf = LogisticRegression(C=10.0, max_iter=1000)
+        clf.fit(features, labels)
+
+        self.classes: List[str] = [str(c) for c in clf.classes_]
+        self._analyzer = vectorizer.build_analyzer()
+        self._vocab = {term: int(i) for term, i in vectorizer.vocabulary_.items()}
+        self._idf = vectorizer.idf_.astype(np.float64)
+        self._coef = np.ascontiguousarray(clf.coef_.T, dtype=np.float64)   # (n_terms, n_classes)
+        self._intercept = clf.intercept_.astype(np.float64)
+
+    @classmethod
+    def load(cls, path: str = INTENTS_PATH, min_confidence: float = 0.5) -> "IntentRouter":
+        with open(path, "r") as f:
+            return cls(json.load(f), min_confidence)
+
+    def classify(self, text: str) -> Dict[str, Any]:
+        """Intent and confidence for one message (same math as the fitted sklearn pipeline)."""
+        counts: Dict[int, int] = {}
+        for term in self._analyzer(text):
+            index = self._vocab.get(term)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+        if counts:
+            indices = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+            tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+            weights = tf * self._idf[indices]
+            weights /= np.linalg.norm(weights)
+            logits = weights @ self._coef[indices] + self._intercept
+        else:
+            logits = self._intercept.copy()
+        if len(self.classes) == 2:
+            # Binary LogisticRegression keeps one coefficient column for classes[1]
+            p = 1.0 / (1.0 + np.exp(-logits[0]))
+            proba = np.array([1.0 - p, p])
+        else:
+            exp = np.exp(logits - logits.max())
+            proba = exp / exp.sum()
+        best = int(proba.argmax())
+        return {"intent": self.classes[best], "confidence": float(proba[best])}
+
+    def route(self, text: str) -> Dict[str, Any]:
+        """
+        Classify and, for routine intents, answer locally.
+        Returns intent, confidence, route ("local" or "llm"), and reply for local
+        routes; crisis messages also carry the crisis resources text.
+        """
+        if CRISIS_PATTERN.search(text):
+            result = {"intent": "crisis", "confidence": 1.0}
+        else:
+            result = self.classify(text)
+        intent = self.intents[result["intent"]]
+        if result["intent"] == "crisis":
+            result["resources"] = intent.get("resources", "")
+
+        reply = None
+        if not intent.get("llm") and result["confidence"] >= self.min_confidence:
+            reply = self._local_reply(intent)
+        result["route"] = "local" if reply else "llm"
+        if reply:
+            result["reply"] = reply
+        metrics.inc("chat_intent_total", intent=result["intent"], route=result["route"])
+        return result
+
+    @staticmethod
+    def _local_reply(intent: Dict[str, Any]) -> Optional[str]:
+        if intent.get("remedies"):
+            tips = remedies_by_category().get(intent["remedies"], [])
+            if not tips:
+                return None
+            picked = random.sample(tips, min(3, len(tips)))
+            return "\n".join([intent.get("intro", "Here are a few ideas:")] + [f"- {tip}" for tip in picked])
+        responses = intent.get("responses")
+        return random.choice(responses) if responses else None
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> IntentRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                config = getattr(settings, "CHAT_INTENTS", {})
+                _router = IntentRouter.load(config.get("PATH", INTENTS_PATH), config.get("MIN_CONFIDENCE", 0.5))
+                print(f"✅ Intent router ready ({len(_router.classes)} intents)")
+    return _router
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    router = IntentRouter.load()
+    for message in sys.argv[1:] or ["hi there", "thanks a lot", "how do i calm down", "my boss yelled at me today"]:
+        started = time.perf_counter()
+        result = router.route(message)
+        print(f"{(time.perf_counter() - started) * 1e6:7.0f}us  {message!r} -> {result}")
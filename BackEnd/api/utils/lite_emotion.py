@@ -0,0 +1,292 @@
+"""
+Lightweight emotion model written in pure NumPy.
+
+A softmax-regression classifier over downscaled grayscale face crops:
+1. Face crop with a downscaled OpenCV Haar cascade (centre crop if none found;
+   videos drop frames without a face, see frame_filters.FaceGate)
+2. Per-crop contrast normalization and feature standardization
+3. One matrix multiply + softmax for a whole batch of crops
+
+It backs SimpleEmotionAnalyzer / BasicEmotionAnalyzer and the DeepFace
+fallback, and is cheap enough to run on every sampled video frame.
+Weights are stored in api/models/lite_emotion.npz (see train_lite_emotion.py).
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+import os
+import numpy as np
+
+from api.utils.cancellation import check_cancelled
+from api.utils.frame_filters import DETECT_MAX_SIDE, FaceGate, FrameDeduper, detect_faces
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+EMOTION_KEYS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+DEFAULT_WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "lite_emotion.npz")
+
+
+def _resize(gray: np.ndarray, size: int) -> np.ndarray:
+    """Resize a 2-D array to (size, size)."""
+    if CV2_AVAILABLE:
+        return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+    rows = np.linspace(0, gray.shape[0] - 1, size).astype(np.intp)
+    cols = np.linspace(0, gray.shape[1] - 1, size).astype(np.intp)
+    return gray[np.ix_(rows, cols)]
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """Convert a BGR/BGRA/gray image to a 2-D uint8 gray array."""
+    if image.ndim == 2:
+        return image
+    if CV2_AVAILABLE:
+        code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(image, code)
+    # ITU-R BT.601 luma on BGR channel order
+    return (image[..., :3] @ np.array([0.114, 0.587, 0.299])).astype(np.uint8)
+
+
+def read_image(img_path: str) -> Optional[np.ndarray]:
+    """Read an image from disk as BGR, or None if it cannot be decoded."""
+    if not CV2_AVAILABLE:
+        return None
+    image = cv2.imread(img_path)
+    return image if image is not None and image.size else None
+
+
+def crop_face(gray: np.ndarray, faces: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return the largest face in a gray image, or a centre square crop.
+    Detection runs on a downscaled copy so it stays cheap on large frames.
+    :param faces: Boxes already found by detect_faces (largest first)
+    """
+    h, w = gray.shape
+    if faces is None:
+        faces = detect_faces(gray, DETECT_MAX_SIDE)
+    if faces is not None and len(faces):
+        x, y, fw, fh = (int(v) for v in faces[0])
+        return gray[y:y + fh, x:x + fw]
+    side = min(h, w)
+    top, left = (h - side) // 2, (w - side) // 2
+    return gray[top:top + side, left:left + side]
+
+
+def preprocess_faces(faces: Iterable[np.ndarray], size: int) -> np.ndarray:
+    """
+    Turn gray face crops into an (N, size*size) float32 feature matrix.
+    Each crop is resized and normalized to zero mean / unit variance so the
+    model is insensitive to exposure and contrast.
+    """
+    batch = np.stack([_resize(face, size) for face in faces]).astype(np.float32)
+    batch = batch.reshape(len(batch), -1)
+    batch -= batch.mean(axis=1, keepdims=True)
+    batch /= batch.std(axis=1, keepdims=True) + 1e-6
+    return batch
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1, keepdims=True)
+    return logits
+
+
+class TimelineStats:
+    """Running per-emotion mean/std over a video's sampled frames (constant memory)."""
+
+    def __init__(self, emotion_keys: List[str] = None):
+        self.emotion_keys = list(emotion_keys or EMOTION_KEYS)
+        self.count = 0
+        self.skipped = 0   # sampled frames that reused an earlier frame's result
+        self.no_face = 0   # sampled frames without a face (not in the statistics)
+        self.rejected = 0  # of those, frames the face gate checked itself
+        self._sum = np.zeros(len(self.emotion_keys), dtype=np.float64)
+        self._sumsq = np.zeros(len(self.emotion_keys), dtype=np.float64)
+
+    def add(self, scores: np.ndarray, weights: Optional[Iterable[int]] = None) -> None:
+        """
+        Add one frame (7,) or a batch of frames (n, 7).
+        :param weights: Frames each row stands for (its near-duplicates included)
+        """
+        scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+        if weights is None:
+            self.count += len(scores)
+            self._sum += scores.sum(axis=0)
+            self._sumsq += (scores ** 2).sum(axis=0)
+            return
+        weights = np.asarray(weights, dtype=np.float64)[:, None]
+        self.count += int(weights.sum())
+        self._sum += (weights * scores).sum(axis=0)
+        self._sumsq += (weights * scores ** 2).sum(axis=0)
+
+    def mean(self) -> np.ndarray:
+        return self._sum / max(self.count, 1)
+
+    def std(self) -> np.ndarray:
+        mean = self.mean()
+        return np.sqrt(np.maximum(self._sumsq / max(self.count, 1) - mean ** 2, 0.0))
+
+    def to_dict(self) -> Dict[str, float]:
+        return dict(zip(self.emotion_keys, self.mean().tolist()))
+
+    def frame_stats(self) -> Dict[str, Any]:
+        sampled = self.count + self.no_face
+        return {
+            "sampled": sampled,
+            "analyzed": sampled - self.skipped - self.rejected,
+            "skipped": self.skipped,
+            "no_face": self.no_face,
+            "face_coverage": round(self.count / sampled, 4) if sampled else 0.0,
+        }
+
+
+class LiteEmotionModel:
+    """Softmax regression over normalized face crops, batched in NumPy."""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, mean: np.ndarray, std: np.ndarray,
+                 size: int, emotion_keys: List[str] = None):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.size = int(size)
+        self.emotion_keys = list(emotion_keys or EMOTION_KEYS)
+        if self.weights.shape != (self.size * self.size, len(self.emotion_keys)):
+            raise ValueError(f"Weight shape {self.weights.shape} does not match input size {self.size}")
+        # Fold the feature standardization into the linear layer once
+        self._w = self.weights / self.std[:, None]
+        self._b = self.bias - self.mean @ self._w
+
+    @classmethod
+    def load(cls, path: str = None) -> "LiteEmotionModel":
+        """
+        Load weights from a .npz file.
+        :param path: Path to the weights (defaults to api/models/lite_emotion.npz)
+        """
+        path = path or DEFAULT_WEIGHTS_PATH
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Lite emotion weights not found: {path}")
+        with np.load(path, allow_pickle=False) as data:
+            keys = [str(k) for k in data["emotion_keys"]] if "emotion_keys" in data else None
+            return cls(data["W"], data["b"], data["mean"], data["std"], int(data["size"]), keys)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path, W=self.weights, b=self.bias, mean=self.mean, std=self.std,
+            size=np.int32(self.size), emotion_keys=np.array(self.emotion_keys),
+        )
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Class probabilities for an (N, size*size) feature matrix."""
+        return softmax(features @ self._w + self._b)
+
+    def predict_faces(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Class probabilities for a list of gray face crops."""
+        if not len(faces):
+            return np.empty((0, len(self.emotion_keys)), dtype=np.float32)
+        return self.predict_proba(preprocess_faces(faces, self.size))
+
+    def predict_images(self, images: List[np.ndarray]) -> np.ndarray:
+        """Class probabilities for a batch of full BGR or gray frames."""
+        return self.predict_faces([crop_face(to_gray(img)) for img in images])
+
+    def to_dict(self, probs: np.ndarray) -> Dict[str, float]:
+        return {k: float(v) for k, v in zip(self.emotion_keys, probs)}
+
+    def extract_emotions_image(self, img_path: str) -> Optional[Dict[str, float]]:
+        """Emotion probabilities for an image file, or None if it can't be read."""
+        image = read_image(img_path)
+        if image is None:
+            return None
+        return self.to_dict(self.predict_images([image])[0])
+
+    def extract_emotions_video(self, video_path: str, frame_skip: int = 30,
+                               batch_size: int = 32) -> Optional[Dict[str, float]]:
+        """Averaged emotion probabilities over every `frame_skip`-th frame."""
+        timeline = self.extract_video_timeline(video_path, frame_skip, batch_size)
+        return timeline.to_dict() if timeline and timeline.count else None
+
+    def extract_video_timeline(self, video_path: str, frame_skip: int = 30,
+                               batch_size: int = 32) -> Optional[TimelineStats]:
+        """
+        Emotion mean/std over every `frame_skip`-th frame.
+        Skipped frames are grabbed without decoding; sampled crops are scored
+        in batches of `batch_size`. Near-duplicate sampled frames reuse the
+        scores of the last analyzed one (see frame_filters.FrameDeduper), and
+        frames without a face are only counted (timeline.no_face). Returns
+        None if no frame could be read; timeline.count is 0 if none had a face.
+        """
+        if not CV2_AVAILABLE:
+            return None
+        cap = cv2.VideoCapture(video_path)
+        timeline = TimelineStats(self.emotion_keys)
+        deduper = FrameDeduper()
+        gate = FaceGate()
+        pending, weights = [], []
+        last_scores = None
+        last_has_face = True
+        frame_count = 0
+
+        def flush():
+            nonlocal pending, weights, last_scores
+            scores = self.predict_faces(pending)
+            timeline.add(scores, weights)
+            last_scores = scores[-1]
+            pending, weights = [], []
+
+        try:
+            while cap.grab():
+                # Stop within one frame once the request is abandoned
+                check_cancelled()
+                frame_count += 1
+                if frame_count % frame_skip != 0:
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                gray = to_gray(frame)
+                if deduper.is_duplicate(gray):
+                    # Counts towards the reference frame, scored or still pending
+                    if not last_has_face:
+                        timeline.no_face += 1
+                    elif weights:
+                        weights[-1] += 1
+                    else:
+                        timeline.add(last_scores)
+                    continue
+                faces = gate.faces(gray)
+                last_has_face = faces is None or len(faces) > 0
+                if not last_has_face:
+                    timeline.no_face += 1
+                    continue
+                pending.append(crop_face(gray, faces))
+                weights.append(1)
+                if len(pending) >= batch_size:
+                    flush()
+            if pending:
+                flush()
+        finally:
+            cap.release()
+        timeline.skipped = deduper.skipped
+        timeline.rejected = gate.rejected
+        return timeline if timeline.count or timeline.no_face else None
+
+
+_lite_model = None
+_lite_model_loaded = False
+
+
+def get_lite_model() -> Optional[LiteEmotionModel]:
+    """Process-wide lite model, or None when no weights are installed."""
+    global _lite_model, _lite_model_loaded
+    if not _lite_model_loaded:
+        _lite_model_loaded = True
+        try:
+            _lite_model = LiteEmotionModel.load()
+            print(f"✅ Loaded lite emotion model ({_lite_model.size}x{_lite_model.size})")
+        except Exception as e:
+            print(f"⚠️ Lite emotion model not available: {e}")
+    return _lite_model
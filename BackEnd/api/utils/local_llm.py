@@ -0,0 +1,293 @@
+"""
+Offline local-LLM backend with continuous batching.
+
+For air-gapped deployments (LLM['BACKEND'] = "local", or "auto" without a
+GEMINI_API_KEY), LocalGenerator serves the same generate /
+generate_chat_response / generate_emotion_advice interface as
+GeminiGenerator from a small causal LM running on the CPU.
+
+ContinuousBatcher runs one decode loop for all concurrent requests:
+  - a new request is prefilled and joins the running batch at the next
+    token step, instead of waiting for the current batch to finish
+  - finished or cancelled sequences leave immediately, freeing their slot
+  - the batch holds at most MAX_BATCH sequences; an idle engine waits up to
+    MAX_WAIT_MS after the first arrival so a burst starts decoding together
+Every step decodes one token for the whole batch in a single forward pass,
+so throughput grows with concurrency instead of requests queueing one by
+one. Tokens are streamed to each caller as they are sampled.
+
+The model backend is pluggable (prefill / decode_step / encode / decode).
+TransformersBackend loads a Hugging Face checkpoint from LLM['LOCAL_MODEL_PATH']
+and, with LLM['QUANTIZE'], applies dynamic int8 quantization to its Linear
+layers. transformers and torch are optional dependencies.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from api.utils import metrics
+from api.utils.cancellation import Cancelled, check_cancelled
+from api.utils.gemma_runtime import BaseGenerator
+from api.utils.singleflight import generation_flight
+
+try:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+_DONE = object()
+
+
+def sample_token(logits: np.ndarray, temperature: float, top_p: float, rng: np.random.Generator) -> int:
+    """Greedy for temperature <= 0, otherwise nucleus sampling."""
+    if temperature <= 0:
+        return int(np.argmax(logits))
+    scaled = logits.astype(np.float64) / temperature
+    probs = np.exp(scaled - scaled.max())
+    probs /= probs.sum()
+    order = np.argsort(-probs)
+    cumulative = np.cumsum(probs[order])
+    keep = order[:int(np.searchsorted(cumulative, top_p)) + 1]
+    kept = probs[keep] / probs[keep].sum()
+    return int(rng.choice(keep, p=kept))
+
+
+class _Sequence:
+    def __init__(self, prompt_ids: List[int], max_tokens: int, temperature: float, top_p: float):
+        self.prompt_ids = prompt_ids
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.tokens: List[int] = []
+        self.text = ""
+        self.state: Any = None
+        self.stream: "queue.Queue" = queue.Queue()
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+
+    def finish(self, error: BaseException = None) -> None:
+        self.error = error
+        self.done.set()
+        self.stream.put(_DONE)
+
+
+class ContinuousBatcher:
+    def __init__(self, backend, max_batch: int = 8, max_wait_ms: float = 10.0, seed: int = None):
+        """
+        :param backend: Object with encode, decode, prefill, decode_step and eos_token_id
+        :param max_batch: Sequences decoded together per step
+        :param max_wait_ms: How long an idle engine waits to gather a burst of requests
+        """
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._rng = np.random.default_rng(seed)
+        self._waiting: List[_Sequence] = []
+        self._active: List[_Sequence] = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="local-llm", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, max_tokens: int = 256, temperature: float = 0.7, top_p: float = 0.95) -> _Sequence:
+        seq = _Sequence(self.backend.encode(prompt), max_tokens, temperature, top_p)
+        with self._cond:
+            self._waiting.append(seq)
+            self._cond.notify()
+        metrics.inc("local_llm_requests_total")
+        return seq
+
+    def _admit(self) -> List[_Sequence]:
+        """Move waiting sequences into the batch (holding the lock)."""
+        if not self._active and self._waiting and len(self._waiting) < self.max_batch:
+            # Idle engine: give a burst a moment to arrive and start together
+            deadline = time.monotonic() + self.max_wait
+            while len(self._waiting) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        free = self.max_batch - len(self._active)
+        admitted, self._waiting = self._waiting[:free], self._waiting[free:]
+        return admitted
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._waiting and not self._active:
+                    self._cond.wait()
+                admitted = self._admit()
+            try:
+                for seq in admitted:
+                    if seq.cancelled:
+                        seq.finish(Cancelled("cancelled before start"))
+                        continue
+                    seq.state, logits = self.backend.prefill(seq.prompt_ids)
+                    self._active.append(seq)
+                    self._emit(seq, logits)
+                self._active = [s for s in self._active if not s.done.is_set()]
+                if self._active:
+                    batch = self._active
+                    metrics.set_gauge("local_llm_batch_size", len(batch))
+                    states, logits = self.backend.decode_step(
+                        [s.state for s in batch], [s.tokens[-1] for s in batch])
+                    for seq, state, row in zip(batch, states, logits):
+                        seq.state = state
+                        self._emit(seq, row)
+                    self._active = [s for s in self._active if not s.done.is_set()]
+            except Exception as e:
+                print(f"Local LLM step failed: {e}")
+                for seq in self._active + admitted:
+                    if not seq.done.is_set():
+                        seq.finish(e)
+                self._active = []
+
+    def _emit(self, seq: _Sequence, logits: np.ndarray) -> None:
+        """Sample the next token for `seq`, stream its text and retire it when done."""
+        if seq.cancelled:
+            seq.finish(Cancelled("cancelled"))
+            return
+        token = sample_token(np.asarray(logits), seq.temperature, seq.top_p, self._rng)
+        if token == self.backend.eos_token_id:
+            seq.finish()
+            return
+        seq.tokens.append(token)
+        metrics.inc("local_llm_tokens_total")
+        text = self.backend.decode(seq.tokens)
+        if len(text) > len(seq.text):
+            seq.stream.put(text[len(seq.text):])
+            seq.text = text
+        if len(seq.tokens) >= seq.max_tokens:
+            seq.finish()
+
+
+class TransformersBackend:
+    """
+    Causal LM on the CPU with per-sequence KV caches. decode_step left-pads
+    the caches of the batch to a common length, runs one forward pass, and
+    slices the updated caches back apart.
+    """
+
+    def __init__(self, model_path: str, quantize: bool = True, threads: int = 0):
+        if not TRANSFORMERS_AVAILABLE:
+            raise ImportError("transformers and torch are required for the local LLM backend")
+        if threads:
+            torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.eos_token_id = self.tokenizer.eos_token_id
+
+    def encode(self, prompt: str) -> List[int]:
+        return self.tokenizer.encode(prompt)
+
+    def decode(self, tokens: Sequence[int]) -> str:
+        return self.tokenizer.decode(tokens, skip_special_tokens=True)
+
+    @staticmethod
+    def _legacy(cache) -> Tuple:
+        return cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else cache
+
+    @staticmethod
+    def _wrap(legacy: Tuple):
+        try:
+            from transformers import DynamicCache
+            return DynamicCache.from_legacy_cache(legacy)
+        except ImportError:
+            return legacy
+
+    def prefill(self, token_ids: List[int]):
+        with torch.inference_mode():
+            out = self.model(input_ids=torch.tensor([token_ids]), use_cache=True)
+        state = (self._legacy(out.past_key_values), len(token_ids))
+        return state, out.logits[0, -1].float().numpy()
+
+    def decode_step(self, states, last_tokens: List[int]):
+        lengths = [length for _, length in states]
+        longest = max(lengths)
+        layers = []
+        for layer in range(len(states[0][0])):
+            keys, values = [], []
+            for (cache, length) in states:
+                k, v = cache[layer]
+                pad = longest - length
+                keys.append(torch.nn.functional.pad(k, (0, 0, pad, 0)))
+                values.append(torch.nn.functional.pad(v, (0, 0, pad, 0)))
+            layers.append((torch.cat(keys), torch.cat(values)))
+
+        mask = torch.zeros(len(states), longest + 1, dtype=torch.long)
+        for i, length in enumerate(lengths):
+            mask[i, longest - length:] = 1
+        with torch.inference_mode():
+            out = self.model(
+                input_ids=torch.tensor(last_tokens).unsqueeze(1),
+                past_key_values=self._wrap(tuple(layers)),
+                attention_mask=mask,
+                position_ids=torch.tensor(lengths).unsqueeze(1),
+                use_cache=True,
+            )
+        cache = self._legacy(out.past_key_values)
+        new_states = []
+        for i, length in enumerate(lengths):
+            start = longest - length
+            new_states.append((
+                tuple((k[i:i + 1, :, start:], v[i:i + 1, :, start:]) for k, v in cache),
+                length + 1,
+            ))
+        return new_states, out.logits[:, -1].float().numpy()
+
+
+class LocalGenerator(BaseGenerator):
+    def __init__(self, backend=None, model_path: str = None, max_batch: int = 8, max_wait_ms: float = 10.0,
+                 max_new_tokens: int = 256, quantize: bool = True, threads: int = 0):
+        if backend is None:
+            if not model_path:
+                raise EnvironmentError("LOCAL_LLM_PATH is not set")
+            backend = TransformersBackend(model_path, quantize=quantize, threads=threads)
+        self.model_name = f"local:{model_path or type(backend).__name__}"
+        self.max_new_tokens = max_new_tokens
+        self.engine = ContinuousBatcher(backend, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+    def generate(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95, do_sample: bool = True) -> str:
+        temperature = temperature if do_sample else 0.0
+        key = f"{self.model_name}|{max_length}|{temperature}|{top_p}|{' '.join(prompt.split())}"
+        return generation_flight.do(key, self._generate, prompt, max_length, temperature, top_p)
+
+    def complete(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95) -> str:
+        return "".join(self.stream(prompt, max_length, temperature, top_p)).strip()
+
+    def _generate(self, prompt: str, max_length: int, temperature: float, top_p: float) -> str:
+        try:
+            return self.complete(prompt, max_length, temperature, top_p)
+        except Exception as e:
+            print(f"Local LLM generation error: {e}")
+            return "I'm sorry, I'm having trouble generating a response right now. Please try again."
+
+    def stream(self, prompt: str, max_length: int = 300, temperature: float = 0.7, top_p: float = 0.95) -> Iterator[str]:
+        """Yield text as it is generated; stops early if the request is cancelled."""
+        check_cancelled()
+        seq = self.engine.submit(prompt, min(max_length, self.max_new_tokens), temperature, top_p)
+        try:
+            while True:
+                try:
+                    piece = seq.stream.get(timeout=0.1)
+                except queue.Empty:
+                    check_cancelled()
+                    continue
+                if piece is _DONE:
+                    break
+                yield piece
+        except BaseException:
+            seq.cancelled = True
+            raise
+        if seq.error is not None:
+            raise seq.error
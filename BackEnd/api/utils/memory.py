@@ -0,0 +1,214 @@
+"""
+Per-worker memory telemetry and graceful recycling.
+
+MemoryMiddleware samples the process RSS around every request and exports
+  process_rss_bytes                      current RSS of this worker
+  request_memory_delta_bytes_total       RSS growth attributed to each view
+  request_memory_delta_max_bytes         largest single-request growth per view
+tracemalloc stays off (it slows allocation-heavy code); admins turn it on
+and read the top allocators through /api/admin/memory.
+
+WorkerRecycler retires a worker before the OOM killer does: once RSS passes
+MEMORY['MAX_RSS_MB'] or the worker has served MAX_REQUESTS, it starts
+draining - new requests get 503 + Retry-After so the load balancer moves
+them to a healthy worker - and when the in-flight requests have finished
+(or DRAIN_TIMEOUT_S passed) it sends itself SIGTERM. Daphne shuts down
+cleanly on SIGTERM and the process manager starts a fresh worker.
+"""
+
+import os
+import resource
+import signal
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from api.utils import metrics
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Always served, even while draining, so the worker stays observable
+_EXEMPT_PATHS = ("/api/metrics", "/api/admin/")
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def start_tracing(frames: int = 10) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing() -> None:
+    tracemalloc.stop()
+
+
+def top_allocators(limit: int = 20) -> List[Dict[str, Any]]:
+    """Largest live allocations by source line (empty unless tracing)."""
+    if not tracemalloc.is_tracing():
+        return []
+    stats = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )).statistics("lineno")
+    return [
+        {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+         "size_bytes": stat.size, "count": stat.count}
+        for stat in stats[:limit]
+    ]
+
+
+def _terminate() -> None:
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+class WorkerRecycler:
+    def __init__(self, max_rss_mb: int = 0, max_requests: int = 0, drain_timeout_s: float = 30.0,
+                 on_recycle: Callable[[], None] = _terminate):
+        """
+        :param max_rss_mb: Start draining above this RSS (0 disables)
+        :param max_requests: Start draining after this many requests (0 disables)
+        :param drain_timeout_s: Recycle even with requests still in flight after this long
+        :param on_recycle: Called once to end the worker (SIGTERM to self)
+        """
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_requests = max_requests
+        self.drain_timeout_s = drain_timeout_s
+        self.on_recycle = on_recycle
+        self.requests = 0
+        self.in_flight = 0
+        self.draining_reason: Optional[str] = None
+        self._recycled = False
+        self._lock = threading.Lock()
+
+    @property
+    def draining(self) -> bool:
+        return self.draining_reason is not None
+
+    def begin(self) -> bool:
+        """Register a new request; False if the worker is draining and should refuse it."""
+        with self._lock:
+            if self.draining:
+                return False
+            self.in_flight += 1
+            return True
+
+    def end(self, rss: int) -> None:
+        """Request finished: count it, check the limits, recycle once drained."""
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if not self.draining:
+                if self.max_rss and rss > self.max_rss:
+                    self._start_draining(f"rss {rss // (1024 * 1024)}MB > {self.max_rss // (1024 * 1024)}MB")
+                elif self.max_requests and self.requests >= self.max_requests:
+                    self._start_draining(f"served {self.requests} requests")
+            if self.draining and self.in_flight == 0:
+                self._recycle()
+
+    def _start_draining(self, reason: str) -> None:
+        self.draining_reason = reason
+        metrics.set_gauge("worker_draining", 1)
+        print(f"♻️ Worker {os.getpid()} draining for recycle: {reason}")
+        timer = threading.Timer(self.drain_timeout_s, self._drain_timeout)
+        timer.daemon = True
+        timer.start()
+
+    def _drain_timeout(self) -> None:
+        with self._lock:
+            if not self._recycled:
+                print(f"⚠️ Worker {os.getpid()} still has {self.in_flight} requests after drain timeout")
+                self._recycle()
+
+    def _recycle(self) -> None:
+        if self._recycled:
+            return
+        self._recycled = True
+        metrics.inc("worker_recycles_total")
+        self.on_recycle()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "draining": self.draining,
+            "draining_reason": self.draining_reason,
+            "max_rss_mb": self.max_rss // (1024 * 1024),
+            "max_requests": self.max_requests,
+        }
+
+
+_recycler = None
+_recycler_lock = threading.Lock()
+
+
+def get_recycler() -> WorkerRecycler:
+    global _recycler
+    if _recycler is None:
+        with _recycler_lock:
+            if _recycler is None:
+                config = getattr(settings, "MEMORY", {})
+                _recycler = WorkerRecycler(config.get("MAX_RSS_MB", 0), config.get("MAX_REQUESTS", 0),
+                                           config.get("DRAIN_TIMEOUT_S", 30.0))
+    return _recycler
+
+
+def _view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return match.url_name if match is not None and match.url_name else "unresolved"
+
+
+class MemoryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recycler = get_recycler()
+        if request.path.startswith(_EXEMPT_PATHS):
+            return self.get_response(request)
+        if not recycler.begin():
+            response = JsonResponse({"error": "Worker is restarting, please retry"}, status=503)
+            response["Retry-After"] = "1"
+            response["Connection"] = "close"
+            return response
+
+        before = rss_bytes()
+        try:
+            return self.get_response(request)
+        finally:
+            after = rss_bytes()
+            view = _view_name(request)
+            delta = max(after - before, 0)
+            metrics.set_gauge("process_rss_bytes", after)
+            metrics.inc("request_memory_delta_bytes_total", delta, view=view)
+            if delta > metrics.get_value("request_memory_delta_max_bytes", view=view):
+                metrics.set_gauge("request_memory_delta_max_bytes", delta, view=view)
+            recycler.end(after)
+
+
+def memory_report(limit: int = 20) -> Dict[str, Any]:
+    return {
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "tracing": tracemalloc.is_tracing(),
+        "top_allocators": top_allocators(limit),
+        "worker": get_recycler().status(),
+        "checked_at": time.time(),
+    }
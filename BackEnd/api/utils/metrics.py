@@ -0,0 +1,69 @@
+"""
+Process-local metrics in the Prometheus text format, served at /api/metrics.
+
+Counters and gauges are plain dicts keyed by (name, labels) behind one lock;
+cheap enough to update on every request. Each worker process reports its
+own values.
+"""
+
+import threading
+from typing import Dict, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = {}
+_gauges: Dict[Tuple[str, tuple], float] = {}
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Add to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = float(value)
+
+
+def clear_gauge(name: str, **match) -> None:
+    """Drop every series of a gauge whose labels include `match` (e.g. an old model version)."""
+    wanted = set(_key(name, match)[1])
+    with _lock:
+        for key in [k for k in _gauges if k[0] == name and wanted <= set(k[1])]:
+            del _gauges[key]
+
+
+def get_value(name: str, **labels) -> float:
+    key = _key(name, labels)
+    with _lock:
+        return _counters.get(key, _gauges.get(key, 0.0))
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render() -> str:
+    """All series in the Prometheus text exposition format."""
+    with _lock:
+        series = [('counter', k, v) for k, v in _counters.items()]
+        series += [('gauge', k, v) for k, v in _gauges.items()]
+    lines = []
+    typed = set()
+    for kind, (name, labels), value in sorted(series, key=lambda s: s[1]):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+    return '\n'.join(lines) + '\n'
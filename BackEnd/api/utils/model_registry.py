@@ -0,0 +1,263 @@
+"""
+Versioned model artifacts with background hot reload.
+
+Layout under api/models/:
+
+  <name>/<version>/<artifact files> + manifest.json
+
+publish() writes a version into a hidden staging directory and renames it
+into place, so a watcher never sees a half-written release. A daemon thread
+polls for the newest version, loads and validates it off the request path,
+and swaps it in with a single reference assignment. Callers take one
+snapshot per request (`loaded = registry.get()`) and keep using it, so
+in-flight requests finish on the model they started with.
+
+Deleting the newest version directory rolls back to the previous one on the
+next poll; a version that fails validation is skipped until it changes.
+Flat files directly in api/models/ (older deployments) load as version
+"legacy" when no versioned release exists.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from api.utils import metrics
+from api.utils.config import settings_dict
+
+MODELS_DIR = Path(__file__).resolve().parents[1] / "models"
+MANIFEST = "manifest.json"
+
+
+class LoadedModel(NamedTuple):
+    version: str
+    model: Any
+    loaded_at: float
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, name: str, files: Tuple[str, ...],
+                 loader: Callable[[Dict[str, Path]], Any],
+                 validator: Optional[Callable[[Any], None]] = None,
+                 root: Optional[Path] = None, poll_interval: Optional[float] = None,
+                 missing: str = ""):
+        """
+        :param name: Subdirectory holding this model's versions
+        :param files: Artifact file names every version must contain
+        :param loader: Builds the model from {file name: path}
+        :param validator: Raises if a loaded model is unusable (smoke prediction)
+        :param root: Models directory (default: settings.MODEL_REGISTRY['ROOT'] or api/models)
+        :param poll_interval: Seconds between checks for new versions; 0 disables the watcher
+        :param missing: What callers lose without a model, logged once if none loads
+        """
+        self.name = name
+        self.files = tuple(files)
+        self.loader = loader
+        self.validator = validator
+        self._root = Path(root) if root else None
+        self._poll_interval = poll_interval
+        self._active: Optional[LoadedModel] = None
+        self._rejected: Dict[str, float] = {}   # version -> manifest mtime when it failed
+        self._lock = threading.Lock()
+        self._thread = None
+        self._missing = missing
+        self._warned_missing = False
+
+    @property
+    def root(self) -> Path:
+        return self._root or Path(settings_dict("MODEL_REGISTRY").get("ROOT", MODELS_DIR))
+
+    @property
+    def poll_interval(self) -> float:
+        if self._poll_interval is not None:
+            return self._poll_interval
+        return float(settings_dict("MODEL_REGISTRY").get("POLL_INTERVAL", 10))
+
+    def get(self) -> Optional[LoadedModel]:
+        """Current model snapshot, loading on first use. None if nothing valid is installed."""
+        if self._active is None:
+            self.refresh()
+            if self._active is None and not self._warned_missing:
+                self._warned_missing = True
+                print(f"⚠️ No {self.name} model in {self.root}" + (f"; {self._missing}" if self._missing else ""))
+        self._ensure_watcher()
+        return self._active
+
+    @property
+    def version(self) -> Optional[str]:
+        active = self._active
+        return active.version if active else None
+
+    def versions(self) -> list:
+        """Complete versions on disk, newest first."""
+        base = self.root / self.name
+        if not base.is_dir():
+            return []
+        found = [p.name for p in base.iterdir()
+                 if p.is_dir() and not p.name.startswith(".") and (p / MANIFEST).exists()]
+        return sorted(found, reverse=True)
+
+    def refresh(self) -> bool:
+        """Load the newest valid version if it differs from the active one. Returns True on swap."""
+        with self._lock:
+            for version in self.versions():
+                if self._active is not None and version == self._active.version:
+                    return False
+                manifest_mtime = (self.root / self.name / version / MANIFEST).stat().st_mtime
+                if self._rejected.get(version) == manifest_mtime:
+                    continue
+                try:
+                    model = self._load_version(version)
+                except Exception as e:
+                    self._rejected[version] = manifest_mtime
+                    metrics.inc("model_reloads_total", model=self.name, outcome="rejected")
+                    print(f"⚠️ Rejected {self.name} model {version}: {e}")
+                    continue
+                self._swap(version, model)
+                return True
+            if self._active is None:
+                return self._load_legacy()
+            return False
+
+    def _load_version(self, version: str) -> Any:
+        directory = self.root / self.name / version
+        manifest = json.loads((directory / MANIFEST).read_text())
+        paths = {}
+        for file_name in self.files:
+            path = directory / file_name
+            expected = manifest.get("files", {}).get(file_name)
+            if expected is None or _sha256(path) != expected:
+                raise ValueError(f"{file_name} is missing or does not match the manifest")
+            paths[file_name] = path
+        model = self.loader(paths)
+        if self.validator is not None:
+            self.validator(model)
+        return model
+
+    def _load_legacy(self) -> bool:
+        paths = {f: self.root / f for f in self.files}
+        if not all(p.exists() for p in paths.values()):
+            return False
+        try:
+            model = self.loader(paths)
+            if self.validator is not None:
+                self.validator(model)
+        except Exception as e:
+            print(f"⚠️ Could not load legacy {self.name} model: {e}")
+            return False
+        self._swap("legacy", model)
+        return True
+
+    def _swap(self, version: str, model: Any) -> None:
+        previous = self._active
+        # Single reference assignment: readers see either the old or the new model
+        self._active = LoadedModel(version, model, time.time())
+        metrics.inc("model_reloads_total", model=self.name, outcome="loaded")
+        metrics.clear_gauge("model_info", model=self.name)
+        metrics.set_gauge("model_info", 1, model=self.name, version=version)
+        if previous is None:
+            print(f"✅ Loaded {self.name} model {version}")
+        else:
+            print(f"🔄 Swapped {self.name} model {previous.version} -> {version}")
+
+    def _ensure_watcher(self):
+        if self.poll_interval <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._watch, name=f"{self.name}-model-watcher", daemon=True
+                    )
+                    self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ {self.name} model watcher error: {e}")
+
+    def publish(self, write: Callable[[Path], None], version: Optional[str] = None) -> str:
+        """
+        Publish a new version: `write(directory)` creates the artifact files,
+        then the manifest is added and the directory renamed into place.
+        """
+        version = version or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        base = self.root / self.name
+        staging = base / f".staging-{version}-{os.getpid()}"
+        final = base / version
+        if final.exists():
+            raise FileExistsError(f"{self.name} model version {version} already exists")
+        staging.mkdir(parents=True)
+        try:
+            write(staging)
+            manifest = {
+                "version": version,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "files": {f: _sha256(staging / f) for f in self.files},
+            }
+            (staging / MANIFEST).write_text(json.dumps(manifest, indent=2))
+            os.rename(staging, final)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+
+# ---- Text diagnosis model (train_model.py) --------------------------------
+
+def _load_text_model(paths: Dict[str, Path]):
+    import joblib
+    return joblib.load(paths["depression_model.pkl"]), joblib.load(paths["emotion_encoder.pkl"])
+
+
+def _validate_text_model(model) -> None:
+    import numpy as np
+    clf, vectorizer = model
+    proba = clf.predict_proba(vectorizer.transform(["I have been feeling tired and low lately"]))
+    if proba.shape != (1, len(clf.classes_)) or not np.isclose(proba.sum(), 1.0):
+        raise ValueError("text model returned malformed probabilities")
+
+
+text_model = ModelRegistry(
+    "text", ("depression_model.pkl", "emotion_encoder.pkl"),
+    loader=_load_text_model, validator=_validate_text_model,
+)
+
+
+# ---- Emotion-feature risk model (train_risk_model.py) ---------------------
+
+def _load_risk_model(paths: Dict[str, Path]):
+    from api.utils.risk_model import RiskModel
+    return RiskModel.load(str(paths["risk_model.npz"]))
+
+
+def _validate_risk_model(model) -> None:
+    import numpy as np
+    from api.utils.risk_model import RISK_FEATURES
+    proba = model.predict_proba(np.full((2, len(RISK_FEATURES)), 1.0 / 7, dtype=np.float32))
+    if not np.all(np.isfinite(proba)) or not np.allclose(proba.sum(axis=1), 1.0, atol=1e-4):
+        raise ValueError("risk model returned malformed probabilities")
+
+
+risk_model = ModelRegistry(
+    "risk", ("risk_model.npz",),
+    loader=_load_risk_model, validator=_validate_risk_model,
+    missing="diagnoses will be 'unknown'",
+)
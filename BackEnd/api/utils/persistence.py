@@ -0,0 +1,199 @@
+"""
+Write-behind persistence for analyses and chat messages.
+
+Views hand finished records to a bounded in-memory queue and return
+immediately; a daemon thread drains the queue and writes rows with
+bulk_create in one transaction per batch. With the SQLite WAL settings in
+core/settings.py this keeps inserts off the request path and lets reads
+proceed while a batch commits.
+"""
+
+import atexit
+import hashlib
+import queue
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import EMOTION_KEYS, AnalysisResult, ChatMessage, ChatSession, pack_emotions
+from api.utils.risk_model import normalize_rows
+from api.utils.rollups import apply_analyses
+
+
+def hash_upload(uploaded_file) -> str:
+    """SHA-256 of an uploaded file, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def request_identity(request) -> Tuple[str, str]:
+    """
+    (user_id, session_id) for a request.
+    user_id is the authenticated Django user's pk, or '' for anonymous
+    callers: client-supplied user ids are never trusted. session_id comes
+    from the X-Session-Id header or the session_id field (body for POST,
+    query string for GET).
+    """
+    data = getattr(request, 'data', None) or getattr(request, 'query_params', None) or {}
+    user = getattr(request, 'user', None)
+    user_id = str(user.pk) if user is not None and user.is_authenticated else ''
+    session_id = request.headers.get('X-Session-Id') or data.get('session_id') or ''
+    return user_id[:64], str(session_id)[:64]
+
+
+class WriteBehindBuffer:
+    """Bounded queue of unsaved model instances flushed in batches by a daemon thread."""
+
+    def __init__(self, name: str, max_batch: int = 500, flush_interval: float = 1.0,
+                 max_pending: int = 20000):
+        self.name = name
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dropped = 0
+
+    def add(self, obj) -> None:
+        """Queue an unsaved instance; writes inline when write-behind is disabled."""
+        if not getattr(settings, 'PERSISTENCE_WRITE_BEHIND', True):
+            self._write([obj])
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(obj)
+        except queue.Full:
+            # Never block a request on storage; losing a history row is preferable
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"⚠️ {self.name} write queue full, dropped {self.dropped} rows")
+
+    def flush(self) -> int:
+        """Write everything queued so far from the calling thread."""
+        written = 0
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name=f"{self.name}-writer", daemon=True
+                    )
+                    self._thread.start()
+
+    def _drain(self, block: bool) -> List[Any]:
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.max_batch:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+            close_old_connections()
+
+    def _write(self, batch: List[Any]) -> None:
+        try:
+            with transaction.atomic():
+                type(batch[0]).objects.bulk_create(batch, batch_size=self.max_batch)
+                after_bulk_create(batch)
+        except Exception as e:
+            print(f"❌ Failed to persist {len(batch)} {self.name} rows: {e}")
+
+
+def after_bulk_create(batch: List[Any]) -> None:
+    """Bookkeeping that must commit together with a written batch."""
+    if isinstance(batch[0], ChatMessage):
+        _touch_sessions(batch)
+    elif isinstance(batch[0], AnalysisResult):
+        apply_analyses(batch)
+
+
+def _touch_sessions(messages: List[ChatMessage]) -> None:
+    counts = Counter(m.session_id for m in messages if m.session_id)
+    if not counts:
+        return
+    owners = {m.session_id: m.user_id for m in messages if m.session_id}
+    now = timezone.now()
+    ChatSession.objects.bulk_create(
+        [ChatSession(session_id=s, user_id=owners[s], created_at=now, updated_at=now) for s in counts],
+        ignore_conflicts=True,
+    )
+    for session_id, n in counts.items():
+        ChatSession.objects.filter(session_id=session_id).update(
+            message_count=F('message_count') + n, updated_at=now
+        )
+
+
+def emotion_proportions(emotions: Dict[str, float]) -> Dict[str, float]:
+    """
+    Emotions as proportions summing to 1, the scale every stored vector uses:
+    DeepFace reports percentages (0-100), the lite/fallback analyzers 0-1.
+    No emotions (e.g. no face) stay empty rather than becoming uniform.
+    """
+    row = np.array([[float(emotions.get(k) or 0.0) for k in EMOTION_KEYS]])
+    if row.sum() <= 0:
+        return {}
+    return dict(zip(EMOTION_KEYS, normalize_rows(row)[0].tolist()))
+
+
+analysis_buffer = WriteBehindBuffer('analysis')
+chat_buffer = WriteBehindBuffer('chat')
+
+
+def record_analysis(analysis_result: Dict[str, Any], user_id: str = '', session_id: str = '',
+                    content_hash: str = '', inference_ms: Optional[float] = None,
+                    advice_ms: Optional[float] = None, total_ms: Optional[float] = None) -> None:
+    """Queue a finished analysis for storage."""
+    analysis_buffer.add(AnalysisResult(
+        user_id=user_id,
+        session_id=session_id,
+        media_type=analysis_result.get('type', 'image'),
+        file_path=str(analysis_result.get('file_path', ''))[:255],
+        content_hash=content_hash,
+        emotion_vector=pack_emotions(emotion_proportions(analysis_result.get('emotions') or {})),
+        diagnosis=str(analysis_result.get('diagnosis', ''))[:32],
+        confidence=float(analysis_result.get('confidence') or 0.0),
+        inference_ms=inference_ms,
+        advice_ms=advice_ms,
+        total_ms=total_ms,
+    ))
+
+
+def record_chat_message(role: str, content: str, user_id: str = '', session_id: str = '',
+                        latency_ms: Optional[float] = None) -> None:
+    """Queue a chat turn for storage."""
+    chat_buffer.add(ChatMessage(
+        session_id=session_id, user_id=user_id, role=role, content=content, latency_ms=latency_ms
+    ))
+
+
+@atexit.register
+def _flush_on_exit():
+    for buffer in (analysis_buffer, chat_buffer):
+        try:
+            buffer.flush()
+        except Exception:
+            pass
@@ -0,0 +1,211 @@
+"""
+On-demand per-request profiling.
+
+ProfilingMiddleware profiles a request when it is asked to:
+  - the `X-Profile` header carries PROFILING['TOKEN'] (admin opt-in), or
+  - the user is staff and sends `X-Profile: 1`, or
+  - a random draw falls under PROFILING['SAMPLE_RATE'].
+`X-Profile-Mode: cprofile|sampler` picks the profiler (default MODE):
+  cprofile  deterministic; saves a .prof file for pstats/snakeviz
+  sampler   a background thread snapshots the request thread's stack every
+            SAMPLE_INTERVAL_MS; saves flamegraph-ready collapsed stacks
+Both only see the thread running the view, not thread-pool workers.
+
+Captures land in PROFILING['DIR'], a ring buffer of at most MAX_CAPTURES
+(oldest deleted first), each with a .json sidecar describing the request.
+The response carries `X-Profile-Id`; the admin endpoints under
+/api/admin/profiles list and download captures.
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from api.utils import metrics
+from api.utils.config import settings_dict
+
+CAPTURE_NAME = re.compile(r"^[0-9]{20}-[0-9a-f]{8}\.(prof|collapsed|json)$")
+MODES = ("cprofile", "sampler")
+
+
+def is_profiling_admin(request) -> bool:
+    """Staff users, or requests presenting PROFILING['TOKEN'] in X-Profile."""
+    user = getattr(request, "user", None)
+    if user is not None and getattr(user, "is_staff", False):
+        return True
+    token = settings_dict("PROFILING").get("TOKEN", "")
+    presented = request.headers.get("X-Profile", "")
+    return bool(token) and hmac.compare_digest(presented.encode(), token.encode())
+
+
+class StackSampler:
+    """Counts one thread's Python stacks at a fixed interval (collapsed-stack format)."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of captures."""
+
+    def __init__(self, directory: str, max_captures: int):
+        self.directory = Path(directory)
+        self.max_captures = max_captures
+        self._lock = threading.Lock()
+
+    def save(self, kind: str, write, meta: Dict[str, Any]) -> str:
+        """
+        :param kind: File extension, "prof" or "collapsed"
+        :param write: Callable writing the capture to the path it is given
+        :return: Capture id
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Microsecond timestamps keep ids in capture order
+        now = time.time()
+        stamp = time.strftime('%Y%m%d%H%M%S', time.localtime(now)) + f"{int(now % 1 * 1e6):06d}"
+        capture_id = f"{stamp}-{uuid.uuid4().hex[:8]}"
+        write(str(self.directory / f"{capture_id}.{kind}"))
+        meta = {**meta, "id": capture_id, "file": f"{capture_id}.{kind}"}
+        with open(self.directory / f"{capture_id}.json", "w") as f:
+            json.dump(meta, f)
+        self._trim()
+        return capture_id
+
+    def _trim(self) -> None:
+        with self._lock:
+            sidecars = sorted(self.directory.glob("*.json"))
+            for sidecar in sidecars[:max(len(sidecars) - self.max_captures, 0)]:
+                for path in self.directory.glob(f"{sidecar.stem}.*"):
+                    path.unlink(missing_ok=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        captures = []
+        for sidecar in sorted(self.directory.glob("*.json"), reverse=True):
+            try:
+                with open(sidecar) as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return captures
+
+    def path(self, name: str) -> Optional[Path]:
+        """Path of a capture file by name, or None (names are validated, never joined blindly)."""
+        if not CAPTURE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+_store = None
+
+
+def get_store() -> ProfileStore:
+    global _store
+    config = settings_dict("PROFILING")
+    directory = Path(config.get("DIR", "/tmp/depressoassist-profiles"))
+    max_captures = config.get("MAX_CAPTURES", 50)
+    if _store is None or (_store.directory, _store.max_captures) != (directory, max_captures):
+        _store = ProfileStore(directory, max_captures)
+    return _store
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _should_profile(self, request) -> bool:
+        if request.headers.get("X-Profile") and is_profiling_admin(request):
+            return True
+        rate = settings_dict("PROFILING").get("SAMPLE_RATE", 0.0)
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if request.path.startswith("/api/admin/profiles") or not self._should_profile(request):
+            return self.get_response(request)
+
+        config = settings_dict("PROFILING")
+        mode = request.headers.get("X-Profile-Mode", config.get("MODE", "sampler"))
+        if mode not in MODES:
+            mode = "sampler"
+        profiler = sampler = None
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active in this process
+                profiler, mode = None, "sampler"
+        if profiler is None:
+            sampler = StackSampler(threading.get_ident(), config.get("SAMPLE_INTERVAL_MS", 5) / 1000.0)
+            sampler.start()
+
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        meta = {
+            "method": request.method,
+            "path": request.path,
+            "status": getattr(response, "status_code", None),
+            "duration_ms": round(duration_ms, 1),
+            "mode": mode,
+            "created": time.time(),
+        }
+        try:
+            if profiler is not None:
+                capture_id = get_store().save("prof", profiler.dump_stats, meta)
+            else:
+                collapsed = sampler.collapsed()
+
+                def write(path):
+                    with open(path, "w") as f:
+                        f.write(collapsed)
+
+                capture_id = get_store().save("collapsed", write, {**meta, "samples": sampler.samples})
+            response["X-Profile-Id"] = capture_id
+            metrics.inc("profiles_captured_total", mode=mode)
+        except OSError as e:
+            print(f"⚠️ Could not save profile capture: {e}")
+        return response
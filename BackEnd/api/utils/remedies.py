@@ -1,32 +1,246 @@
+"""
+Remedy suggestions retrieved by similarity to what the user wrote.
+
+remedies.json is a library of tips, each with categories, the severity
+range it suits (0 = low risk, 0.5 = mild, 1 = moderate, 2 = severe, see
+SEVERITY) and extra keywords. RemedyIndex precomputes Okapi
+BM25 weights for every (term, tip) pair when it loads, as an inverted
+index of numpy arrays. Retrieval is a tokenization, one postings lookup per
+query term and one bincount, followed by a severity/category mask and a
+top-k partition: well under a millisecond for libraries of a few thousand tips.
+
+Larger corpora can be indexed ahead of time with build_remedy_index.py; a
+prebuilt index at REMEDIES['INDEX_PATH'] is loaded instead of remedies.json.
+The index is loaded on first use, not at import.
+"""
+
 import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from api.utils import metrics
+from api.utils.config import settings_dict
+
+REMEDIES_PATH = os.path.join(os.path.dirname(__file__), "remedies.json")
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "remedy_index.npz")
+
+FALLBACK_SUGGESTIONS = [
+    "Practice a brief grounding exercise (5-4-3-2-1).",
+    "Step outside or near a window for fresh air and light.",
+    "Message a trusted person to check in.",
+    "Drink water and have a small, nourishing snack.",
+    "Plan one gentle activity you enjoy (music, walk, journaling).",
+]
+
+# Severity of every diagnosis label the text and risk models produce
+SEVERITY = {
+    'no_risk': 0.0, 'low_risk': 0.0, 'minimal': 0.0, 'none': 0.0, 'not_depressed': 0.0,
+    'mild': 0.5, 'mild_risk': 0.5,
+    'moderate': 1.0, 'moderate_risk': 1.0, 'anxiety': 1.0,
+    'severe': 2.0, 'high_risk': 2.0, 'depressed': 2.0, 'depression': 2.0,
+}
+
+# By severity, so "high_risk" gets the same intro as "severe"
+INTROS = {
+    2.0: "I'm really glad you reached out. Let's take small, gentle steps together.",
+    1.0: "Thanks for sharing. Here are a few practices that many find helpful.",
+    0.5: "A few light habits can make a meaningful difference over time.",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by can do for from had has have i i'm im in is it its just me my "
+    "of on or so that the their them then there they this to too very was we were what when with you your".split()
+)
+_SUFFIXES = ("ing", "ness", "ed", "ly", "es", "s")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words without stopwords, with common suffixes stripped."""
+    tokens = []
+    for word in _TOKEN.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+
+def load_library(path: str) -> List[Dict[str, Any]]:
+    """
+    Read remedies from JSON ({"remedies": [...]} or the older
+    {"category": ["tip", ...]} layout) or JSON Lines (one remedy per line).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            if isinstance(data, dict) and "remedies" in data:
+                entries = data["remedies"]
+            else:
+                entries = [{"text": tip, "categories": [category]}
+                           for category, tips in data.items() for tip in tips]
+    for i, entry in enumerate(entries):
+        entry.setdefault("id", str(i))
+        entry.setdefault("categories", [])
+        entry.setdefault("severity", [0, 2])
+    return entries
+
+
+class RemedyIndex:
+    def __init__(self, entries: List[Dict[str, Any]], terms: List[str], indptr: np.ndarray,
+                 doc_ids: np.ndarray, weights: np.ndarray):
+        """
+        Use RemedyIndex.build(entries) or RemedyIndex.load(path).
+        Postings of terms[i] are doc_ids/weights[indptr[i]:indptr[i + 1]].
+        """
+        self.entries = entries
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self._severity = np.array([e["severity"] for e in entries], dtype=np.float64).reshape(len(entries), 2)
+        self._pinned = np.array([bool(e.get("pin")) for e in entries])
+        self._category_masks: Dict[str, np.ndarray] = {}
+        self._by_category: Optional[Dict[str, List[str]]] = None
+        for i, entry in enumerate(entries):
+            for category in entry["categories"]:
+                self._category_masks.setdefault(category, np.zeros(len(entries), dtype=bool))[i] = True
 
-# Load remedies JSON
-with open("api/utils/remedies.json", "r") as f:
-    REMEDIES = json.load(f)
+    @classmethod
+    def build(cls, entries: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75) -> "RemedyIndex":
+        """Precompute BM25 weights over each tip's text and keywords."""
+        docs = [tokenize(f"{e['text']} {e.get('keywords', '')}") for e in entries]
+        lengths = np.array([len(d) for d in docs], dtype=np.float64)
+        avg_length = lengths.mean() if len(docs) else 0.0
+        postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, tokens in enumerate(docs):
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
 
-def personalize_remedies(user_text: str, diagnosis: str):
+        terms = sorted(postings)
+        indptr, doc_ids, weights = [0], [], []
+        for term in terms:
+            ids = np.fromiter(postings[term].keys(), dtype=np.int32)
+            tf = np.fromiter(postings[term].values(), dtype=np.float64)
+            idf = np.log(1.0 + (len(docs) - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[ids] / max(avg_length, 1e-9))
+            doc_ids.append(ids)
+            weights.append((idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+            indptr.append(indptr[-1] + len(ids))
+        return cls(
+            entries, terms, np.array(indptr, dtype=np.int64),
+            np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int32),
+            np.concatenate(weights) if weights else np.empty(0, dtype=np.float32),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RemedyIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(json.loads(str(data["entries"])), [str(t) for t in data["terms"]],
+                       data["indptr"], data["doc_ids"], data["weights"])
+
+    def save(self, path: str) -> None:
+        terms = sorted(self.terms, key=self.terms.get)
+        np.savez_compressed(
+            path, entries=np.array(json.dumps(self.entries)), terms=np.array(terms, dtype=str),
+            indptr=self.indptr, doc_ids=self.doc_ids, weights=self.weights,
+        )
+
+    def scores(self, text: str) -> np.ndarray:
+        """BM25 score of every tip for `text`."""
+        ids = [self.terms[t] for t in tokenize(text) if t in self.terms]
+        if not ids:
+            return np.zeros(len(self.entries))
+        spans = [slice(self.indptr[i], self.indptr[i + 1]) for i in ids]
+        return np.bincount(np.concatenate([self.doc_ids[s] for s in spans]),
+                           weights=np.concatenate([self.weights[s] for s in spans]),
+                           minlength=len(self.entries))
+
+    def search(self, text: str, k: int = 5, severity: Optional[float] = None,
+               category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k tips for `text` among those suiting `severity` (and `category`).
+        Pinned tips in range come first; ties keep library order, so an empty
+        text returns the first matching tips.
+        """
+        mask = np.ones(len(self.entries), dtype=bool)
+        if severity is not None:
+            mask &= (self._severity[:, 0] <= severity) & (severity <= self._severity[:, 1])
+        if category in self._category_masks:
+            mask &= self._category_masks[category]
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        scores = self.scores(text)[candidates]
+        # Pinned tips outrank any similarity score
+        rank = scores + self._pinned[candidates] * (scores.max() + 1.0)
+        top = np.argpartition(-rank, k - 1)[:k] if len(candidates) > k else np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -rank[top]))]
+        return [{**self.entries[candidates[i]], "score": float(scores[i])} for i in top]
+
+    def by_category(self) -> Dict[str, List[str]]:
+        if self._by_category is None:
+            grouped: Dict[str, List[str]] = {}
+            for entry in self.entries:
+                for category in entry["categories"]:
+                    grouped.setdefault(category, []).append(entry["text"])
+            self._by_category = grouped
+        return self._by_category
+
+
+def _load_index() -> RemedyIndex:
+    config = settings_dict("REMEDIES")
+    index_path = config.get("INDEX_PATH") or DEFAULT_INDEX_PATH
+    if os.path.exists(index_path):
+        index = RemedyIndex.load(index_path)
+        print(f"✅ Loaded remedy index ({len(index.entries)} remedies) from {index_path}")
+        return index
+    return RemedyIndex.build(load_library(config.get("PATH", REMEDIES_PATH)),
+                             k1=config.get("K1", 1.2), b=config.get("B", 0.75))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> RemedyIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _load_index()
+    return _index
+
+
+def remedies_by_category() -> Dict[str, List[str]]:
+    """Category -> tips, for the intent router's coping replies."""
+    return get_index().by_category()
+
+
+def personalize_remedies(user_text: str, diagnosis: str, k: Optional[int] = None):
     """Return empathetic, actionable suggestions without external model deps.
 
-    - Pulls baseline tips from remedies.json using diagnosis key if present
+    - Retrieves the tips most similar to the user's text, among those that
+      suit the diagnosis' severity (and its category, e.g. "anxiety")
     - Prepends a brief empathetic intro tailored to the diagnosis
     """
-    baseline = REMEDIES.get(diagnosis, [])
-    intro_map = {
-        "severe": "I'm really glad you reached out. Let's take small, gentle steps together.",
-        "moderate": "Thanks for sharing. Here are a few practices that many find helpful.",
-        "mild": "A few light habits can make a meaningful difference over time.",
-    }
-    intro = intro_map.get(str(diagnosis).lower(), "Here are supportive tips you can try at your own pace.")
-    if not baseline:
-        baseline = [
-            "Practice a brief grounding exercise (5-4-3-2-1).",
-            "Step outside or near a window for fresh air and light.",
-            "Message a trusted person to check in.",
-            "Drink water and have a small, nourishing snack.",
-            "Plan one gentle activity you enjoy (music, walk, journaling).",
-        ]
-
+    label = str(diagnosis).lower()
+    severity = SEVERITY.get(label)
+    hits = get_index().search(user_text or "", k or settings_dict("REMEDIES").get("TOP_K", 5),
+                              severity=severity, category=label)
+    metrics.inc("remedy_searches_total")
+    intro = INTROS.get(severity, "Here are supportive tips you can try at your own pace.")
     return {
         "intro": intro,
-        "suggestions": baseline,
+        "suggestions": [hit["text"] for hit in hits] or list(FALLBACK_SUGGESTIONS),
     }
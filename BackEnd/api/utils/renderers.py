@@ -0,0 +1,138 @@
+"""
+Response serialization for the API and the emotion websocket.
+
+FastJSONRenderer is the default DRF renderer. It encodes with orjson, which
+serializes NumPy arrays and scalars natively (np.float64 emotion scores
+included), and falls back to DRF's encoder plus a NumPy hook when orjson
+isn't installed.
+
+Clients that want smaller payloads ask for compact mode with `?compact=1`
+or `Accept: application/json; compact=1`:
+  - floats are rounded to COMPACT_PRECISION digits
+  - every {emotion: score} dict becomes a list of scores in the order of
+    the top-level "emotion_keys" field
+The emotion websocket takes the same `?compact=1` and can send MessagePack
+binary frames instead of JSON text with `?format=msgpack`.
+"""
+
+import json
+from typing import Any, Optional, Tuple
+
+import numpy as np
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.mediatypes import _MediaType
+
+from api.utils.lite_emotion import EMOTION_KEYS
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+COMPACT_PRECISION = 4
+_EMOTION_KEY_SET = frozenset(EMOTION_KEYS)
+
+
+def to_native(obj: Any) -> Any:
+    """Fallback hook for types the encoders don't know (NumPy, sets)."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not serializable: {type(obj).__name__}")
+
+
+def _compact(value: Any, precision: int, found: list) -> Any:
+    if isinstance(value, dict):
+        if value and value.keys() == _EMOTION_KEY_SET:
+            found.append(True)
+            return [round(float(value[k]), precision) for k in EMOTION_KEYS]
+        return {k: _compact(v, precision, found) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v, precision, found) for v in value]
+    if isinstance(value, np.ndarray):
+        return _compact(value.tolist(), precision, found)
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), precision)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def compact(data: Any, precision: int = COMPACT_PRECISION) -> Any:
+    """Rounded floats and emotion dicts as arrays (order given by "emotion_keys")."""
+    found = []
+    result = _compact(data, precision, found)
+    if found and isinstance(result, dict):
+        result = {**result, "emotion_keys": EMOTION_KEYS}
+    return result
+
+
+def _default(obj: Any) -> Any:
+    """
+    Hook for orjson and msgpack: NumPy, then everything DRF's encoder handles
+    (Decimal, lazy translations, timedelta, QuerySet, ...).
+    """
+    return _fallback_encoder.default(obj)
+
+
+def dumps(data: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=NumpyJSONEncoder, separators=(",", ":")).encode()
+
+
+def encode_message(data: Any, fmt: str = "json", compact_mode: bool = False) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Websocket frame for `data`: (text_data, bytes_data), one of them None.
+    :param fmt: "json" (text frames) or "msgpack" (binary frames)
+    """
+    if compact_mode:
+        data = compact(data)
+    if fmt == "msgpack" and MSGPACK_AVAILABLE:
+        return None, msgpack.packb(data, default=_default, use_bin_type=True)
+    return dumps(data).decode(), None
+
+
+class NumpyJSONEncoder(JSONEncoder):
+    def default(self, obj):
+        try:
+            return to_native(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+_fallback_encoder = NumpyJSONEncoder()
+
+
+def wants_compact(request, accepted_media_type: Optional[str] = None) -> bool:
+    if request is not None and request.query_params.get("compact") in ("1", "true"):
+        return True
+    if accepted_media_type:
+        return _MediaType(accepted_media_type).params.get("compact") in ("1", "true")
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder_class = NumpyJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if wants_compact(renderer_context.get("request"), accepted_media_type):
+            data = compact(data)
+        if not ORJSON_AVAILABLE or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
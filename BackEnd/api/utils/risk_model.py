@@ -0,0 +1,101 @@
+"""
+Depression-risk classifier over emotion vectors.
+
+Features are the normalized mean emotion distribution plus its per-emotion
+standard deviation over a video's sampled frames (zero for single images),
+so the model sees both how someone looks on average and how much that
+varies. The scorer is multinomial logistic regression with the feature
+standardization folded into the weights: one matmul and a softmax for a
+whole batch.
+
+Train with `python -m api.utils.train_risk_model`; the artifact is served
+through the model registry (api/models/risk/<version>/risk_model.npz).
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from api.utils.lite_emotion import EMOTION_KEYS, TimelineStats, softmax
+
+RISK_FEATURES = [f"{k}_mean" for k in EMOTION_KEYS] + [f"{k}_std" for k in EMOTION_KEYS]
+
+
+def emotion_matrix(rows: Sequence[Dict[str, float]]) -> np.ndarray:
+    """
+    (n, 7) matrix of emotion distributions. Rows are normalized to sum to 1,
+    which also maps DeepFace's 0-100 scores onto the 0-1 scale of the other
+    backends; an all-zero row becomes uniform.
+    """
+    matrix = np.array([[float(r.get(k, 0.0)) for k in EMOTION_KEYS] for r in rows], dtype=np.float64)
+    return normalize_rows(matrix.reshape(-1, len(EMOTION_KEYS)))
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.clip(np.asarray(matrix, dtype=np.float64), 0.0, None)
+    totals = matrix.sum(axis=1, keepdims=True)
+    uniform = np.full_like(matrix, 1.0 / matrix.shape[1])
+    return np.where(totals > 0, matrix / np.where(totals > 0, totals, 1.0), uniform)
+
+
+def risk_features(means: np.ndarray, stds: Optional[np.ndarray] = None) -> np.ndarray:
+    """(n, 14) feature matrix from mean and std emotion matrices."""
+    means = np.atleast_2d(means)
+    stds = np.zeros_like(means) if stds is None else np.atleast_2d(stds)
+    return np.hstack([means, stds]).astype(np.float32)
+
+
+class RiskModel:
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, classes: Sequence[str],
+                 mean: np.ndarray, std: np.ndarray):
+        """
+        :param weights: (14, n_classes) weights over standardized features
+        :param bias: (n_classes,) bias
+        :param classes: Diagnosis label per output column
+        :param mean, std: Feature standardization from training
+        """
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.classes = np.array([str(c) for c in classes])
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        if self.weights.shape != (len(RISK_FEATURES), len(self.classes)):
+            raise ValueError(f"Risk weights have shape {self.weights.shape}, expected "
+                             f"({len(RISK_FEATURES)}, {len(self.classes)})")
+        # ((x - mean) / std) @ W + b == x @ (W / std) + (b - (mean / std) @ W)
+        self._w = self.weights / self.std[:, None]
+        self._b = self.bias - (self.mean / self.std) @ self.weights
+
+    @classmethod
+    def load(cls, path: str) -> "RiskModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["W"], data["b"], data["classes"], data["mean"], data["std"])
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, W=self.weights, b=self.bias, classes=self.classes,
+                            mean=self.mean, std=self.std)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """(n, 14) features -> (n, n_classes) probabilities."""
+        return softmax(np.atleast_2d(features).astype(np.float32) @ self._w + self._b)
+
+    def score(self, means: np.ndarray, stds: Optional[np.ndarray] = None) -> List[Dict[str, object]]:
+        """Diagnosis and confidence for a batch of (already normalized) emotion vectors."""
+        proba = self.predict_proba(risk_features(means, stds))
+        best = proba.argmax(axis=1)
+        return [{"diagnosis": str(self.classes[i]), "confidence": float(p)}
+                for i, p in zip(best, proba[np.arange(len(best)), best])]
+
+    def assess_batch(self, rows: Sequence[Dict[str, float]]) -> List[Dict[str, object]]:
+        """Risk for many emotion dicts (any scale) in one vectorized pass."""
+        return self.score(emotion_matrix(rows))
+
+    def assess(self, emotions: Dict[str, float], timeline: Optional[TimelineStats] = None) -> Dict[str, object]:
+        """Risk for one analysis; `timeline` adds the video's emotion variability."""
+        if timeline is not None and timeline.count:
+            mean, std = timeline.mean(), timeline.std()
+            total = mean.sum()
+            # Same normalization as emotion_matrix, applied to the std too
+            stds = std / total if total > 0 else np.zeros_like(std)
+            return self.score(normalize_rows(mean[None, :]), stds[None, :])[0]
+        return self.score(emotion_matrix([emotions]))[0]
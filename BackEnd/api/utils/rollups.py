@@ -0,0 +1,143 @@
+"""
+Incremental per-user emotion rollups.
+
+Every analysis batch written by the persistence layer is folded into hourly
+and daily EmotionRollup rows (count, emotion vector sum, confidence
+sum/min/max, per-diagnosis counts) in the same transaction. Trend queries
+read one row per bucket, so their cost depends on the requested range, not
+on how many analyses a user has.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import EMOTION_KEYS, AnalysisResult, EmotionRollup, unpack_emotions
+
+GRANULARITIES = {'hour': 'h', 'day': 'd'}
+DEFAULT_WINDOWS = {'h': timedelta(hours=48), 'd': timedelta(days=30)}
+MAX_BUCKETS = 24 * 90
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Start of the UTC hour/day containing `ts` (naive datetimes are taken as UTC)."""
+    ts = ts.replace(tzinfo=dt_timezone.utc) if timezone.is_naive(ts) else ts.astimezone(dt_timezone.utc)
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if granularity == 'd' else ts
+
+
+class _Delta:
+    __slots__ = ('count', 'emotion_sum', 'confidence_sum', 'min_conf', 'max_conf', 'diagnoses')
+
+    def __init__(self):
+        self.count = 0
+        self.emotion_sum = [0.0] * len(EMOTION_KEYS)
+        self.confidence_sum = 0.0
+        self.min_conf = None
+        self.max_conf = None
+        self.diagnoses = {}
+
+    def add(self, emotions: Dict[str, float], diagnosis: str, confidence: float):
+        self.count += 1
+        for i, key in enumerate(EMOTION_KEYS):
+            self.emotion_sum[i] += emotions.get(key, 0.0)
+        self.confidence_sum += confidence
+        self.min_conf = confidence if self.min_conf is None else min(self.min_conf, confidence)
+        self.max_conf = confidence if self.max_conf is None else max(self.max_conf, confidence)
+        self.diagnoses[diagnosis] = self.diagnoses.get(diagnosis, 0) + 1
+
+
+def _collect(analyses: Iterable[AnalysisResult]) -> Dict[Tuple[str, str, datetime], _Delta]:
+    deltas = {}
+    for analysis in analyses:
+        emotions = unpack_emotions(analysis.emotion_vector)
+        for granularity in GRANULARITIES.values():
+            key = (analysis.user_id, granularity, bucket_start(analysis.created_at, granularity))
+            deltas.setdefault(key, _Delta()).add(emotions, analysis.diagnosis, analysis.confidence)
+    return deltas
+
+
+def apply_analyses(analyses: List[AnalysisResult]) -> None:
+    """
+    Fold a batch of analyses into their rollup rows.
+    The batch is pre-aggregated in memory, so each touched bucket costs one
+    read and one write regardless of batch size.
+    """
+    deltas = _collect(analyses)
+    if not deltas:
+        return
+    with transaction.atomic():
+        for (user_id, granularity, start), delta in deltas.items():
+            rollup, _ = EmotionRollup.objects.select_for_update().get_or_create(
+                user_id=user_id, granularity=granularity, bucket_start=start,
+            )
+            current = rollup.get_emotion_sum()
+            rollup.set_emotion_sum([a + b for a, b in zip(current, delta.emotion_sum)])
+            rollup.count += delta.count
+            rollup.confidence_sum += delta.confidence_sum
+            rollup.min_confidence = delta.min_conf if rollup.min_confidence is None else min(rollup.min_confidence, delta.min_conf)
+            rollup.max_confidence = delta.max_conf if rollup.max_confidence is None else max(rollup.max_confidence, delta.max_conf)
+            counts = dict(rollup.diagnosis_counts)
+            for diagnosis, n in delta.diagnoses.items():
+                counts[diagnosis] = counts.get(diagnosis, 0) + n
+            rollup.diagnosis_counts = counts
+            rollup.save()
+
+
+def rebuild_rollups(user_id: Optional[str] = None, chunk_size: int = 2000) -> int:
+    """Recompute rollups from stored analyses (e.g. after a backfill). Returns rows folded."""
+    rollups = EmotionRollup.objects.all()
+    analyses = AnalysisResult.objects.all()
+    if user_id is not None:
+        rollups = rollups.filter(user_id=user_id)
+        analyses = analyses.filter(user_id=user_id)
+    rollups.delete()
+    folded, last_id = 0, 0
+    while True:
+        batch = list(analyses.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not batch:
+            return folded
+        apply_analyses(batch)
+        folded += len(batch)
+        last_id = batch[-1].id
+
+
+def _serialize(rollup: EmotionRollup) -> Dict[str, Any]:
+    count = rollup.count or 1
+    return {
+        'bucket_start': rollup.bucket_start.isoformat(),
+        'count': rollup.count,
+        'mean_emotions': {k: v / count for k, v in zip(EMOTION_KEYS, rollup.get_emotion_sum())},
+        'diagnosis_counts': rollup.diagnosis_counts,
+        'mean_confidence': rollup.confidence_sum / count,
+        'min_confidence': rollup.min_confidence,
+        'max_confidence': rollup.max_confidence,
+    }
+
+
+def emotion_trends(user_id: str, granularity: str = 'day', start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Per-bucket trend series for a user, read straight from the rollups.
+    :param granularity: 'hour' or 'day'
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError("granularity must be 'hour' or 'day'")
+    code = GRANULARITIES[granularity]
+    end = end or timezone.now()
+    start = start or end - DEFAULT_WINDOWS[code]
+    if start > end:
+        raise ValueError("start must be before end")
+    rows = (EmotionRollup.objects
+            .filter(user_id=user_id, granularity=code,
+                    bucket_start__gte=bucket_start(start, code), bucket_start__lte=end)
+            .order_by('bucket_start')[:MAX_BUCKETS])
+    return {
+        'user_id': user_id,
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets': [_serialize(r) for r in rows],
+    }
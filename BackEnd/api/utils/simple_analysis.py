@@ -1,11 +1,22 @@
 """
 Simple Emotion Analysis without DeepFace dependencies
-Provides fallback emotion detection for demo purposes
+Uses the lightweight NumPy emotion model (lite_emotion.py) on face crops
 """
 
 import os
-from typing import Any, Dict
-import joblib
+from typing import Any, Dict, Optional
+
+try:
+    from api.utils.frame_filters import FaceGate, no_face_result
+    from api.utils.lite_emotion import get_lite_model
+    from api.utils.multi_face import analyze_group_image
+    from api.utils.model_registry import LoadedModel, risk_model
+    from api.utils.risk_model import RiskModel
+except ImportError:
+    FaceGate = None
+    analyze_group_image = None
+    get_lite_model = lambda: None
+    risk_model = None
 
 class SimpleEmotionAnalyzer:
     """Simple emotion analyzer that works without DeepFace"""
@@ -13,27 +24,30 @@ class SimpleEmotionAnalyzer:
     def __init__(self, clf_path: str = None):
         """
         Initialize the analyzer.
-        :param clf_path: Path to a trained depression model (.pkl)
+        :param clf_path: Path to a trained risk model (.npz); pins that file
+                         instead of following the hot-reloaded registry version
         """
-        self.clf = None
+        self._pinned = None
         self.emotion_keys = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
         
-        # Try to load the depression model if available
-        if clf_path is None:
-            clf_path = os.path.join(os.path.dirname(__file__), "..", "models", "depression_model.pkl")
-        
-        if os.path.exists(clf_path):
+        # Try to load the risk model if available
+        if risk_model is None:
+            print("⚠️ NumPy not available, using heuristic risk prediction")
+        elif clf_path is not None:
             try:
-                self.clf = joblib.load(clf_path)
-                print(f"✅ Loaded depression model from {clf_path}")
+                self._pinned = LoadedModel(os.path.basename(clf_path), RiskModel.load(clf_path), 0.0)
+                print(f"✅ Loaded risk model from {clf_path}")
             except Exception as e:
-                print(f"⚠️ Could not load depression model: {e}")
-        else:
-            print(f"⚠️ Depression model not found at {clf_path}")
+                print(f"⚠️ Could not load risk model: {e}")
+        elif risk_model.get() is None:
+            print(f"⚠️ Risk model not found in {risk_model.root}, using heuristic risk prediction")
+
+        # NumPy emotion model for the actual pixel analysis
+        self.lite_model = get_lite_model()
     
     def extract_emotions_image(self, img_path: str) -> Dict[str, float]:
         """
-        Extract emotions from an image using fallback method.
+        Extract emotions from an image using the lite NumPy model.
         """
         print(f"📸 Analyzing image: {img_path}")
         
@@ -50,13 +64,49 @@ class SimpleEmotionAnalyzer:
         
         print(f"📊 File size: {file_size} bytes")
         
-        # For demo purposes, return varied emotions based on file size
-        # This simulates different emotion patterns
-        emotions = self._get_varied_emotions(file_size)
-        print(f"🎭 Generated emotions: {emotions}")
+        if self.lite_model is None:
+            print("⚠️ Lite emotion model not loaded, using default emotions")
+            return self._get_default_emotions()
+        
+        emotions = self.lite_model.extract_emotions_image(img_path)
+        if emotions is None:
+            print(f"⚠️ Could not decode image: {img_path}")
+            return self._get_default_emotions()
         
+        print(f"🎭 Detected emotions: {emotions}")
         return emotions
     
+    def extract_emotions_video(self, video_path: str, frame_skip: int = 30) -> Dict[str, float]:
+        """
+        Extract averaged emotions from sampled video frames using the lite model.
+        """
+        timeline = self.extract_video_timeline(video_path, frame_skip)
+        return timeline.to_dict() if timeline and timeline.count else self._get_default_emotions()
+    
+    def extract_video_timeline(self, video_path: str, frame_skip: int = 30):
+        """
+        Per-emotion mean/std over sampled video frames (None if unavailable).
+        """
+        print(f"🎬 Analyzing video: {video_path}")
+        if self.lite_model is None or not os.path.exists(video_path):
+            return None
+        
+        timeline = self.lite_model.extract_video_timeline(video_path, frame_skip=frame_skip)
+        if timeline is None:
+            print(f"⚠️ No frames could be analyzed: {video_path}")
+        return timeline
+    
+    def extract_emotions_frame(self, frame) -> Optional[Dict[str, float]]:
+        """
+        Extract emotions from a decoded BGR frame using the lite model.
+        Returns None when the frame has no face.
+        """
+        if FaceGate is not None and not FaceGate().has_face(frame):
+            return None
+        if self.lite_model is None:
+            return self._get_default_emotions()
+        return self.lite_model.to_dict(self.lite_model.predict_images([frame])[0])
+    
     def _get_default_emotions(self) -> Dict[str, float]:
         """Get default neutral emotions"""
         return {
@@ -69,41 +119,17 @@ class SimpleEmotionAnalyzer:
             'neutral': 0.60
         }
     
-    def _get_varied_emotions(self, file_size: int) -> Dict[str, float]:
-        """Generate varied emotions based on file size for demo"""
-        # Use file size to create some variation
-        size_factor = (file_size % 1000) / 1000.0
-        
-        emotions = {
-            'angry': max(0.01, 0.1 - size_factor * 0.08),
-            'disgust': max(0.01, 0.05 - size_factor * 0.03),
-            'fear': max(0.01, 0.08 - size_factor * 0.05),
-            'happy': max(0.1, 0.3 + size_factor * 0.1),
-            'sad': max(0.05, 0.2 - size_factor * 0.1),
-            'surprise': max(0.02, 0.1 + size_factor * 0.05),
-            'neutral': max(0.3, 0.5 - size_factor * 0.1)
-        }
-        
-        # Normalize to sum to 1
-        total = sum(emotions.values())
-        return {k: v / total for k, v in emotions.items()}
-    
-    def predict_depression(self, emotions: Dict[str, float]) -> Dict[str, Any]:
+    def predict_depression(self, emotions: Dict[str, float], timeline=None) -> Dict[str, Any]:
         """
-        Predict depression risk using the trained model or fallback.
+        Predict depression risk using the risk model or fallback.
+        :param timeline: Frame statistics for videos (adds emotion variability)
         """
-        if self.clf is not None:
-            try:
-                import numpy as np
-                features = np.array(list(emotions.values())).reshape(1, -1)
-                pred = self.clf.predict(features)[0]
-                conf = float(self.clf.predict_proba(features).max())
-                return {"diagnosis": pred, "confidence": conf}
-            except Exception as e:
-                print(f"⚠️ Model prediction failed: {e}")
+        loaded = self._pinned or (risk_model.get() if risk_model is not None else None)
+        if loaded is not None:
+            return {**loaded.model.assess(emotions, timeline), "model_version": loaded.version}
         
         # Fallback prediction based on emotion patterns
-        return self._fallback_depression_prediction(emotions)
+        return {**self._fallback_depression_prediction(emotions), "model_version": "heuristic"}
     
     def _fallback_depression_prediction(self, emotions: Dict[str, float]) -> Dict[str, Any]:
         """Fallback depression prediction based on emotion ratios"""
@@ -130,10 +156,16 @@ class SimpleEmotionAnalyzer:
             "confidence": risk_score
         }
     
-    def analyze_image(self, file_path: str) -> Dict[str, Any]:
+    def analyze_image(self, file_path: str, multi_face: bool = False, aggregate: str = None) -> Dict[str, Any]:
         """
         Analyze an image for emotions and depression risk.
+        :param multi_face: Analyze every face (one batch) instead of the first
+        :param aggregate: How per-face emotions are combined ("mean", "area", "largest")
         """
+        if multi_face and analyze_group_image is not None:
+            return analyze_group_image(self, file_path, aggregate)
+        if FaceGate is not None and not FaceGate().image_has_face(file_path):
+            return no_face_result("image", file_path)
         emotions = self.extract_emotions_image(file_path)
         depression = self.predict_depression(emotions)
         
@@ -148,14 +180,17 @@ class SimpleEmotionAnalyzer:
         """
         Analyze a video for emotions and depression risk.
         """
-        # For simplicity, treat video same as image for now
-        emotions = self.extract_emotions_image(file_path)
-        depression = self.predict_depression(emotions)
+        timeline = self.extract_video_timeline(file_path)
+        if timeline is not None and not timeline.count:
+            return no_face_result("video", file_path, timeline.frame_stats())
+        emotions = timeline.to_dict() if timeline else self._get_default_emotions()
+        depression = self.predict_depression(emotions, timeline)
         
         return {
             "type": "video",
             "file_path": file_path,
             "emotions": emotions,
+            "frames": timeline.frame_stats() if timeline else None,
             **depression
         }
 
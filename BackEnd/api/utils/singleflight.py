@@ -0,0 +1,243 @@
+"""
+Single-flight coalescing for duplicate in-flight work.
+
+When a client retries a slow upload or double-submits a message, the
+second request should wait for the first one's result instead of running
+DeepFace or Gemini again. `SingleFlight.do(key, fn)` runs `fn` once per key
+at a time; concurrent callers with the same key block and share its result
+(or its exception). Nothing is cached after the call finishes. Followers
+wait in WAIT_SLICE steps, calling check_cancelled() in between, so their own
+deadline or disconnect still applies; after MAX_WAIT seconds on a leader that
+hasn't finished they stop waiting and run `fn` themselves.
+
+With SINGLEFLIGHT['CROSS_PROCESS'] enabled, the in-process leader also takes
+an flock on a per-key file, so workers on the same host coalesce too: the
+first worker runs `fn` and leaves the result behind as JSON for RESULT_TTL
+seconds; the others block on the lock and pick it up (NumPy values come back
+as plain floats and lists). Results that aren't JSON-serializable aren't
+shared: the other workers run `fn` themselves.
+The directory (LOCK_DIR, under the app's run/ directory by default) must be
+private to the server's user; otherwise cross-process coalescing is skipped.
+"""
+
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from api.utils import metrics
+from api.utils.cancellation import Cancelled, check_cancelled
+from api.utils.config import settings_dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+_MISSING = object()
+
+DEFAULT_LOCK_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "run", "singleflight")
+
+
+def _try_flock(fd: int, timeout: float) -> bool:
+    """Take an exclusive flock on fd, or sleep `timeout` and report failure."""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        time.sleep(timeout)
+        return False
+
+
+def normalize_text(text: str) -> str:
+    """Key for prompts/messages: case- and whitespace-insensitive."""
+    return " ".join(str(text).lower().split())
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str, cross_process: bool = None):
+        """
+        :param name: Group name, used in metrics and lock file names
+        :param cross_process: Override SINGLEFLIGHT['CROSS_PROCESS'] for this group
+        """
+        self.name = name
+        self._cross_process = cross_process
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._leads = 0
+
+    @property
+    def cross_process(self) -> bool:
+        enabled = self._cross_process
+        if enabled is None:
+            enabled = settings_dict("SINGLEFLIGHT").get("CROSS_PROCESS", False)
+        return bool(enabled) and fcntl is not None
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs), or wait for an identical in-flight call and
+        share its result. Shared results are the same object: don't mutate them.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("singleflight_total", group=self.name, role="follower")
+            if not self._wait(call.done.wait):
+                # The leader looks stuck: don't let it pin this request too
+                metrics.inc("singleflight_total", group=self.name, role="wait_timeout")
+                return fn(*args, **kwargs)
+            if isinstance(call.error, Cancelled):
+                # The leader's client went away, not ours: run it again
+                return self.do(key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.inc("singleflight_total", group=self.name, role="leader")
+        try:
+            if self.cross_process:
+                call.result = self._do_across_processes(key, fn, args, kwargs)
+            else:
+                call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    @staticmethod
+    def _wait(wait: Callable[[float], bool]) -> bool:
+        """
+        Call wait(timeout) in WAIT_SLICE steps until it returns True, checking
+        for cancellation in between. False once MAX_WAIT seconds have passed.
+        """
+        config = settings_dict("SINGLEFLIGHT")
+        step = float(config.get("WAIT_SLICE", 0.05))
+        deadline = time.monotonic() + float(config.get("MAX_WAIT", 60))
+        while True:
+            check_cancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if wait(min(step, remaining)):
+                return True
+
+    # ---- cross-process ----------------------------------------------------
+
+    @staticmethod
+    def _private_dir() -> Path:
+        """LOCK_DIR, created 0700; raises PermissionError unless only we can write to it."""
+        directory = Path(settings_dict("SINGLEFLIGHT").get("LOCK_DIR") or DEFAULT_LOCK_DIR)
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        info = os.lstat(directory)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"{directory} is not a directory owned by this user")
+        if info.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+        return directory
+
+    def _paths(self, key: str):
+        directory = self._private_dir()
+        stem = f"{self.name}-{hashlib.sha256(key.encode()).hexdigest()[:32]}"
+        return directory, directory / f"{stem}.lock", directory / f"{stem}.result"
+
+    def _do_across_processes(self, key: str, fn: Callable, args, kwargs) -> Any:
+        ttl = float(settings_dict("SINGLEFLIGHT").get("RESULT_TTL", 5))
+        try:
+            directory, lock_path, result_path = self._paths(key)
+            fd = os.open(lock_path, os.O_CREAT | os.O_RDWR | os.O_NOFOLLOW, 0o600)
+        except OSError as e:
+            print(f"⚠️ Single-flight directory unusable, coalescing in-process only: {e}")
+            return fn(*args, **kwargs)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is running it: wait, then take its result
+                if not self._wait(lambda timeout: _try_flock(fd, timeout)):
+                    metrics.inc("singleflight_total", group=self.name, role="wait_timeout")
+                    return fn(*args, **kwargs)
+                cached = self._read_result(result_path, ttl)
+                if cached is not _MISSING:
+                    metrics.inc("singleflight_total", group=self.name, role="process_follower")
+                    return cached
+                # The other worker failed; run it ourselves while holding the lock
+            os.utime(lock_path)
+            # Never let waiters pick up an older run's result if this one fails
+            result_path.unlink(missing_ok=True)
+            result = fn(*args, **kwargs)
+            self._write_result(result_path, result)
+            self._leads += 1
+            if self._leads % 100 == 0:
+                self._sweep(directory, ttl)
+            return result
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @staticmethod
+    def _read_result(path: Path, ttl: float) -> Any:
+        try:
+            if time.time() - path.stat().st_mtime > ttl:
+                return _MISSING
+            with open(path, "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return _MISSING
+
+    @staticmethod
+    def _write_result(path: Path, result: Any) -> None:
+        # Imported here: renderers needs configured settings, this module doesn't
+        from api.utils.renderers import dumps
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            data = dumps(result)
+            with open(os.open(tmp, os.O_CREAT | os.O_WRONLY | os.O_TRUNC | os.O_NOFOLLOW, 0o600), "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Could not share single-flight result: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _sweep(self, directory: Path, ttl: float) -> None:
+        """Remove old lock/result files of this group (at worst a duplicate run later)."""
+        cutoff = time.time() - max(ttl * 10, 600)
+        for path in directory.glob(f"{self.name}-*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+# Groups used by the views, inference and the LLM runtime
+analysis_flight = SingleFlight("analysis")
+diagnosis_flight = SingleFlight("diagnosis")
+generation_flight = SingleFlight("generation")
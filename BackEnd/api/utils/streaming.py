@@ -0,0 +1,84 @@
+"""
+Helpers for real-time webcam emotion streaming (see EmotionStreamConsumer).
+
+- LatestFrameSlot: a one-element mailbox. A new frame replaces any frame
+  that hasn't been picked up yet, so analysis always works on the newest
+  frame and a slow model never builds a backlog.
+- EmotionSmoother: exponential moving average over normalized emotion
+  vectors, so pushed results don't flicker frame to frame.
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from api.utils.lite_emotion import EMOTION_KEYS
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Frames are downscaled to this longest side before analysis
+STREAM_MAX_SIDE = 480
+
+
+class LatestFrameSlot:
+    """Latest-frame-wins mailbox between the socket reader and the analysis loop."""
+
+    def __init__(self):
+        self._frame: Optional[bytes] = None
+        self._received_at = 0.0
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame: bytes) -> None:
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._received_at = time.monotonic()
+        self._event.set()
+
+    async def get(self) -> Tuple[bytes, float]:
+        """Wait for the newest frame; returns (frame, monotonic receive time)."""
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame, self._received_at
+
+
+class EmotionSmoother:
+    """Exponentially smoothed emotion vector."""
+
+    def __init__(self, alpha: float = 0.4):
+        self.alpha = min(max(float(alpha), 0.01), 1.0)
+        self.state: Optional[np.ndarray] = None
+
+    def update(self, emotions: Dict[str, float]) -> Dict[str, float]:
+        vector = np.array([float(emotions.get(k, 0.0)) for k in EMOTION_KEYS])
+        total = vector.sum()
+        vector = vector / total if total > 0 else np.full(len(EMOTION_KEYS), 1.0 / len(EMOTION_KEYS))
+        if self.state is None:
+            self.state = vector
+        else:
+            self.state = self.alpha * vector + (1.0 - self.alpha) * self.state
+        return dict(zip(EMOTION_KEYS, self.state.tolist()))
+
+
+def decode_frame(data: bytes) -> Optional[np.ndarray]:
+    """Decode a JPEG/PNG frame and downscale it for analysis."""
+    if not CV2_AVAILABLE or not data:
+        return None
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    h, w = frame.shape[:2]
+    scale = STREAM_MAX_SIDE / float(max(h, w))
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return frame
@@ -0,0 +1,95 @@
+"""
+Train the lightweight NumPy emotion model from a FER2013-style CSV.
+
+The CSV needs an `emotion` column (0=angry, 1=disgust, 2=fear, 3=happy,
+4=sad, 5=surprise, 6=neutral) and a `pixels` column of space-separated
+48x48 grayscale values. An optional `Usage` column selects the holdout
+(`PublicTest`/`PrivateTest` rows); otherwise 10% of rows are held out.
+
+Usage (from BackEnd/):
+  python -m api.utils.train_lite_emotion --csv fer2013.csv
+
+Outputs (for lite_emotion.py):
+  - api/models/lite_emotion.npz
+"""
+
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from api.utils.lite_emotion import EMOTION_KEYS, LiteEmotionModel, preprocess_faces, softmax
+
+
+def load_faces(df: pd.DataFrame, size: int) -> np.ndarray:
+    side = int(round(np.sqrt(len(df["pixels"].iloc[0].split()))))
+    faces = [np.array(p.split(), dtype=np.uint8).reshape(side, side) for p in df["pixels"]]
+    return preprocess_faces(faces, size)
+
+
+def fit_softmax(X: np.ndarray, y: np.ndarray, n_classes: int, epochs: int, lr: float,
+                l2: float, batch_size: int, X_val: np.ndarray = None, y_val: np.ndarray = None):
+    """Mini-batch gradient descent on the multinomial logistic loss."""
+    rng = np.random.default_rng(42)
+    W = np.zeros((X.shape[1], n_classes), dtype=np.float32)
+    b = np.zeros(n_classes, dtype=np.float32)
+    onehot = np.eye(n_classes, dtype=np.float32)[y]
+    for epoch in range(1, epochs + 1):
+        order = rng.permutation(len(X))
+        for start in range(0, len(X), batch_size):
+            idx = order[start:start + batch_size]
+            grad = softmax(X[idx] @ W + b) - onehot[idx]
+            W -= lr * (X[idx].T @ grad / len(idx) + l2 * W)
+            b -= lr * grad.mean(axis=0)
+        train_acc = float((np.argmax(X @ W + b, axis=1) == y).mean())
+        line = f"epoch {epoch}/{epochs}: train_acc={train_acc:.3f}"
+        if X_val is not None and len(X_val):
+            val_acc = float((np.argmax(X_val @ W + b, axis=1) == y_val).mean())
+            line += f" holdout_acc={val_acc:.3f}"
+        print(line)
+    return W, b
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True, type=str,
+                        help="Path to a FER2013-style CSV (emotion, pixels[, Usage])")
+    parser.add_argument("--size", type=int, default=24,
+                        help="Side length faces are downscaled to")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--lr", type=float, default=0.05)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--out", default=None,
+                        help="Output path (defaults to api/models/lite_emotion.npz)")
+    args = parser.parse_args()
+
+    csv_path = Path(args.csv)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"CSV not found: {csv_path}")
+
+    df = pd.read_csv(csv_path).dropna(subset=["emotion", "pixels"])
+    if "Usage" in df.columns:
+        holdout = df["Usage"].astype(str).str.endswith("Test").to_numpy()
+    else:
+        holdout = np.random.default_rng(42).random(len(df)) < 0.1
+
+    X = load_faces(df, args.size)
+    y = df["emotion"].astype(int).to_numpy()
+    X_train, y_train, X_val, y_val = X[~holdout], y[~holdout], X[holdout], y[holdout]
+
+    mean = X_train.mean(axis=0)
+    std = X_train.std(axis=0) + 1e-6
+    W, b = fit_softmax(
+        (X_train - mean) / std, y_train, len(EMOTION_KEYS), args.epochs, args.lr, args.l2,
+        args.batch_size, (X_val - mean) / std, y_val,
+    )
+
+    out_path = Path(args.out) if args.out else Path(__file__).resolve().parents[1] / "models" / "lite_emotion.npz"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    LiteEmotionModel(W, b, mean, std, args.size).save(str(out_path))
+    print(f"Saved lite emotion model: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
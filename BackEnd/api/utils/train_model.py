@@ -1,23 +1,42 @@
 """
 Train a simple text classifier for depression detection from a CSV dataset.
 
-Usage (from repo root):
-  python train_model.py --csv student_depression_dataset.csv
+Usage (from BackEnd/; run as a module so the api package imports resolve):
+  python -m api.utils.train_model --csv student_depression_dataset.csv
 
-Outputs (for inference.py):
-  - api/models/depression_model.pkl
-  - api/models/emotion_encoder.pkl
+  # Out-of-core mode for datasets that don't fit in memory
+  python -m api.utils.train_model --csv transcripts.csv --stream --chunksize 50000 --epochs 3
+
+  # Hyperparameter search: accuracy vs serving latency/size, best cheap model saved
+  python -m api.utils.train_model --csv student_depression_dataset.csv --search --jobs 4 --save
+
+Outputs (for inference.py), published as a new version that running
+servers hot-reload (see api/utils/model_registry.py):
+  - api/models/text/<version>/depression_model.pkl
+  - api/models/text/<version>/emotion_encoder.pkl
 """
 
 import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
 from pathlib import Path
 import joblib
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from scipy.sparse import vstack
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.naive_bayes import ComplementNB
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
-from sklearn.metrics import classification_report
+from sklearn.metrics import accuracy_score, classification_report, f1_score, log_loss
+
+from api.utils.model_registry import text_model
 
 
 def infer_text_and_label_columns(df: pd.DataFrame) -> tuple:
@@ -33,6 +52,245 @@ def infer_text_and_label_columns(df: pd.DataFrame) -> tuple:
     return df.columns[-2], df.columns[-1]
 
 
+def resolve_columns(df: pd.DataFrame, text_col, label_col) -> tuple:
+    """Use explicit columns if given (names or indices), otherwise infer them."""
+    if not text_col or not label_col:
+        return infer_text_and_label_columns(df)
+    # Convert indices to int if provided as string digits
+    if str(text_col).isdigit():
+        text_col = int(text_col)
+    if str(label_col).isdigit():
+        label_col = int(label_col)
+    return text_col, label_col
+
+
+def save_models(clf, vectorizer) -> None:
+    """Publish the classifier and vectorizer as a new text model version."""
+    def write(directory: Path) -> None:
+        joblib.dump(clf, directory / "depression_model.pkl")
+        joblib.dump(vectorizer, directory / "emotion_encoder.pkl")
+
+    version = text_model.publish(write)
+    print(f"Saved models as version {version}:")
+    print(f" - {text_model.root / text_model.name / version}")
+
+
+def iter_chunks(csv_path: Path, header, text_col, label_col, chunksize: int):
+    """Yield (text, label) Series per CSV chunk; the index is the global row number."""
+    for chunk in pd.read_csv(csv_path, header=header, usecols=[text_col, label_col], chunksize=chunksize):
+        chunk = chunk.dropna()
+        yield chunk[text_col].astype(str), chunk[label_col].astype(str)
+
+
+def train_streaming(csv_path: Path, args) -> None:
+    """
+    Out-of-core training: a stateless HashingVectorizer plus an SGD logistic
+    model fitted with partial_fit, one CSV chunk at a time. Memory is bounded
+    by --chunksize, --n-features and the --max-holdout rows kept for evaluation.
+    """
+    try:
+        header = 0
+        head = pd.read_csv(csv_path, nrows=5)
+    except pd.errors.ParserError:
+        header = None
+        head = pd.read_csv(csv_path, nrows=5, header=None)
+    text_col, label_col = resolve_columns(head, args.text_col, args.label_col)
+    if text_col not in head.columns or label_col not in head.columns:
+        raise ValueError(f"Columns not found in CSV. Available columns: {list(head.columns)}")
+
+    # First pass reads only the label column: partial_fit needs every class up front
+    classes = set()
+    for chunk in pd.read_csv(csv_path, header=header, usecols=[label_col], chunksize=args.chunksize):
+        classes.update(chunk[label_col].dropna().astype(str).unique())
+    classes = np.array(sorted(classes))
+    print(f"Classes: {list(classes)}")
+
+    vectorizer = HashingVectorizer(
+        n_features=args.n_features, ngram_range=(1, 2), alternate_sign=False, norm="l2"
+    )
+    clf = SGDClassifier(loss="log_loss", alpha=args.alpha, random_state=42)
+    # Every k-th row is held out, so the split is identical across epochs and runs
+    holdout_every = max(2, int(round(1 / args.holdout))) if args.holdout > 0 else 0
+    holdout_X, holdout_y = [], []
+    held = 0
+    rng = np.random.default_rng(42)
+
+    for epoch in range(1, args.epochs + 1):
+        started = time.time()
+        trained = 0
+        for X_text, y in iter_chunks(csv_path, header, text_col, label_col, args.chunksize):
+            if holdout_every:
+                is_holdout = (X_text.index.to_numpy() % holdout_every) == 0
+                if epoch == 1 and held < args.max_holdout:
+                    keep = X_text[is_holdout][: args.max_holdout - held]
+                    holdout_X.append(vectorizer.transform(keep))
+                    holdout_y.append(y[is_holdout][: len(keep)].to_numpy())
+                    held += len(keep)
+                X_text, y = X_text[~is_holdout], y[~is_holdout]
+            if not len(y):
+                continue
+            # Shuffle within the chunk so SGD doesn't see long runs of one class
+            order = rng.permutation(len(y))
+            clf.partial_fit(vectorizer.transform(X_text.iloc[order]), y.iloc[order].to_numpy(), classes=classes)
+            trained += len(y)
+            rate = trained / max(time.time() - started, 1e-9)
+            print(f"epoch {epoch}/{args.epochs}: {trained:,} rows trained ({rate:,.0f} rows/s)")
+
+        if epoch == 1 and holdout_y:
+            holdout_X, holdout_y = vstack(holdout_X), np.concatenate(holdout_y)
+        if len(holdout_y):
+            proba = clf.predict_proba(holdout_X)
+            y_pred = clf.classes_[proba.argmax(axis=1)]
+            print(
+                f"epoch {epoch}/{args.epochs} holdout ({len(holdout_y):,} rows): "
+                f"accuracy={accuracy_score(holdout_y, y_pred):.4f} "
+                f"macro_f1={f1_score(holdout_y, y_pred, average='macro'):.4f} "
+                f"log_loss={log_loss(holdout_y, proba, labels=clf.classes_):.4f}"
+            )
+
+    if trained == 0:
+        raise ValueError("No training rows left after the holdout split")
+    save_models(clf, vectorizer)
+
+
+# Search space for --search. Every classifier must support predict_proba,
+# which inference.py uses for the confidence score.
+VECTORIZER_GRID = [
+    {"max_features": m, "ngram_range": n}
+    for m, n in product([5000, 10000, 20000], [(1, 1), (1, 2)])
+]
+CLASSIFIER_GRID = (
+    [("logreg", {"C": c, "max_iter": 200}) for c in (0.1, 1.0, 10.0)]
+    + [("sgd", {"loss": "log_loss", "alpha": a, "random_state": 42}) for a in (1e-5, 1e-4)]
+    + [("nb", {"alpha": a}) for a in (0.1, 1.0)]
+)
+CLASSIFIERS = {"logreg": LogisticRegression, "sgd": SGDClassifier, "nb": ComplementNB}
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[1] / "models" / "feature_cache"
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of the dataset, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_features(cache_dir: Path, dataset_key: str, split, vec_params: dict) -> Path:
+    """
+    Fit the TF-IDF vectorizer for vec_params and store the train/test matrices,
+    keyed by dataset hash and vectorizer params. Returns the cache file path.
+    """
+    key = hashlib.sha256(
+        json.dumps([dataset_key, vec_params], sort_keys=True, default=list).encode()
+    ).hexdigest()[:16]
+    path = cache_dir / f"features-{key}.joblib"
+    if path.exists():
+        print(f"Feature cache hit: {vec_params} -> {path.name}")
+        return path
+
+    X_train, X_test, y_train, y_test = split
+    started = time.time()
+    vectorizer = TfidfVectorizer(**vec_params)
+    Xtr = vectorizer.fit_transform(X_train)
+    Xte = vectorizer.transform(X_test)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    joblib.dump({
+        "vec_params": vec_params,
+        "vectorizer": vectorizer,
+        "X_train": Xtr, "X_test": Xte,
+        "y_train": y_train.to_numpy(), "y_test": y_test.to_numpy(),
+        # Raw texts for measuring end-to-end single-request latency
+        "latency_texts": X_test.iloc[:200].tolist(),
+    }, tmp)
+    os.replace(tmp, path)
+    print(f"Vectorized {vec_params} in {time.time() - started:.1f}s -> {path.name}")
+    return path
+
+
+def evaluate_config(cache_path: str, clf_name: str, clf_params: dict, return_model: bool = False) -> dict:
+    """
+    Fit one classifier on cached features and measure what matters for serving:
+    holdout accuracy/F1, single-text predict latency (vectorize + predict_proba,
+    as inference.py does it) and the pickled size of both artifacts.
+    Runs in a worker process, so it only receives the cache path.
+    """
+    data = joblib.load(cache_path)
+    vectorizer = data["vectorizer"]
+    clf = CLASSIFIERS[clf_name](**clf_params)
+
+    started = time.time()
+    clf.fit(data["X_train"], data["y_train"])
+    fit_s = time.time() - started
+
+    y_pred = clf.predict(data["X_test"])
+    samples = []
+    for text in data["latency_texts"]:
+        t0 = time.perf_counter()
+        clf.predict_proba(vectorizer.transform([text]))
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    result = {
+        "vectorizer": data["vec_params"],
+        "classifier": clf_name,
+        "params": clf_params,
+        "accuracy": accuracy_score(data["y_test"], y_pred),
+        "macro_f1": f1_score(data["y_test"], y_pred, average="macro"),
+        "latency_ms": float(np.median(samples)) if samples else 0.0,
+        "size_kb": (len(pickle.dumps(clf)) + len(pickle.dumps(vectorizer))) / 1024,
+        "fit_s": fit_s,
+        "cache_path": cache_path,
+    }
+    if return_model:
+        result["model"] = (clf, vectorizer)
+    return result
+
+
+def pick_config(results: list, tolerance: float) -> dict:
+    """Smallest, then fastest, config within `tolerance` of the best accuracy."""
+    best = max(r["accuracy"] for r in results)
+    good_enough = [r for r in results if r["accuracy"] >= best - tolerance]
+    return min(good_enough, key=lambda r: (r["size_kb"], r["latency_ms"]))
+
+
+def run_search(X: pd.Series, y: pd.Series, csv_path: Path, args) -> None:
+    split = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y if len(set(y)) > 1 else None
+    )
+    dataset_key = json.dumps([file_digest(csv_path), str(args.text_col), str(args.label_col), 0.2, 42])
+    cache_dir = Path(args.cache_dir)
+
+    # Vectorizing is the expensive shared step: do each setting once, then fan out
+    cache_paths = [str(cached_features(cache_dir, dataset_key, split, p)) for p in VECTORIZER_GRID]
+    jobs = [(path, name, params) for path in cache_paths for name, params in CLASSIFIER_GRID]
+    print(f"Evaluating {len(jobs)} configurations on {args.jobs} processes...")
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(evaluate_config, *job) for job in jobs]
+        results = [f.result() for f in futures]
+
+    results.sort(key=lambda r: (-r["accuracy"], r["latency_ms"]))
+    print(f"\n{'vectorizer':<28}{'classifier':<24}{'acc':>8}{'f1':>8}{'p50 ms':>9}{'size KB':>10}{'fit s':>8}")
+    for r in results:
+        vec = f"{r['vectorizer']['max_features']} {r['vectorizer']['ngram_range']}"
+        clf = f"{r['classifier']} " + ",".join(
+            f"{k}={v}" for k, v in r["params"].items() if k in ("C", "alpha")
+        )
+        print(f"{vec:<28}{clf:<24}{r['accuracy']:>8.4f}{r['macro_f1']:>8.4f}"
+              f"{r['latency_ms']:>9.3f}{r['size_kb']:>10.0f}{r['fit_s']:>8.2f}")
+
+    choice = pick_config(results, args.tolerance)
+    print(f"\nRecommended (within {args.tolerance:.3f} of best accuracy, smallest): "
+          f"{choice['vectorizer']} {choice['classifier']} {choice['params']}")
+    if args.save:
+        clf, vectorizer = evaluate_config(
+            choice["cache_path"], choice["classifier"], choice["params"], return_model=True
+        )["model"]
+        save_models(clf, vectorizer)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--csv", required=True, type=str,
@@ -41,12 +299,40 @@ def main():
                         help="Column name or index for text input")
     parser.add_argument("--label-col", default=None,
                         help="Column name or index for labels")
+    parser.add_argument("--stream", action="store_true",
+                        help="Out-of-core training: read the CSV in chunks with partial_fit")
+    parser.add_argument("--chunksize", type=int, default=50000,
+                        help="Rows per chunk in --stream mode")
+    parser.add_argument("--epochs", type=int, default=3,
+                        help="Passes over the CSV in --stream mode")
+    parser.add_argument("--n-features", type=int, default=2 ** 20,
+                        help="Hashing vectorizer dimensionality in --stream mode")
+    parser.add_argument("--alpha", type=float, default=1e-6,
+                        help="L2 regularization strength in --stream mode")
+    parser.add_argument("--holdout", type=float, default=0.1,
+                        help="Fraction of rows held out for evaluation in --stream mode")
+    parser.add_argument("--max-holdout", type=int, default=50000,
+                        help="Maximum holdout rows kept in memory in --stream mode")
+    parser.add_argument("--search", action="store_true",
+                        help="Grid-search vectorizer/classifier settings and report accuracy vs cost")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for --search")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR),
+                        help="Where --search caches vectorized feature matrices")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="Accuracy slack when picking the cheapest model in --search")
+    parser.add_argument("--save", action="store_true",
+                        help="Save the recommended --search model for inference.py")
     args = parser.parse_args()
 
     csv_path = Path(args.csv)
     if not csv_path.exists():
         raise FileNotFoundError(f"CSV not found: {csv_path}")
 
+    if args.stream:
+        train_streaming(csv_path, args)
+        return
+
     # Read CSV
     try:
         df = pd.read_csv(csv_path)
@@ -55,16 +341,7 @@ def main():
         df = pd.read_csv(csv_path, header=None)
 
     # Determine columns
-    text_col = args.text_col
-    label_col = args.label_col
-    if not text_col or not label_col:
-        text_col, label_col = infer_text_and_label_columns(df)
-    else:
-        # Convert indices to int if provided as string digits
-        if str(text_col).isdigit():
-            text_col = int(text_col)
-        if str(label_col).isdigit():
-            label_col = int(label_col)
+    text_col, label_col = resolve_columns(df, args.text_col, args.label_col)
 
     # Keep only relevant columns
     if text_col not in df.columns or label_col not in df.columns:
@@ -74,6 +351,10 @@ def main():
     X = df[text_col].astype(str)
     y = df[label_col].astype(str)
 
+    if args.search:
+        run_search(X, y, csv_path, args)
+        return
+
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42, stratify=y if len(set(y)) > 1 else None
@@ -91,15 +372,7 @@ def main():
         print(classification_report(y_test, y_pred))
 
     # Save models separately
-    models_dir = Path(__file__).resolve().parents[1] / "models"
-    models_dir.mkdir(parents=True, exist_ok=True)
-
-    joblib.dump(pipeline.named_steps["clf"], models_dir / "depression_model.pkl")
-    joblib.dump(pipeline.named_steps["tfidf"], models_dir / "emotion_encoder.pkl")
-
-    print("Saved models:")
-    print(f" - {models_dir / 'depression_model.pkl'}")
-    print(f" - {models_dir / 'emotion_encoder.pkl'}")
+    save_models(pipeline.named_steps["clf"], pipeline.named_steps["tfidf"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""
+Train the emotion-feature depression-risk classifier (risk_model.py).
+
+The CSV needs one column per emotion (angry, disgust, fear, happy, sad,
+surprise, neutral) holding the mean score of an analysis, and a label
+column (e.g. low_risk / moderate_risk / high_risk). Optional
+`<emotion>_std` columns hold the per-emotion standard deviation over a
+video's frames; missing ones are treated as 0 (single images).
+Scores on any scale are accepted (rows are normalized). 10% of rows are
+held out for evaluation.
+
+Usage (from BackEnd/):
+  python -m api.utils.train_risk_model --csv labelled_analyses.csv
+
+Outputs (published as a new version, hot-reloaded by running servers):
+  - api/models/risk/<version>/risk_model.npz
+"""
+
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from api.utils.lite_emotion import EMOTION_KEYS
+from api.utils.model_registry import risk_model
+from api.utils.risk_model import RiskModel, normalize_rows, risk_features
+from api.utils.train_lite_emotion import fit_softmax
+
+
+def load_features(df: pd.DataFrame) -> np.ndarray:
+    missing = [k for k in EMOTION_KEYS if k not in df.columns]
+    if missing:
+        raise ValueError(f"CSV is missing emotion columns: {missing}")
+    totals = df[EMOTION_KEYS].to_numpy(dtype=np.float64).sum(axis=1, keepdims=True)
+    means = normalize_rows(df[EMOTION_KEYS].to_numpy(dtype=np.float64))
+    std_cols = [f"{k}_std" for k in EMOTION_KEYS]
+    stds = None
+    if any(c in df.columns for c in std_cols):
+        raw = df.reindex(columns=std_cols, fill_value=0.0).to_numpy(dtype=np.float64)
+        # Put stds on the same scale as the normalized means
+        stds = raw / np.where(totals > 0, totals, 1.0)
+    return risk_features(means, stds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True, type=str,
+                        help="CSV with emotion columns, optional <emotion>_std columns and a label")
+    parser.add_argument("--label-col", default="label",
+                        help="Column holding the diagnosis label")
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--lr", type=float, default=0.1)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    csv_path = Path(args.csv)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"CSV not found: {csv_path}")
+
+    df = pd.read_csv(csv_path).dropna(subset=EMOTION_KEYS + [args.label_col])
+    classes, y = np.unique(df[args.label_col].astype(str).to_numpy(), return_inverse=True)
+    if len(classes) < 2:
+        raise ValueError("Need at least two distinct labels to train")
+    print(f"Classes: {list(classes)} ({len(df):,} rows)")
+
+    X = load_features(df)
+    holdout = np.random.default_rng(42).random(len(df)) < 0.1
+    X_train, y_train, X_val, y_val = X[~holdout], y[~holdout], X[holdout], y[holdout]
+
+    mean = X_train.mean(axis=0)
+    std = X_train.std(axis=0) + 1e-6
+    W, b = fit_softmax(
+        (X_train - mean) / std, y_train, len(classes), args.epochs, args.lr, args.l2,
+        args.batch_size, (X_val - mean) / std, y_val,
+    )
+
+    model = RiskModel(W, b, classes, mean, std)
+    version = risk_model.publish(lambda directory: model.save(str(directory / "risk_model.npz")))
+    print(f"Saved risk model as version {version}: {risk_model.root / risk_model.name / version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,27 @@
-from django.http import HttpResponse
+import time
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from api.utils.inference import diagnose_text
 from api.utils.remedies import personalize_remedies
 from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from api.utils.gemma_runtime import gemma
-
-# Try to import analyzers in order of preference
-try:
-    from api.utils.analysis import DeepFaceAnalyzer
-    ANALYZER_AVAILABLE = True
-    print("✅ Using DeepFace analyzer")
-except ImportError as e:
-    print(f"⚠️ DeepFace not available: {e}")
-    try:
-        from api.utils.simple_analysis import SimpleEmotionAnalyzer as DeepFaceAnalyzer
-        ANALYZER_AVAILABLE = True
-        print("✅ Using simple emotion analyzer")
-    except ImportError as e2:
-        print(f"⚠️ Simple analyzer not available: {e2}")
-        try:
-            from api.utils.basic_analysis import BasicEmotionAnalyzer as DeepFaceAnalyzer
-            ANALYZER_AVAILABLE = True
-            print("✅ Using basic emotion analyzer")
-        except ImportError as e3:
-            print(f"❌ No analyzer available: {e3}")
-            ANALYZER_AVAILABLE = False
+from api.utils.persistence import hash_upload, record_analysis, record_chat_message, request_identity
+from api.utils.history import export_csv, export_jsonl, iter_messages, page_messages
+from api.utils.rollups import emotion_trends
+from api.utils.analyzers import ANALYZER_AVAILABLE, DeepFaceAnalyzer
+from api.utils.assessment import run_assessment
+from api.utils.singleflight import analysis_flight
+from api.utils.admission import admission_controlled
+from api.utils.intent_router import get_router
+from api.utils.conversation import chat_reply, record_turn
+from api.utils.advice import generate_advice, get_ticket, submit_advice, wants_async
+from api.utils.multi_face import requested_aggregate, wants_multi_face
+from api.utils import metrics as metrics_registry
+from api.utils.profiling import get_store as get_profile_store, is_profiling_admin
+from api.utils.memory import memory_report, start_tracing, stop_tracing
 
 @api_view(['POST'])
 def diagnose_api(request):
@@ -48,16 +44,20 @@ def diagnose_api(request):
     return Response({
         "diagnosis": diagnosis_result["diagnosis"],
         "confidence": diagnosis_result["confidence"],
+        "model_version": diagnosis_result.get("model_version"),
         "remedies": remedies
     })
 
 
 @api_view(['POST'])
+@admission_controlled('image')
 def upload_image(request):
     if 'image' not in request.FILES:
         return Response({'error': 'No image provided'}, status=400)
     
+    started = time.perf_counter()
     image_file = request.FILES['image']
+    content_hash = hash_upload(image_file)
     file_path = default_storage.save(f'uploads/images/{image_file.name}', image_file)
     full_path = default_storage.path(file_path)
 
@@ -65,25 +65,41 @@ def upload_image(request):
         if not ANALYZER_AVAILABLE:
             raise Exception("No emotion analyzer available")
             
+        analysis_started = time.perf_counter()
         analyzer = DeepFaceAnalyzer()
-        analysis_result = analyzer.analyze_image(full_path)
+        # faces=all: every face in one batch, combined with ?aggregate=
+        options = {'multi_face': True, 'aggregate': requested_aggregate(request)} if wants_multi_face(request) else {}
+        flight_key = f'image:{content_hash}' + (f":faces:{options['aggregate']}" if options else '')
+        # A retried or double-submitted upload shares the analysis already running
+        analysis_result = analysis_flight.do(flight_key, analyzer.analyze_image, full_path, **options)
+        analysis_result = {**analysis_result, 'file_path': full_path}
+        inference_ms = (time.perf_counter() - analysis_started) * 1000
         
         # Log analysis results for debugging
         print(f"Analysis result: {analysis_result}")
-        
-        # Generate supportive advice using Gemma based on analysis
-        try:
-            summary = (
-                f"Emotions: {analysis_result.get('emotions', {})}. "
-                f"Diagnosis: {analysis_result.get('diagnosis', 'unknown')} "
-                f"(confidence {analysis_result.get('confidence', 0.0):.2f})."
-            )
-            advice = gemma.generate(
-                "A user uploaded an image. Based on this summary, write a short, warm, 2-3 sentence, practical guidance without medical claims: " + summary
+        if analysis_result.get('status') == 'no_face':
+            return Response(_no_face_response(file_path, analysis_result))
+        user_id, session_id = request_identity(request)
+
+        if wants_async(request):
+            # Two-phase: answer with the analysis now, deliver the advice later
+            ticket = submit_advice(analysis_result, 'image', session_id)
+            record_analysis(
+                analysis_result, user_id=user_id, session_id=session_id, content_hash=content_hash,
+                inference_ms=inference_ms, total_ms=(time.perf_counter() - started) * 1000,
             )
-        except Exception as e:
-            print(f"Error generating advice: {e}")
-            advice = "I'm here to support you. Please take care of yourself and consider reaching out to a trusted person or professional if you need additional support."
+            return Response(_async_advice_response(file_path, analysis_result, ticket))
+
+        # Generate supportive advice using Gemma based on analysis
+        advice_started = time.perf_counter()
+        advice = generate_advice(analysis_result, 'image')
+        advice_ms = (time.perf_counter() - advice_started) * 1000
+
+        record_analysis(
+            analysis_result, user_id=user_id, session_id=session_id, content_hash=content_hash,
+            inference_ms=inference_ms, advice_ms=advice_ms,
+            total_ms=(time.perf_counter() - started) * 1000,
+        )
 
         return Response({
             'success': True,
@@ -120,11 +136,14 @@ def upload_image(request):
 
 
 @api_view(['POST'])
+@admission_controlled('video')
 def upload_video(request):
     if 'video' not in request.FILES:
         return Response({'error': 'No video provided'}, status=400)
     
+    started = time.perf_counter()
     video_file = request.FILES['video']
+    content_hash = hash_upload(video_file)
     file_path = default_storage.save(f'uploads/videos/{video_file.name}', video_file)
     full_path = default_storage.path(file_path)
 
@@ -135,20 +154,33 @@ def upload_video(request):
             'file_id': file_path
         }, status=500)
         
+    analysis_started = time.perf_counter()
     analyzer = DeepFaceAnalyzer()
-    analysis_result = analyzer.analyze_video(full_path)
-    # Generate supportive advice using Gemma based on analysis
-    try:
-        summary = (
-            f"Emotions: {analysis_result.get('emotions', {})}. "
-            f"Diagnosis: {analysis_result.get('diagnosis', 'unknown')} "
-            f"(confidence {analysis_result.get('confidence', 0.0):.2f})."
-        )
-        advice = gemma.generate(
-            "A user uploaded a video. Based on this summary, write a short, warm, 2-3 sentence, practical guidance without medical claims: " + summary
+    analysis_result = analysis_flight.do(f'video:{content_hash}', analyzer.analyze_video, full_path)
+    analysis_result = {**analysis_result, 'file_path': full_path}
+    inference_ms = (time.perf_counter() - analysis_started) * 1000
+    if analysis_result.get('status') == 'no_face':
+        return Response(_no_face_response(file_path, analysis_result))
+    user_id, session_id = request_identity(request)
+
+    if wants_async(request):
+        ticket = submit_advice(analysis_result, 'video', session_id)
+        record_analysis(
+            analysis_result, user_id=user_id, session_id=session_id, content_hash=content_hash,
+            inference_ms=inference_ms, total_ms=(time.perf_counter() - started) * 1000,
         )
-    except Exception:
-        advice = None
+        return Response(_async_advice_response(file_path, analysis_result, ticket))
+
+    # Generate supportive advice using Gemma based on analysis
+    advice_started = time.perf_counter()
+    advice = generate_advice(analysis_result, 'video')
+    advice_ms = (time.perf_counter() - advice_started) * 1000
+
+    record_analysis(
+        analysis_result, user_id=user_id, session_id=session_id, content_hash=content_hash,
+        inference_ms=inference_ms, advice_ms=advice_ms,
+        total_ms=(time.perf_counter() - started) * 1000,
+    )
 
     return Response({
         'success': True,
@@ -160,16 +192,247 @@ def upload_video(request):
 
 
 
+def _no_face_response(file_path, analysis_result):
+    # Nothing to advise on or to keep in the emotion history
+    metrics_registry.inc('analysis_no_face_total', media=analysis_result.get('type', 'image'))
+    return {
+        'success': False,
+        'status': 'no_face',
+        'file_id': file_path,
+        'analysis_result': analysis_result,
+        'advice': None,
+        'message': 'No face was detected. Please upload a clear, well-lit photo or video of your face.',
+    }
+
+
+def _async_advice_response(file_path, analysis_result, ticket):
+    return {
+        'success': True,
+        'file_id': file_path,
+        'analysis_result': analysis_result,
+        'advice': None,
+        'advice_ticket': ticket,
+        'advice_url': f'/api/advice/{ticket}',
+    }
+
+
+@api_view(['GET'])
+def advice_status(request, ticket):
+    """Poll for advice started with advice=async: {status: pending|ready[, advice]}."""
+    entry = get_ticket(ticket)
+    if entry is None:
+        return Response({'error': 'Unknown or expired advice ticket'}, status=404)
+    return Response({'ticket': ticket, **entry})
+
+
 @api_view(['POST'])
-def chat_generate(request):
+@admission_controlled('assess')
+def assess(request):
+    """
+    Text plus an optional image or video in one request. The text diagnosis
+    and media analysis run concurrently; the result fuses both and carries a
+    single piece of advice.
+    """
+    text = (request.data.get('text') or '').strip()
+    media_type = 'video' if 'video' in request.FILES else 'image'
+    upload = request.FILES.get(media_type)
+    if not text and upload is None:
+        return Response({"error": "Provide text, an image or a video"}, status=400)
+
+    started = time.perf_counter()
+    file_path = full_path = None
+    content_hash = ''
+    if upload is not None:
+        content_hash = hash_upload(upload)
+        file_path = default_storage.save(f'uploads/{media_type}s/{upload.name}', upload)
+        full_path = default_storage.path(file_path)
+
+    result = run_assessment(text, full_path, media_type, content_hash)
+
+    media = result.get('media_analysis')
+    if media and 'error' not in media and media.get('status') != 'no_face':
+        user_id, session_id = request_identity(request)
+        record_analysis(
+            media, user_id=user_id, session_id=session_id, content_hash=content_hash,
+            inference_ms=result['timings'].get('media_ms'), advice_ms=result['timings'].get('advice_ms'),
+            total_ms=(time.perf_counter() - started) * 1000,
+        )
+
+    return Response({'success': True, 'file_id': file_path, **result})
+
+
+def _routed_chat(request):
+    """
+    Answer routine messages (greetings, thanks, coping tips...) locally and
+    send only open-ended and crisis messages to the LLM.
+    """
     text = request.data.get('text', '')
     if not text:
         return Response({"error": "No text provided"}, status=400)
+    user_id, session_id = request_identity(request)
+    record_chat_message('user', text, user_id=user_id, session_id=session_id)
+
+    started = time.perf_counter()
+    routed = get_router().route(text)
+    if routed['route'] == 'local':
+        record_chat_message(
+            'assistant', routed['reply'], user_id=user_id, session_id=session_id,
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+        record_turn(session_id, 'user', text)
+        record_turn(session_id, 'assistant', routed['reply'])
+        return Response(routed)
+    response = _llm_reply(request, text, routed)
+    if routed.get('resources') and response.status_code != 200:
+        # Rejected by admission control or past its deadline: crisis messages
+        # still get the resources, just without the LLM's reply
+        record_chat_message(
+            'assistant', routed['resources'], user_id=user_id, session_id=session_id,
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+        return Response({**routed, "reply": routed['resources']})
+    return response
+
+
+@admission_controlled('chat')
+def _llm_reply(request, text, routed):
+    user_id, session_id = request_identity(request)
     try:
-        output = gemma.generate(text)
-        return Response({"reply": output})
+        started = time.perf_counter()
+        # Server-side context: summary + recent turns of this session, within a token budget
+        output = chat_reply(session_id, text, lambda prompt: gemma.generate(prompt, max_length=200, temperature=0.7))
     except Exception as e:
-        return Response({"error": f"Generation failed: {str(e)}"}, status=500)
-    
+        if not routed.get('resources'):
+            return Response({"error": f"Generation failed: {str(e)}"}, status=500)
+        # Crisis messages always get an answer, with or without the LLM
+        output = ''
+    if routed.get('resources'):
+        output = f"{output}\n\n{routed['resources']}".strip()
+    record_chat_message(
+        'assistant', output, user_id=user_id, session_id=session_id,
+        latency_ms=(time.perf_counter() - started) * 1000,
+    )
+    return Response({**routed, "reply": output})
+
+
+@api_view(['POST'])
+def chat_generate(request):
+    return _routed_chat(request)
+
+
+@api_view(['POST'])
+def chat_intent(request):
+    """Intent-routed chat: {reply, intent, confidence, route: local|llm[, resources]}."""
+    return _routed_chat(request)
+
+
+@api_view(['GET'])
+def chat_history(request):
+    """
+    Keyset-paginated chat history, newest first.
+    Signed-in users read their own messages (optionally one session_id);
+    anonymous callers only their session_id's. Optional cursor and limit.
+    """
+    user_id, session_id = request_identity(request)
+    try:
+        messages, next_cursor = page_messages(
+            session_id=session_id, user_id=user_id,
+            cursor=request.query_params.get('cursor'),
+            limit=request.query_params.get('limit', 50),
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    return Response({"messages": messages, "next_cursor": next_cursor})
+
+
+@api_view(['GET'])
+def chat_export(request):
+    """
+    Stream the full chat history as JSONL (default) or CSV via ?export_format=.
+    Scoped like chat_history: the signed-in user, or an anonymous session_id.
+    Rows are read in fixed-size chunks, so memory use is independent of history length.
+    """
+    user_id, session_id = request_identity(request)
+    if not (user_id or session_id):
+        return Response({"error": "session_id is required"}, status=400)
+    # Not `format`: DRF reserves that query parameter for renderer selection
+    export_format = request.query_params.get('export_format', 'jsonl').lower()
+    if export_format not in ('jsonl', 'csv'):
+        return Response({"error": "export_format must be 'jsonl' or 'csv'"}, status=400)
+
+    messages = iter_messages(session_id=session_id, user_id=user_id)
+    if export_format == 'csv':
+        response = StreamingHttpResponse(export_csv(messages), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(export_jsonl(messages), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="chat_history.{export_format}"'
+    return response
+
+
+@api_view(['GET'])
+def user_analytics(request):
+    """
+    Emotion and risk trends of the signed-in user from the hourly/daily rollups.
+    Query: granularity=hour|day, optional ISO-8601 start/end.
+    """
+    user_id, _ = request_identity(request)
+    if not user_id:
+        return Response({"error": "Authentication required"}, status=401)
+    try:
+        bounds = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            if value:
+                parsed = parse_datetime(value)
+                if parsed is None:
+                    raise ValueError(f"Invalid {name} datetime")
+                bounds[name] = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+        trends = emotion_trends(user_id, request.query_params.get('granularity', 'day'), **bounds)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(trends)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint (this worker's counters and gauges)."""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4')
+
+
+def profile_list(request):
+    """Admin: recent profiling captures, newest first."""
+    if not is_profiling_admin(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse({'captures': get_profile_store().list()})
+
+
+def profile_download(request, name):
+    """Admin: download one capture (.prof for pstats, .collapsed for flamegraph.pl/speedscope)."""
+    if not is_profiling_admin(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    path = get_profile_store().path(name)
+    if path is None:
+        return JsonResponse({'error': 'Capture not found'}, status=404)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+
+def memory_status(request):
+    """
+    Admin: this worker's RSS, recycle state and (when tracing) top allocators.
+    ?trace=start|stop toggles tracemalloc; ?limit= caps the allocator list.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    trace = request.GET.get('trace')
+    if trace == 'start':
+        start_tracing()
+    elif trace == 'stop':
+        stop_tracing()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 200)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    return JsonResponse(memory_report(limit))
+
+
 def home(request):
     return HttpResponse("SUP Bhadwo")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark channel layers: message throughput, round-trip latency and
+group fan-out for each available backend.
+
+Usage (from BackEnd/):
+  python bench_channel_layers.py [--messages 20000] [--redis redis://127.0.0.1:6379]
+
+The Unix socket layer is measured across two processes (the realistic
+multi-worker case); the in-process layers within one event loop.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+from channels.layers import InMemoryChannelLayer
+from api.utils.channel_layers import LocalChannelLayer, UnixSocketChannelLayer
+
+MESSAGE = {"type": "chat.reply", "id": "a" * 32, "content": "hello " * 20, "timestamp": "2025-01-01T00:00:00"}
+
+
+async def bench_throughput(layer, n):
+    channel = await layer.new_channel()
+    received = 0
+
+    async def consume():
+        nonlocal received
+        while received < n:
+            await layer.receive(channel)
+            received += 1
+
+    consumer = asyncio.ensure_future(consume())
+    start = time.perf_counter()
+    for i in range(n):
+        await layer.send(channel, MESSAGE)
+        if i % 100 == 99:
+            await asyncio.sleep(0)  # let the consumer drain
+    await consumer
+    return n / (time.perf_counter() - start)
+
+
+async def bench_latency(layer, n):
+    ping, pong = await layer.new_channel(), await layer.new_channel()
+
+    async def echo():
+        for _ in range(n):
+            await layer.send(pong, await layer.receive(ping))
+
+    echoer = asyncio.ensure_future(echo())
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await layer.send(ping, MESSAGE)
+        await layer.receive(pong)
+        samples.append((time.perf_counter() - start) * 1e6)
+    await echoer
+    return samples
+
+
+async def bench_fanout(layer, members, rounds):
+    channels = [await layer.new_channel() for _ in range(members)]
+    for channel in channels:
+        await layer.group_add("bench", channel)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await layer.group_send("bench", MESSAGE)
+        for channel in channels:
+            await layer.receive(channel)
+    return rounds * members / (time.perf_counter() - start)
+
+
+async def run_layer(layer, n):
+    throughput = await bench_throughput(layer, n)
+    latency = await bench_latency(layer, min(n, 5000))
+    fanout = await bench_fanout(layer, 50, max(1, n // 500))
+    await layer.flush()
+    return throughput, latency, fanout
+
+
+def _echo_worker(path, channel, n):
+    """Second process for the Unix socket latency test."""
+    async def main():
+        layer = UnixSocketChannelLayer(path=path)
+        for _ in range(n):
+            message = await layer.receive(channel)
+            await layer.send(message.pop("reply_to"), message)
+    asyncio.run(main())
+
+
+async def run_unix_cross_process(path, n):
+    layer = UnixSocketChannelLayer(path=path)
+    reply_to = await layer.new_channel()
+    # Starts the hub here; the hub holds the message until the worker listens
+    await layer.send("bench.ping", dict(MESSAGE, reply_to=reply_to))
+    worker = multiprocessing.Process(target=_echo_worker, args=(path, "bench.ping", n + 1))
+    worker.start()
+    await layer.receive(reply_to)
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await layer.send("bench.ping", dict(MESSAGE, reply_to=reply_to))
+        await layer.receive(reply_to)
+        samples.append((time.perf_counter() - start) * 1e6)
+    worker.join(10)
+    await layer.close()
+    return samples
+
+
+def report(name, throughput, latency, fanout):
+    latency = sorted(latency)
+    p50 = statistics.median(latency)
+    p99 = latency[int(len(latency) * 0.99) - 1]
+    throughput = f"{throughput:>12,.0f}" if throughput else f"{'-':>12}"
+    fanout = f"{fanout:>12,.0f}" if fanout else f"{'-':>12}"
+    print(f"{name:<28}{throughput}{p50:>10.1f}{p99:>10.1f}{fanout}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--redis", default=None, help="Redis URL to include channels_redis")
+    args = parser.parse_args()
+
+    print(f"{'layer':<28}{'msgs/s':>12}{'p50 us':>10}{'p99 us':>10}{'fanout/s':>12}")
+    capacity = args.messages + 1000  # measure speed, not back-pressure
+    layers = [
+        ("channels InMemory", InMemoryChannelLayer(capacity=capacity)),
+        ("LocalChannelLayer", LocalChannelLayer(capacity=capacity)),
+    ]
+    tmp = tempfile.mkdtemp()
+    layers.append(("UnixSocket (1 process)", UnixSocketChannelLayer(path=os.path.join(tmp, "a.sock"), capacity=capacity)))
+    if args.redis:
+        try:
+            from channels_redis.core import RedisChannelLayer
+            layers.append(("channels_redis", RedisChannelLayer(hosts=[args.redis], capacity=capacity)))
+        except ImportError:
+            print("channels_redis not installed, skipping Redis")
+
+    for name, layer in layers:
+        report(name, *(await run_layer(layer, args.messages)))
+        await layer.close()
+
+    samples = await run_unix_cross_process(os.path.join(tmp, "b.sock"), min(args.messages, 5000))
+    report("UnixSocket (2 processes)", None, samples, None)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
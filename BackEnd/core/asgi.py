@@ -1,16 +1,24 @@
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from api.consumers import ChatConsumer
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Initialize Django before importing consumers (they import models)
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.auth import AuthMiddlewareStack
+from django.urls import re_path
+from api.consumers import ChatConsumer, EmotionStreamConsumer
+from api.utils.cancellation import CancellationMiddleware
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    # Cancels in-flight analysis when the client goes away
+    "http": CancellationMiddleware(django_asgi_app),
     "websocket": AuthMiddlewareStack(
         URLRouter([
-            path("ws/chat/", ChatConsumer.as_asgi()),
+            re_path(r"^ws/chat/?$", ChatConsumer.as_asgi()),
+            re_path(r"^ws/emotion/?$", EmotionStreamConsumer.as_asgi()),
         ])
     ),
 })
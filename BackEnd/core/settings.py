@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.utils.memory.MemoryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.utils.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -83,9 +88,26 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL lets history reads run while the write-behind thread commits;
+            # NORMAL sync is durable across app crashes in WAL mode.
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-32000;'
+                'PRAGMA mmap_size=268435456;'
+            ),
+            # Take the write lock up front instead of failing on lock upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Queue analysis/chat rows and write them in batches off the request path
+PERSISTENCE_WRITE_BEHIND = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,9 +161,175 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 ASGI_APPLICATION = 'core.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
+# Channel layer selection (CHANNEL_LAYER env var):
+#   local - in-process, single worker (default)
+#   unix  - several workers on one host, via a Unix socket hub
+#   redis - multi-node, requires channels_redis and a Redis server
+CHANNEL_LAYER = os.getenv("CHANNEL_LAYER", "local")
+_CHANNEL_LAYER_OPTIONS = {
+    "local": {
+        "BACKEND": "api.utils.channel_layers.LocalChannelLayer",
+    },
+    "unix": {
+        "BACKEND": "api.utils.channel_layers.UnixSocketChannelLayer",
+        "CONFIG": {"path": os.getenv("CHANNEL_LAYER_SOCKET", "/tmp/depressoassist-channels.sock")},
+    },
+    "redis": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+        "CONFIG": {"hosts": [os.getenv("REDIS_URL", "redis://127.0.0.1:6379")]},
     },
-}
\ No newline at end of file
+}
+if CHANNEL_LAYER not in _CHANNEL_LAYER_OPTIONS:
+    raise ImproperlyConfigured(
+        f"Unknown CHANNEL_LAYER {CHANNEL_LAYER!r}; choose one of: {', '.join(_CHANNEL_LAYER_OPTIONS)}"
+    )
+CHANNEL_LAYERS = {"default": _CHANNEL_LAYER_OPTIONS[CHANNEL_LAYER]}
+
+# Webcam emotion streaming over ws/emotion/
+EMOTION_STREAM = {
+    "MAX_FPS": 5,                          # analysis rate cap per connection
+    "PUSH_INTERVAL_MS": 500,               # default analysis_result cadence (?interval_ms=)
+    "SMOOTHING_ALPHA": 0.4,                # EMA weight of the newest frame (?alpha=)
+    "MAX_FRAME_BYTES": 2 * 1024 * 1024,
+    "WORKERS": 2,                          # inference threads shared by all streams
+}
+
+# LLM backend (api/utils/gemma_runtime.py): "gemini", "local" (offline CPU
+# model with continuous batching, see api/utils/local_llm.py) or "auto"
+# (Gemini when GEMINI_API_KEY is set, else the local model if configured)
+LLM = {
+    "BACKEND": os.getenv("LLM_BACKEND", "auto"),
+    "LOCAL_MODEL_PATH": os.getenv("LOCAL_LLM_PATH", ""),   # Hugging Face checkpoint directory or hub id
+    "QUANTIZE": True,                      # dynamic int8 quantization of Linear layers
+    "THREADS": int(os.getenv("LOCAL_LLM_THREADS", "0")),   # torch CPU threads, 0 = default
+    "MAX_BATCH": 8,                        # sequences decoded together per step
+    "MAX_WAIT_MS": 10,                     # idle engine waits this long to gather a burst
+    "MAX_NEW_TOKENS": 256,
+}
+
+# Server-side chat context (api/utils/conversation.py). Token counts are
+# estimates (~4 characters per token).
+CHAT_CONTEXT = {
+    "WINDOW_TURNS": 12,                    # recent turns kept verbatim...
+    "WINDOW_TOKENS": 1200,                 # ...within this many tokens; older ones get summarized
+    "PROMPT_TOKENS": 1800,                 # budget for the whole chat prompt
+    "SUMMARY_TOKENS": 250,
+    "MESSAGE_TOKENS": 600,                 # longer user messages are truncated in the prompt
+    "MAX_SESSIONS": 2000,                  # in-memory sessions per worker (LRU)
+}
+
+# Local chat intent routing (api/utils/intent_router.py): routine intents at
+# or above MIN_CONFIDENCE are answered without the LLM
+CHAT_INTENTS = {
+    "MIN_CONFIDENCE": 0.6,
+}
+
+# orjson rendering with NumPy support; ?compact=1 for compact payloads
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.utils.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Worker memory (api/utils/memory.py): past MAX_RSS_MB or MAX_REQUESTS a worker
+# stops taking requests (503 + Retry-After), finishes in-flight ones and exits
+# via SIGTERM for the process manager to restart it. 0 disables a limit.
+MEMORY = {
+    "MAX_RSS_MB": int(os.getenv("WORKER_MAX_RSS_MB", "0")),
+    "MAX_REQUESTS": int(os.getenv("WORKER_MAX_REQUESTS", "0")),
+    "DRAIN_TIMEOUT_S": 30,
+}
+
+# Opt-in request profiling (api/utils/profiling.py): send `X-Profile: <TOKEN>`
+# (or `X-Profile: 1` as a staff user), or profile a random SAMPLE_RATE share
+PROFILING = {
+    "TOKEN": os.getenv("PROFILING_TOKEN", ""),
+    "SAMPLE_RATE": float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+    "MODE": "sampler",                     # or "cprofile"; X-Profile-Mode overrides
+    "SAMPLE_INTERVAL_MS": 5,
+    "DIR": os.getenv("PROFILING_DIR", "/tmp/depressoassist-profiles"),
+    "MAX_CAPTURES": 50,                    # ring buffer size, oldest deleted first
+}
+
+# Video analysis: sampled frames whose dHash is within THRESHOLD of the last
+# analyzed frame (out of HASH_SIZE**2 bits) reuse its emotion scores
+FRAME_DEDUP = {
+    "ENABLED": True,
+    "THRESHOLD": 5,
+    "HASH_SIZE": 8,
+}
+
+# Face-presence pre-filter (api/utils/frame_filters.py FaceGate): a Haar
+# cascade on a copy downscaled to MAX_SIDE rejects images/frames without a
+# face before the emotion model; such uploads return status "no_face"
+FACE_GATE = {
+    "ENABLED": True,
+    "MAX_SIDE": 320,
+    "MIN_NEIGHBORS": 4,
+    "MIN_SIZE": 24,                        # smallest face on the downscaled copy (px)
+}
+
+# Group photos (faces=all on /api/analysis/image/, api/utils/multi_face.py):
+# every face is scored in one batch and combined by AGGREGATE
+# ("mean", "area" = weighted by face size, "largest"; ?aggregate= overrides)
+MULTI_FACE = {
+    "MAX_FACES": 8,                        # largest faces kept
+    "DETECT_MAX_SIDE": 640,                # group photos need more pixels per face
+    "MARGIN": 0.1,                         # crop padding, fraction of the face box
+    "AGGREGATE": "area",
+}
+
+# Remedy retrieval (api/utils/remedies.py): BM25 over remedies.json built at
+# startup, or a prebuilt index (python -m api.utils.build_remedy_index)
+REMEDIES = {
+    "PATH": os.path.join(BASE_DIR, "api", "utils", "remedies.json"),
+    "INDEX_PATH": os.path.join(BASE_DIR, "api", "models", "remedy_index.npz"),
+    "TOP_K": 5,
+    "K1": 1.2,
+    "B": 0.75,
+}
+
+# Two-phase uploads (advice=async): advice generated on WORKERS background
+# threads, pollable for TICKET_TTL seconds via /api/advice/<ticket>
+ADVICE = {
+    "WORKERS": 4,
+    "MAX_PENDING": 32,                     # queued tickets beyond the workers; more get FALLBACK_ADVICE
+    "TICKET_TTL": 600,
+}
+
+# Multimodal /api/assess/: text and media branches run on this many threads
+ASSESSMENT = {
+    "WORKERS": 4,
+}
+
+# Admission control for expensive endpoints (api/utils/admission.py), per worker.
+# Lower priority number wins free slots; RESERVED slots are kept for priority 0.
+ADMISSION = {
+    "CAPACITY": 6,
+    "RESERVED": 1,
+    "CLASSES": {
+        # deadline_s: execution deadline once admitted; work stops at the next check
+        "chat":   {"priority": 0, "max_concurrent": 6, "max_queue": 32, "max_wait_s": 5.0, "service_ms": 1500, "deadline_s": 30},
+        "image":  {"priority": 1, "max_concurrent": 4, "max_queue": 16, "max_wait_s": 10.0, "service_ms": 2000, "deadline_s": 45},
+        "assess": {"priority": 1, "max_concurrent": 3, "max_queue": 8, "max_wait_s": 10.0, "service_ms": 3000, "deadline_s": 60},
+        "video":  {"priority": 2, "max_concurrent": 2, "max_queue": 4, "max_wait_s": 20.0, "service_ms": 15000, "deadline_s": 180},
+    },
+}
+
+# Coalescing of identical in-flight analyses/generations (api/utils/singleflight.py).
+# CROSS_PROCESS also coalesces across workers on one host through lock files.
+SINGLEFLIGHT = {
+    "CROSS_PROCESS": os.getenv("SINGLEFLIGHT_CROSS_PROCESS", "0") == "1",
+    "LOCK_DIR": os.getenv("SINGLEFLIGHT_DIR", str(BASE_DIR / "run" / "singleflight")),  # private (0700)
+    "RESULT_TTL": 5,                       # seconds a finished result stays visible to other workers
+    "WAIT_SLICE": 0.05,                    # followers check for cancellation this often (seconds)
+    "MAX_WAIT": 60,                        # then stop waiting on a stuck leader and run the call themselves
+}
+
+# Versioned model artifacts (api/utils/model_registry.py); new versions are
+# picked up by a background watcher without restarting workers
+MODEL_REGISTRY = {
+    "ROOT": BASE_DIR / "api" / "models",
+    "POLL_INTERVAL": 10,                   # seconds; 0 disables hot reload
+}
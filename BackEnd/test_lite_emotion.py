@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test script for the lightweight NumPy emotion model
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from api.utils.lite_emotion import EMOTION_KEYS, LiteEmotionModel
+
+def make_model(size=24):
+    """Build a model with random weights for testing"""
+    rng = np.random.default_rng(0)
+    dim = size * size
+    return LiteEmotionModel(
+        rng.normal(size=(dim, len(EMOTION_KEYS))) * 0.01,
+        rng.normal(size=len(EMOTION_KEYS)),
+        np.zeros(dim), np.ones(dim), size,
+    )
+
+def test_lite_emotion():
+    """Test batch inference and weight round-tripping"""
+    print("🧪 Testing LiteEmotionModel...")
+
+    try:
+        model = make_model()
+        frames = [np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8) for _ in range(64)]
+
+        start = time.perf_counter()
+        probs = model.predict_images(frames)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"✅ Batch of {len(frames)} frames in {elapsed_ms:.1f} ms")
+
+        assert probs.shape == (64, len(EMOTION_KEYS))
+        assert np.allclose(probs.sum(axis=1), 1.0, atol=1e-4)
+
+        # Batched and single-frame inference must agree
+        single = model.predict_images(frames[:1])[0]
+        assert np.allclose(single, probs[0], atol=1e-5)
+        print(f"✅ Single frame emotions: {model.to_dict(single)}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "lite_emotion.npz")
+            model.save(path)
+            loaded = LiteEmotionModel.load(path)
+            assert np.allclose(loaded.predict_images(frames[:4]), probs[:4], atol=1e-5)
+        print("✅ Weights round-trip through .npz")
+
+        print("\n🎉 All tests passed! The lite emotion model is working.")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    success = test_lite_emotion()
+    sys.exit(0 if success else 1)
@@ -33,6 +33,7 @@ export const API_ENDPOINTS = {
     UPLOAD_VIDEO: '/analysis/video/',
     GET_RESULTS: '/analysis/results',
     BATCH_ANALYSIS: '/analysis/batch',
+    ASSESS: '/assess/',
   },
   
   // AI Chat (Gemma2B)